@@ -0,0 +1,61 @@
+"""Per-field timing of ``extractFields2`` on a synthetic (or real) 2005-present weekly file.
+
+Reports the time spent collecting elements (``find_elements2``) and in each field's extractor, so
+it is clear which columns dominate extraction. Usage (from the repository root)::
+
+    python benchmarks/bench_extract2.py --patents 2000 --claims 60
+    python benchmarks/bench_extract2.py --input ipg150106.xml
+"""
+import argparse, time
+from io import BytesIO
+from lxml import etree
+
+from patentpy.convert_xml2 import split_documents, find_elements2, FIELDS2
+from synthetic import make_xml2
+
+
+def parse_all(f):
+    # same document handling as `xml2_to_df()`
+    parsed = []
+    for document in split_documents(f):
+        doctype_end = document.find(b'\n', document.find(b'\n') + 1) + 1
+        parsed.append(etree.fromstring(document[doctype_end:], etree.XMLParser()))
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--input", help = "weekly XML file to use instead of synthetic data")
+    parser.add_argument("--patents", type = int, default = 2000, help = "patents in the synthetic file")
+    parser.add_argument("--claims", type = int, default = 20, help = "claims per synthetic patent")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, "rb") as f:
+            documents = parse_all(f)
+    else:
+        documents = parse_all(BytesIO(make_xml2(args.patents, n_claims = args.claims)))
+
+    timings = {"(find_elements2)": 0.0}
+    timings.update((name, 0.0) for name, _ in FIELDS2)
+    for parsed in documents:
+        start = time.perf_counter()
+        found = find_elements2(parsed)
+        timings["(find_elements2)"] += time.perf_counter() - start
+        for name, extractor in FIELDS2:
+            start = time.perf_counter()
+            try:
+                extractor(parsed, found)
+            except Exception:
+                pass            # skipped documents, as in `extractFields2()`
+            timings[name] += time.perf_counter() - start
+
+    total = sum(timings.values())
+    print("{} documents, {:.3f} s total, {:.0f} us/document".format(
+        len(documents), total, 1e6 * total / max(len(documents), 1)))
+    for name, seconds in sorted(timings.items(), key = lambda item: -item[1]):
+        print("{:>18}: {:7.3f} s  {:5.1f}%".format(name, seconds, 100 * seconds / total))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Throughput and memory benchmarks of all converters on synthetic weekly files.
+
+Times ``txt_to_df``, both ``xml1_to_df`` engines and both ``xml2_to_df`` engines on generated weeks,
+and ``convert_to_df`` end to end (fetching, checking, unzipping and converting) from a local
+``file://`` mirror. Every case runs in a fresh process, so its peak RSS is its own. Reports
+patents/s, MB/s (of uncompressed input) and peak RSS (in total and above the RSS of the process
+before the first run); results can be saved as JSON and compared
+with a saved baseline, failing if any case got slower. Usage (from the repository root, with
+patentpy installed)::
+
+    python benchmarks/bench_suite.py --patents 2000 --repeat 3 --save baseline.json
+    python benchmarks/bench_suite.py --patents 2000 --repeat 3 --compare baseline.json
+"""
+import argparse, glob, json, multiprocessing, os, resource, sys, tempfile, time, zipfile
+
+from concurrent.futures import ProcessPoolExecutor
+
+from synthetic import GENERATORS, write_mirror
+
+# name: (synthetic format, converter)
+CASES = {
+    "txt_to_df":            ("txt", "txt"),
+    "xml1_to_df[native]":   ("xml1", "xml1-native"),
+    "xml1_to_df[python]":   ("xml1", "xml1-python"),
+    "xml2_to_df[split]":    ("xml2", "xml2-split"),
+    "xml2_to_df[feed]":     ("xml2", "xml2-feed"),
+    "convert_to_df":        ("mirror", "convert_to_df"),
+}
+
+# one week in each format
+MIRROR_DATES = [(1996, 1), (2003, 2), (2015, 1)]
+
+
+def reset_peak_rss():
+    # Linux only: resets VmHWM to the current RSS (ru_maxrss can not be reset)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    # VmHWM where available, as ru_maxrss is carried over from the parent process on Linux
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / (1 << 10)
+    except OSError:
+        pass
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def converter(name):
+    # returns function(input, output file) -> number of patents
+    if name == "txt":
+        from convert_funcs import txt_to_df
+        return lambda input_file, output_file: txt_to_df(input_file, output_file, False, True)
+    if name.startswith("xml1"):
+        from patentpy.convert_xml1 import xml1_to_df
+        return lambda input_file, output_file: xml1_to_df(input_file, output_file, False, True,
+                                                          engine = name.split("-")[1])
+    if name.startswith("xml2"):
+        from patentpy.convert_xml2 import xml2_to_df
+        return lambda input_file, output_file: xml2_to_df(input_file, output_file, False, True,
+                                                          engine = name.split("-")[1])
+
+    import pandas as pd
+    from patentpy.acquire import convert_to_df
+    from patentpy.cache import ArchiveCache
+
+    def run(mirror, output_file):
+        # fresh cache every run, so zips are fetched from the mirror each time; the temporary CSV
+        # file is written next to `output_file`
+        os.chdir(os.path.dirname(output_file))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ArchiveCache(cache_dir, base_url = "file://" + os.path.abspath(mirror))
+            return len(convert_to_df(pd.DataFrame(MIRROR_DATES, columns = ["year", "week"]), cache = cache))
+    return run
+
+
+def run_case(name, input_file, output_file, repeat):
+    """Runs a case `repeat` times in this process; returns best seconds, patents and RSS figures."""
+    convert = converter(name)
+    reset_peak_rss()
+    base_rss = peak_rss_mb()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = convert(input_file, output_file)
+        best = min(best, time.perf_counter() - start)
+    return best, count, base_rss, peak_rss_mb()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--patents", type = int, default = 2000, help = "patents in each synthetic week")
+    parser.add_argument("--claims", type = int, default = 15, help = "claims per patent")
+    parser.add_argument("--citations", type = int, default = 10, help = "citations per patent")
+    parser.add_argument("--repeat", type = int, default = 3, help = "runs per case, best is reported")
+    parser.add_argument("--cases", nargs = "+", choices = list(CASES), default = list(CASES), help = "cases to run")
+    parser.add_argument("--save", help = "write results to this JSON file")
+    parser.add_argument("--compare", help = "JSON file of earlier results to compare with")
+    parser.add_argument("--tolerance", type = float, default = 0.2,
+                        help = "fail if patents/s dropped by more than this fraction of the baseline")
+    args = parser.parse_args()
+    size = dict(n_claims = args.claims, n_citations = args.citations)
+
+    # every case in its own interpreter, so that peak RSS is not carried over between cases
+    os.environ["TQDM_DISABLE"] = "1"
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = {}
+        for name in args.cases:
+            kind = CASES[name][0]
+            if kind in inputs:
+                continue
+            if kind == "mirror":
+                inputs[kind] = write_mirror(os.path.join(tmp, "mirror"), MIRROR_DATES, args.patents, **size)
+                size_mb = sum(info.file_size for zip_path in glob.glob(os.path.join(inputs[kind], "*", "*.zip"))
+                              for info in zipfile.ZipFile(zip_path).infolist()) / 1e6
+            else:
+                inputs[kind] = os.path.join(tmp, "week." + kind)
+                with open(inputs[kind], "wb") as f:
+                    f.write(GENERATORS[kind](args.patents, **size))
+                size_mb = os.path.getsize(inputs[kind]) / 1e6
+            inputs[kind + "-mb"] = size_mb
+
+        print("{:<20} {:>8} {:>8} {:>8} {:>11} {:>8} {:>13} {:>9}".format(
+            "case", "patents", "MB", "s", "patents/s", "MB/s", "peak RSS MB", "(of run)"))
+        for name in args.cases:
+            kind, convert = CASES[name]
+            with ProcessPoolExecutor(max_workers = 1, mp_context = context) as executor:
+                seconds, count, base_rss, rss = executor.submit(run_case, convert, inputs[kind],
+                                                                os.path.join(tmp, "out.csv"), args.repeat).result()
+            size_mb = inputs[kind + "-mb"]
+            results[name] = {"patents": count, "mb": size_mb, "seconds": seconds, "patents_per_s": count / seconds,
+                             "mb_per_s": size_mb / seconds, "peak_rss_mb": rss, "base_rss_mb": base_rss}
+            print("{:<20} {:>8} {:>8.1f} {:>8.3f} {:>11.0f} {:>8.1f} {:>13.1f} {:>9.1f}".format(
+                name, count, size_mb, seconds, count / seconds, size_mb / seconds, rss, rss - base_rss))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent = 2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = [name for name in results if name in baseline and
+                       results[name]["patents_per_s"] < (1 - args.tolerance) * baseline[name]["patents_per_s"]]
+        for name in results:
+            if name in baseline:
+                print("{:<20} {:+7.1%} patents/s, {:+7.1%} peak RSS{}".format(
+                    name, results[name]["patents_per_s"] / baseline[name]["patents_per_s"] - 1,
+                    results[name]["peak_rss_mb"] / baseline[name]["peak_rss_mb"] - 1,
+                    "  REGRESSION" if name in regressions else ""))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+// microbenchmark of the C++ TXT (1976-2001) converter, without Python overhead
+//
+// usage: bench_txt INPUT.txt [REPEAT] [OUTPUT.csv]
+// (or `make -C benchmarks bench-txt` to generate a synthetic week and run it)
+
+#include <chrono>
+#include <cstdlib>
+#include <fstream>
+#include <iostream>
+#include <string>
+
+#include "../src/convert_funcs.hpp"
+
+int main(int argc, char **argv)
+{
+    if (argc < 2)
+    {
+        std::cerr << "usage: " << argv[0] << " INPUT.txt [REPEAT] [OUTPUT.csv]\n";
+        return 1;
+    }
+    std::string input_file = argv[1],
+                output_file = argc > 3 ? argv[3] : input_file + ".csv";
+    int repeat = argc > 2 ? std::atoi(argv[2]) : 5;
+
+    std::ifstream fin(input_file, std::ios::binary | std::ios::ate);
+    double sizeMB = fin.tellg() / 1e6;
+    fin.close();
+
+    // best of `repeat` runs
+    double best = 1e30;
+    int countPat = 0;
+    for (int i = 0; i < repeat; i++)
+    {
+        auto start = std::chrono::steady_clock::now();
+        countPat = txt_to_df_cpp(input_file, output_file, false, true);
+        std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - start;
+        if (elapsed.count() < best) best = elapsed.count();
+    }
+
+    std::cout << countPat << " patents, " << sizeMB << " MB: " << best << " s, "
+              << countPat / best << " patents/s, " << sizeMB / best << " MB/s\n";
+    return 0;
+}
@@ -0,0 +1,48 @@
+"""Compares the ``split`` and ``feed`` engines of ``xml2_to_df`` on a synthetic weekly file.
+
+Usage (from the repository root, with patentpy installed)::
+
+    python benchmarks/bench_xml2.py --patents 2000 --repeat 3
+"""
+import argparse, os, tempfile, time
+
+from patentpy.convert_xml2 import xml2_to_df
+from synthetic import make_xml2
+
+
+def time_engine(engine, input_file, output_file, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = xml2_to_df(input_file, output_file, False, True, engine = engine)
+        best = min(best, time.perf_counter() - start)
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--patents", type = int, default = 2000, help = "patents in the synthetic file")
+    parser.add_argument("--claims", type = int, default = 20, help = "claims per patent")
+    parser.add_argument("--repeat", type = int, default = 3, help = "runs per engine, best is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, "ipg150106.xml")
+        with open(input_file, "wb") as f:
+            f.write(make_xml2(args.patents, n_claims = args.claims))
+        size_mb = os.path.getsize(input_file) / 1e6
+        print("{} patents, {:.1f} MB".format(args.patents, size_mb))
+
+        outputs = {}
+        for engine in ("feed", "split"):
+            output_file = os.path.join(tmp, engine + ".csv")
+            seconds, count = time_engine(engine, input_file, output_file, args.repeat)
+            with open(output_file, "rb") as f:
+                outputs[engine] = f.read()
+            print("{:>6}: {:.3f} s  {:8.0f} patents/s  {:6.1f} MB/s".format(
+                engine, seconds, count / seconds, size_mb / seconds))
+        print("identical output: {}".format(outputs["feed"] == outputs["split"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+"""Generators for synthetic USPTO weekly files, used by the benchmarks.
+
+Records are laid out like the real bulk files (one element or tag per line, a dozen or so citations
+and claims per patent) so that parser timings are representative. Sizes are tuned with the number of
+patents and claims per patent. ``write_mirror()`` zips weeks into a local mirror of the USPTO site.
+
+Run as a script to write a file, e.g. ``python benchmarks/synthetic.py txt 2500 pftaps19960102_wk01.txt``.
+"""
+import os, random, sys, textwrap, zipfile
+
+from patentpy.utility import get_file_name
+
+XML2_HEAD = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE us-patent-grant SYSTEM "us-patent-grant-v45-2014-04-03.dtd" [ ]>
+<us-patent-grant lang="EN" dtd-version="v4.5 2014-04-03" file="US{wku}-20150106.XML" status="PRODUCTION" id="us-patent-grant" country="US" date-produced="20141223" date-publ="20150106">
+<us-bibliographic-data-grant>
+<publication-reference>
+<document-id>
+<country>US</country>
+<doc-number>{wku}</doc-number>
+<kind>B2</kind>
+<date>20150106</date>
+</document-id>
+</publication-reference>
+<application-reference appl-type="utility">
+<document-id>
+<country>US</country>
+<doc-number>{appl}</doc-number>
+<date>2012{month:02d}{day:02d}</date>
+</document-id>
+</application-reference>
+<classifications-ipcr>
+<classification-ipcr>
+<ipc-version-indicator><date>20060101</date></ipc-version-indicator>
+<classification-level>A</classification-level>
+<section>{section}</section>
+<class>{klass:02d}</class>
+<subclass>L</subclass>
+<symbol-position>F</symbol-position>
+<classification-value>I</classification-value>
+<main-group>{group}</main-group>
+<subgroup>{subgroup:02d}</subgroup>
+</classification-ipcr>
+</classifications-ipcr>
+<invention-title id="d2e53">{title}</invention-title>
+<us-references-cited>
+"""
+
+XML2_CITATION = """<us-citation>
+<patcit num="{num:05d}">
+<document-id>
+<country>{country}</country>
+<doc-number>{doc}</doc-number>
+<kind>A</kind>
+<name>{name}</name>
+<date>19990101</date>
+</document-id>
+</patcit>
+<category>cited by examiner</category>
+</us-citation>
+"""
+
+XML2_PARTIES = """</us-references-cited>
+<number-of-claims>{n_claims}</number-of-claims>
+<us-parties>
+<us-applicants>
+<us-applicant sequence="001" app-type="applicant" designation="us-only">
+<addressbook>
+<orgname>{assignee}</orgname>
+<address><city>Armonk</city><state>NY</state><country>US</country></address>
+</addressbook>
+</us-applicant>
+</us-applicants>
+<inventors>
+{inventors}</inventors>
+</us-parties>
+<assignees>
+<assignee>
+<addressbook>
+<orgname>{assignee}</orgname>
+<role>02</role>
+<address><city>Armonk</city><state>NY</state><country>US</country></address>
+</addressbook>
+</assignee>
+</assignees>
+</us-bibliographic-data-grant>
+<abstract id="abstract">
+<p id="p-0001" num="0000">{abstract}</p>
+</abstract>
+<description id="description">
+<p id="p-0002" num="0001">{abstract}</p>
+<p id="p-0003" num="0002">{abstract}</p>
+</description>
+<us-claim-statement>What is claimed is:</us-claim-statement>
+<claims id="claims">
+"""
+
+XML2_INVENTOR = """<inventor sequence="{seq:03d}" designation="us-only">
+<addressbook>
+<last-name>{last}</last-name>
+<first-name>{first}</first-name>
+<address><city>Austin</city><state>TX</state><country>US</country></address>
+</addressbook>
+</inventor>
+"""
+
+XML2_CLAIM = """<claim id="CLM-{num:05d}" num="{num:05d}">
+<claim-text>{num}. The method of <claim-ref idref="CLM-00001">claim 1</claim-ref>, wherein {text}
+<claim-text>a first step of {text};</claim-text>
+<claim-text>a second step of {text}.</claim-text>
+</claim-text>
+</claim>
+"""
+
+XML2_TAIL = """</claims>
+</us-patent-grant>
+"""
+
+WORDS = ("network packet signal device receiver circuit memory controller layer compound protein "
+         "sequence vehicle module interface substrate wireless optical method system").split()
+NAMES = "Smith Jones Garcia Chen Kumar Nguyen Mueller Rossi Tanaka Silva".split()
+
+
+def _text(rng, n_words):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def make_xml2(n_patents, n_claims = 20, n_citations = 15, seed = 0):
+    """Returns a synthetic 2005-present weekly file (concatenated ``us-patent-grant`` XML) as bytes."""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_patents):
+        wku = "{:08d}".format(8925000 + i)
+        doc = [XML2_HEAD.format(wku = wku, appl = "{:08d}".format(13000000 + i), month = 1 + i % 12,
+                                day = 1 + i % 28, section = rng.choice("ABCDGH"), klass = rng.randint(1, 99),
+                                group = rng.randint(1, 99), subgroup = rng.randint(0, 99),
+                                title = _text(rng, 8))]
+        for j in range(n_citations):
+            doc.append(XML2_CITATION.format(num = j + 1, country = "US" if j % 4 else "JP",
+                                            doc = "{:07d}".format(rng.randint(3930000, 8900000)),
+                                            name = rng.choice(NAMES)))
+        inventors = "".join(XML2_INVENTOR.format(seq = k + 1, last = rng.choice(NAMES), first = rng.choice(NAMES))
+                            for k in range(3))
+        doc.append(XML2_PARTIES.format(n_claims = n_claims, assignee = "{} Corp".format(rng.choice(NAMES)),
+                                       inventors = inventors, abstract = _text(rng, 120)))
+        for j in range(n_claims):
+            doc.append(XML2_CLAIM.format(num = j + 1, text = _text(rng, 25)))
+        doc.append(XML2_TAIL)
+        docs.append("".join(doc))
+    return "".join(docs).encode("utf-8")
+
+
+XML1_HEAD = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE PATDOC SYSTEM "ST32-US-Grant-025xml.dtd" [
+<!ENTITY US{wku}-20030107-D00000.TIF SYSTEM "US{wku}-20030107-D00000.TIF" NDATA TIF>
+]>
+<PATDOC DTD="2.5" STATUS="Build 20021230">
+<SDOBI>
+<B100>
+<B110><DNUM><PDAT>{wku}</PDAT></DNUM></B110>
+<B130><PDAT>B2</PDAT></B130>
+<B140><DATE><PDAT>20030107</PDAT></DATE></B140>
+<B190><PDAT>US</PDAT></B190>
+</B100>
+<B200>
+<B210><DNUM><PDAT>{appl}</PDAT></DNUM></B210>
+<B211US><PDAT>utility</PDAT></B211US>
+<B220><DATE><PDAT>2001{month:02d}{day:02d}</PDAT></DATE></B220>
+</B200>
+<B500>
+<B510>
+<B511><PDAT>{section}{klass:02d}L {group:2d}{subgroup:02d}</PDAT></B511>
+<B512><PDAT>{section}{klass:02d}M {group:2d}00</PDAT></B512>
+<B516><PDAT>7</PDAT></B516>
+</B510>
+<B540><STEXT><PDAT>{title}</PDAT></STEXT></B540>
+<B560>
+"""
+
+XML1_CITATION = """<B561>
+<PCIT>
+<DOC><DNUM><PDAT>{doc}</PDAT></DNUM>
+<DATE><PDAT>19990100</PDAT></DATE>
+<KIND><PDAT>A</PDAT></KIND>{country}
+</DOC>
+<PARTY-US>
+<NAM><SNM><STEXT><PDAT>{name}</PDAT></STEXT></SNM></NAM>
+</PARTY-US>
+<PIC><PDAT>370 352</PDAT></PIC>
+</PCIT>
+<CITED-BY-EXAMINER/>
+</B561>
+"""
+
+XML1_PARTIES = """</B560>
+<B570><B577><PDAT>{n_claims}</PDAT></B577><B578US><PDAT>1</PDAT></B578US></B570>
+</B500>
+<B700>
+<B720>
+{inventors}</B720>
+<B730>
+<B731>
+<PARTY-US>
+<NAM><ONM><STEXT><PDAT>{assignee} Corporation</PDAT></STEXT></ONM></NAM>
+<ADR><CITY><PDAT>Armonk</PDAT></CITY><STATE><PDAT>NY</PDAT></STATE></ADR>
+</PARTY-US>
+</B731>
+<B732US><PDAT>02</PDAT></B732US>
+</B730>
+</B700>
+</SDOBI>
+<SDOAB>
+<BTEXT>
+<PARA ID="P-00001" LVL="0"><PTEXT><PDAT>{abstract}</PDAT></PTEXT></PARA>
+</BTEXT>
+</SDOAB>
+<SDODE>
+<BRFSUM>
+<H LVL="1"><STEXT><PDAT>BACKGROUND OF THE INVENTION</PDAT></STEXT></H>
+"""
+
+XML1_INVENTOR = """<B721>
+<PARTY-US>
+<NAM>
+<FNM><PDAT>{first}</PDAT></FNM>
+<SNM><STEXT><PDAT>{last}</PDAT></STEXT></SNM>
+</NAM>
+<ADR><CITY><PDAT>Austin</PDAT></CITY><STATE><PDAT>TX</PDAT></STATE></ADR>
+</PARTY-US>
+</B721>
+"""
+
+XML1_PARAGRAPH = """<PARA ID="P-{num:05d}" LVL="0"><PTEXT><PDAT>{text} &amp; {text}</PDAT></PTEXT></PARA>
+"""
+
+XML1_CLAIMS = """</BRFSUM>
+</SDODE>
+<SDOCL>
+<H><STEXT><PDAT>What is claimed is:</PDAT></STEXT></H>
+<CL>
+"""
+
+XML1_CLAIM = """<CLM ID="CLM-{num:05d}">
+<PARA ID="P-{para:05d}" LVL="0"><PTEXT><PDAT>{num}. The method of </PDAT><CLREF ID="CLM-00001"><PDAT>claim 1</PDAT></CLREF><PDAT>, wherein {text}</PDAT></PTEXT></PARA>
+</CLM>
+"""
+
+XML1_TAIL = """</CL>
+</SDOCL>
+</PATDOC>
+"""
+
+
+def make_xml1(n_patents, n_claims = 15, n_citations = 10, n_paragraphs = 30, seed = 0):
+    """Returns a synthetic 2002-2004 weekly file (concatenated ``PATDOC`` XML) as bytes."""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_patents):
+        doc = [XML1_HEAD.format(wku = "{:08d}".format(6500000 + i), appl = "{:08d}".format(9700000 + i),
+                                month = 1 + i % 12, day = 1 + i % 28, section = rng.choice("ABCDGH"),
+                                klass = rng.randint(1, 99), group = rng.randint(1, 99),
+                                subgroup = rng.randint(0, 99), title = _text(rng, 8).capitalize())]
+        for j in range(n_citations):
+            doc.append(XML1_CITATION.format(doc = rng.randint(3930000, 6500000), name = rng.choice(NAMES),
+                                            country = "" if j % 4 else "\n<CTRY><PDAT>JP</PDAT></CTRY>"))
+        inventors = "".join(XML1_INVENTOR.format(last = rng.choice(NAMES), first = rng.choice(NAMES))
+                            for _ in range(3))
+        doc.append(XML1_PARTIES.format(n_claims = n_claims, assignee = rng.choice(NAMES), inventors = inventors,
+                                       abstract = _text(rng, 120)))
+        doc.extend(XML1_PARAGRAPH.format(num = j + 2, text = _text(rng, 45)) for j in range(n_paragraphs))
+        doc.append(XML1_CLAIMS)
+        doc.extend(XML1_CLAIM.format(num = j + 1, para = n_paragraphs + j + 2, text = _text(rng, 40))
+                   for j in range(n_claims))
+        doc.append(XML1_TAIL)
+        docs.append("".join(doc))
+    return "".join(docs).encode("utf-8")
+
+
+TXT_PATENT = """PATN
+WKU  0{wku}{check}
+SRC  8
+APN  {apn}
+APT  1
+ART  {art}
+APD  1994{month:02d}{day:02d}
+TTL  {title}
+ISD  19960102
+NCL  {n_claims}
+ECL  1
+EXP  {examiner}; Patrick J.
+NDR  2
+NFG  3
+"""
+
+TXT_INVENTOR = """INVT
+NAM  {last}; {first} A.
+STR  {number} Main St.
+CTY  Springfield
+STA  IL
+ZIP  62701
+"""
+
+TXT_ASSIGNEE = """ASSG
+NAM  {name} Corporation
+CTY  Armonk
+STA  NY
+COD  02
+CLAS
+OCL  {klass}{sub:3d}
+XCL  {klass}192
+EDF  6
+ICL  {section}{icl:02d}B 1710
+ICL  {section}{icl:02d}C  700
+FSC  {klass}
+FSS  38;192;426
+"""
+
+TXT_CITATION = """UREF
+PNO  {pno}
+ISD  19{year:02d}0{month}00
+NAM  {name}
+OCL  {klass} 38
+"""
+
+
+def _wrap_txt(tag, text):
+    # APS paragraphs are wrapped at 80 columns with 5-space continuation lines
+    return "\n".join(textwrap.wrap(text, 75, initial_indent = "{:<5}".format(tag), subsequent_indent = " " * 5)) + "\n"
+
+
+def make_txt(n_patents, n_claims = 15, n_citations = 10, n_paragraphs = 30, seed = 0):
+    """Returns a synthetic 1976-2001 weekly file (APS text format) as bytes."""
+    rng = random.Random(seed)
+    lines = ["HHHHHT APSV1.2\n"]
+    for i in range(n_patents):
+        klass = rng.randint(100, 999)
+        lines.append(TXT_PATENT.format(wku = 5480000 + i, check = i % 10, apn = rng.randint(1000000, 9999999),
+                                       art = rng.randint(100, 399), month = 1 + i % 12, day = 1 + i % 28,
+                                       title = _text(rng, 8).capitalize(), n_claims = n_claims,
+                                       examiner = rng.choice(NAMES)))
+        for k in range(3):
+            lines.append(TXT_INVENTOR.format(last = rng.choice(NAMES), first = rng.choice(NAMES), number = 100 + k))
+        lines.append(TXT_ASSIGNEE.format(name = rng.choice(NAMES), klass = klass, sub = rng.randint(1, 999),
+                                         section = rng.choice("ABCDGH"), icl = rng.randint(1, 99)))
+        for j in range(n_citations):
+            lines.append(TXT_CITATION.format(pno = rng.randint(3930000, 5480000), year = rng.randint(76, 95),
+                                             month = 1 + j % 9, name = rng.choice(NAMES), klass = klass))
+        lines.append("ABST\n" + _wrap_txt("PAL", _text(rng, 120)))
+        lines.append("BSUM\nPAC  BACKGROUND OF THE INVENTION\n")
+        lines.extend(_wrap_txt("PAR", _text(rng, 90)) for _ in range(n_paragraphs // 2))
+        lines.append("DETD\n")
+        lines.extend(_wrap_txt("PAR", _text(rng, 90)) for _ in range(n_paragraphs - n_paragraphs // 2))
+        lines.append("CLMS\nSTM  What is claimed is:\n")
+        for j in range(n_claims):
+            lines.append("NUM  {}.\n".format(j + 1))
+            lines.append(_wrap_txt("PAR" if j == 0 else "PA1", "{}. The method of claim 1, wherein {}".format(
+                j + 1, _text(rng, 40))))
+    return "".join(lines).encode("latin-1")
+
+
+GENERATORS = {"txt": make_txt, "xml1": make_xml1, "xml2": make_xml2}
+
+
+def make_week(year, week, n_patents, **kwargs):
+    """Returns (file name, contents) of a synthetic week in the format USPTO used in `year`."""
+    file_name = get_file_name(year, week)
+    make = make_txt if year < 2002 else make_xml1 if year < 2005 else make_xml2
+    return file_name, make(n_patents, **kwargs)
+
+
+def write_mirror(root, dates, n_patents, **kwargs):
+    """Writes zipped synthetic weeks in the USPTO directory layout (``<year>/<file>.zip``) under `root`.
+
+    The mirror can be used in place of the USPTO site with ``ArchiveCache(..., base_url = <file:// url>)``.
+    """
+    for year, week in dates:
+        file_name, data = make_week(year, week, n_patents, **kwargs)
+        os.makedirs(os.path.join(root, str(year)), exist_ok = True)
+        with zipfile.ZipFile(os.path.join(root, str(year), file_name[:-4] + ".zip"), "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr(file_name, data)
+    return root
+
+
+if __name__ == "__main__":
+    # usage: synthetic.py {txt,xml1,xml2} N_PATENTS OUTPUT_FILE
+    make = GENERATORS[sys.argv[1]]
+    with open(sys.argv[3], "wb") as f:
+        f.write(make(int(sys.argv[2])))
@@ -1,15 +1,28 @@
-import sys, traceback, datetime
+import sys, traceback, datetime, shutil, itertools
 import pandas as pd
-from os import remove
+from os import remove, path
+from time import perf_counter
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 
 from convert_funcs import txt_to_df
-from patentpy.convert_xml1 import xml1_to_df
-from patentpy.convert_xml2 import xml2_to_df
-from patentpy.utility import get_file_name, download_zip, uncompress_zip
+from patentpy.convert_txt import iter_txt_records
+from patentpy.convert_xml1 import xml1_to_df, iter_xml1_records
+from patentpy.convert_xml2 import xml2_to_df, iter_xml2_records
+from patentpy.columnar import records_to_batch, batches_to_table, table_to_df, ParquetOutput
+from patentpy.tables import table_fields, records_to_rows, rows_to_dfs, TablesOutput
+from patentpy.database import SQLiteOutput
+from patentpy.downloader import Downloader
+from patentpy.workspace import Workspace
+from patentpy.stats import WeekStats, check_stats, timed, written, skipped_count, peak_memory
+from patentpy.utility import FIELDS, check_fields, check_filter, csv_header, plan_weeks, get_url, download_zip, uncompress_zip, fetch_zip, open_zip_member
 
 # User-facing function `get_bulk_patent_data()`
-def get_bulk_patent_data(year, week, output_file = None):
+def get_bulk_patent_data(year = None, week = None, output_file = None, workers = 1, stream = False, cache = None,
+                         output_format = "csv", prefetch = 0, downloader = None, fields = None, filter = None,
+                         stats = None, start_date = None, end_date = None, dtype_backend = None, temp_dir = None):
     """Obtains USPTO data in csv or dataframe from user-inputted values, `year` and `week`.  
     
     User-friendly function that utilizes `convert_txt_to_df` helper function after error 
@@ -22,24 +35,168 @@ def get_bulk_patent_data(year, week, output_file = None):
             pair corresponding to patent grants issued the ``week`` th week of year ``year``.
         week (int or list[int]): integer or list of integers for 'week in 'year'-'week' 
             pair corresponding to patent grants issued that ``week`` th week of year ``year``.
-        output_file (str, default None): path of '.csv' file to store data.  
+        output_file (str, default None): path of '.csv' (or '.parquet') file to store data.  
+        workers (int, default 1): number of processes used to download and convert weeks 
+            concurrently. Output is identical to a serial run (``workers = 1``).
+        stream (bool, default False): if ``True``, weeks are downloaded into memory and parsed 
+            directly from the zip file instead of being written to and extracted on disk.
+        cache (ArchiveCache, default None): ``patentpy.cache.ArchiveCache`` to serve zip files from 
+            instead of downloading them on every call.
+        output_format (str, default "csv"): ``"csv"``; ``"parquet"`` to write typed, compressed 
+            row groups (one per week) to a '.parquet' `output_file`; or ``"arrow"`` to return a 
+            ``pyarrow.Table``. Both columnar formats store dates as dates and Inventor, Assignee, 
+            ICL_Class and References as list columns, and require ``pyarrow``. ``"tables"`` gives 
+            normalized output instead: a ``patents`` table plus ``inventors``, ``assignees``, 
+            ``classifications`` and ``citations`` tables of (WKU, value) rows, see ``patentpy.tables``. 
+            ``"sqlite"`` loads these tables into the SQLite database `output_file` ('.db', '.sqlite' or 
+            '.sqlite3'), upserting on WKU so weeks can be loaded again; see ``patentpy.database``.
+        prefetch (int, default 0): number of weeks to download ahead while the current week is 
+            parsed (with ``workers = 1`` only).
+        downloader (Downloader, default None): ``patentpy.downloader.Downloader`` to download weeks 
+            through, which reuses connections, retries and resumes failed transfers and can limit 
+            bandwidth and concurrency (with ``workers = 1`` only). One with default settings is used 
+            if ``prefetch`` is set.
+        fields (list[str], default None): columns (of ``utility.FIELDS``) to convert, all if ``None``. 
+            Output holds only these columns (in ``utility.FIELDS`` order); the others are never 
+            extracted from the source files.
+        filter (dict, default None): conditions patents have to meet to be converted, e.g. 
+            ``dict(icl_prefix = "H04L", assignee_regex = "(?i)ibm", issue_date_range = ("20050101", None))``; 
+            see ``utility.PatentFilter``. They are checked while parsing, before references and claims are 
+            extracted, and rejected patents are never written.
+        stats (bool or ConvertStats, default None): if ``True`` (or a ``patentpy.stats.ConvertStats``, 
+            e.g. with a JSON-lines ``metrics_file`` or ``hooks`` to call as each week is done), timings 
+            of each week's download, unzip, parse and write stages, its bytes in and out, patents 
+            output and skipped, and peak memory are collected and returned along with the data.
+        start_date (date or str, default None): instead of `year` and `week`, get all weeks with an 
+            issue date (Tuesday) from `start_date` to `end_date`; a ``datetime.date`` or a 'YYYYMMDD' 
+            or 'YYYY-MM-DD' string. Weeks are planned with ``utility.plan_weeks()``.
+        end_date (date or str, default None): last issue date with `start_date`, today if ``None``.
+        dtype_backend (str, default None): ``"pyarrow"`` to build the DataFrame (without `output_file`) 
+            in memory from each week's parsed patents, with no temporary CSV file: dates become 
+            ``datetime64``, Assignee and ICL_Class categoricals and other text Arrow-backed strings, 
+            which takes a fraction of the memory of the default object columns read from CSV. Requires 
+            ``pyarrow``; see ``columnar.table_to_df()``.
+        temp_dir (str, default None): directory (e.g. on a fast local disk or tmpfs) in which the run 
+            creates its own temporary workspace for zip files, extracted weeks and shards, removed 
+            when the run ends; the system temporary directory if ``None``. Several runs can safely 
+            share a working directory or `temp_dir`; see ``patentpy.workspace.Workspace``.
     
     Returns:
-        DataFrame or bool: returns ``pandas.DataFrame`` object if output_file is ``None`` 
-        else returns boolean ``True``
+        DataFrame, Table, dict or bool: returns ``pandas.DataFrame`` object if output_file is ``None`` 
+        (``pyarrow.Table`` if `output_format` is ``"arrow"``, dict of table name to ``pandas.DataFrame`` 
+        if it is ``"tables"``) else returns boolean ``True``; with `stats`, a pair of this and the 
+        ``ConvertStats``
 
     Raises:
         TypeError:
             * ``year`` or ``week`` are not both integers or lists of integers
         ValueError: 
             * if ``year`` or ``week`` contain missing values or contain invalid values 
-            (i.e. week > 53, year < 1776), ``year`` or ``week`` are unequal length lists, or 
-            if `output_file` is not a '.csv' file.
+            (i.e. week > 53, year < 1776), ``year`` or ``week`` are unequal length lists, 
+            if `output_file` is not a '.csv' file (or '.parquet' file for Parquet output, ``None`` 
+            for Arrow output, a directory for normalized tables, or a database file for SQLite output), if `output_format` is unknown, if ``workers`` is not a positive integer, 
+            if ``prefetch`` is not a non-negative integer, if ``prefetch`` or ``downloader`` are 
+            given with ``workers`` greater than 1, if ``fields`` is empty or holds unknown columns, if 
+            ``filter`` holds unknown keys or bad conditions, if ``stats`` is neither a bool nor a 
+            ``ConvertStats``, if ``start_date`` or ``end_date`` are not dates, are given with ``year`` 
+            or ``week``, or ``start_date`` is after ``end_date``, or if ``dtype_backend`` is unknown or 
+            given with an `output_file` or another `output_format`, or if ``temp_dir`` is not a string.
             \n
             **Note**: An "error" will be raised if there is no patent data available for week 53  
             for a specific year or if dates are in the future for the current year, 
             however these entries will be skipped without halting execution.
     """
+    dates_df = _year_week_df(year, week, start_date, end_date)
+
+    return convert_to_df(dates_df, output_file = output_file, workers = workers, stream = stream, cache = cache,
+                         output_format = output_format, prefetch = prefetch, downloader = downloader,
+                         fields = fields, filter = filter, stats = stats, dtype_backend = dtype_backend,
+                         temp_dir = temp_dir)
+
+
+def iter_bulk_patent_data(year = None, week = None, batch_size = 1000, stream = False, cache = None, fields = None,
+                          filter = None, start_date = None, end_date = None, temp_dir = None):
+    """Generator that yields USPTO data in small batches as each `year`-`week` pair is parsed.
+
+    Takes the same `year` and `week` values as ``get_bulk_patent_data()``, but never holds more 
+    than one batch of patents in memory, so arbitrarily long date ranges can be processed. XML weeks 
+    are parsed one patent at a time, TXT weeks in chunks of a few hundred patents (see 
+    ``convert_txt.iter_txt_records()``).
+
+    Args:
+        year (int or list[int]): integer or list of integers for 'year' in 'year'-'week' pair.
+        week (int or list[int]): integer or list of integers for 'week' in 'year'-'week' pair.
+        batch_size (int, default 1000): maximum number of patents per yielded ``pandas.DataFrame``. 
+            If ``None``, single patent records are yielded instead.
+        stream (bool, default False): parse weeks straight from the in-memory zip file.
+        cache (ArchiveCache, default None): ``patentpy.cache.ArchiveCache`` to fetch zip files through.
+        fields (list[str], default None): columns (of ``utility.FIELDS``) to extract, all if ``None``.
+        filter (dict, default None): conditions patents have to meet to be yielded, see 
+            ``get_bulk_patent_data()``.
+        start_date (date or str, default None): first issue date of the weeks to get instead of `year` 
+            and `week`, see ``get_bulk_patent_data()``.
+        end_date (date or str, default None): last issue date with `start_date`, today if ``None``.
+
+    Yields:
+        DataFrame or tuple: ``pandas.DataFrame`` with the same columns as ``get_bulk_patent_data()`` 
+        (values are not type converted, so all columns hold strings), or, if `batch_size` is ``None``, 
+        one tuple per patent of the requested fields in ``utility.FIELDS`` order with Inventor, Assignee, 
+        ICL_Class and References as lists. Batches do not span weeks.
+
+    Raises:
+        TypeError, ValueError: 
+            * see ``get_bulk_patent_data()``; also if `batch_size` is not a positive integer or ``None``.
+    """
+    dates_df = _year_week_df(year, week, start_date, end_date)
+    if batch_size is not None and (not isinstance(batch_size, int) or isinstance(batch_size, bool) or batch_size < 1):
+        raise ValueError("`batch_size` parameter must be a positive integer or None; current value = {}".format(batch_size))
+    return _iter_batches(dates_df, batch_size, stream, cache, check_fields(fields), check_filter(filter),
+                         _check_temp_dir(temp_dir))
+
+
+def _iter_batches(dates_df, batch_size, stream, cache, fields = None, patent_filter = None, temp_dir = None):
+    # generator behind `iter_bulk_patent_data()`, so that arguments are checked on call; the workspace is
+    # removed once the generator is exhausted or closed
+    with Workspace(temp_dir) as workspace:
+        for row, curr_year, curr_week in tqdm(dates_df.itertuples(), total = dates_df.shape[0]):
+            with _week_file(curr_year, curr_week, workspace.week_zip(row), stream, cache) as curr_file:
+                if curr_file is None:
+                    continue
+                batch = []
+                try:
+                    for record in _iter_records(curr_year, curr_file, fields, patent_filter):
+                        if batch_size is None:
+                            yield record
+                            continue
+                        batch.append(record)
+                        if len(batch) == batch_size:
+                            yield _records_to_df(batch, fields)
+                            batch = []
+                except Exception as e:
+                    exc_type, exc_value, exc_traceback = sys.exc_info()
+                    traceback.print_exception(exc_type, exc_value, e.__traceback__)
+                    print("UNABLE TO CONVERT ALL PATENT DATA FOR WEEK {} OF YEAR {} DUE TO ABOVE EXCEPTION, SKIPPING REST...".format(curr_week, curr_year))
+                if batch:
+                    yield _records_to_df(batch, fields)
+
+
+def _records_to_df(records, fields = None):
+    # DataFrame with multi-valued fields joined as in CSV output
+    return pd.DataFrame([[";".join(value) if isinstance(value, list) else value for value in record]
+                         for record in records], columns = list(fields if fields is not None else FIELDS))
+
+
+def _year_week_df(year, week, start_date = None, end_date = None):
+    """Checks user-inputted `year` and `week` values (or `start_date` and `end_date`) and returns them 
+    as a `dates_df` DataFrame.
+
+    Internal helper for ``get_bulk_patent_data()`` and ``iter_bulk_patent_data()``; raises the 
+    errors documented there.
+    """
+    # issue date range, planned all at once
+    if start_date is not None or end_date is not None:
+        return plan_weeks(year, week, start_date, end_date)[['year', 'week']]
+
     # convert to list if int
     year = [year] if isinstance(year, int) else year
     week = [week] if isinstance(week, int) else week
@@ -72,12 +229,20 @@ def get_bulk_patent_data(year, week, output_file = None):
         raise ValueError("`week` value(s) must be between 1 and 53, inclusive")
         
     # create dataframe
-    dates_df = pd.DataFrame(data = list(zip(year, week)), columns = ['year', 'week'])
+    return pd.DataFrame(data = list(zip(year, week)), columns = ['year', 'week'])
 
-    return convert_to_df(dates_df, output_file = output_file)
 
+def _check_temp_dir(temp_dir):
+    # `temp_dir` argument of the user-facing functions
+    if temp_dir is not None and not isinstance(temp_dir, str):
+        raise ValueError("`temp_dir` parameter must be a path in the form of a string or None; current value = {}"
+                         .format(temp_dir))
+    return temp_dir
 
-def convert_to_df(dates_df, output_file = None):
+
+def convert_to_df(dates_df, output_file = None, workers = 1, stream = False, cache = None, output_format = "csv",
+                  prefetch = 0, downloader = None, fields = None, filter = None, stats = None, dtype_backend = None,
+                  temp_dir = None):
     """Converts TXT and XML files to CSV format or a dataframe.
     
     Internal Function without error checking that ``get_bulk_patent_data()`` calls. Iterates through 
@@ -85,98 +250,595 @@ def convert_to_df(dates_df, output_file = None):
     zip file from United States Patent Trademark Office (USPTO) url. Extracts each zip folder (containing a TXT 
     or XML file) and parses files (extracting fields and converting it to CSV file format). 
     If no output file is provided, a temporary csv file is created and read into pandas at the end of execution. 
-    Temporary files (zip, xml, etc.) are cleaned up.
+
+    Temporary files (zip, xml, shards, etc.) are kept in a ``Workspace`` of the run: a directory with a 
+    unique name in `temp_dir`, removed when the run ends (also on errors), so concurrent runs in one 
+    working directory do not interfere. CSV and Parquet output is written to a temporary file next to 
+    `output_file` and only renamed to (or, for an existing CSV file, appended to) `output_file` once all 
+    weeks are converted.
+
+    If ``workers`` is greater than 1, weeks are processed concurrently in a process pool. Each week is 
+    converted into its own shard file and the shards are merged in the order of `dates_df`, so the 
+    output is byte for byte the same as a serial run.
+
+    If ``stream`` is ``True``, weeks are never written to disk: the zip file is held in memory and its 
+    XML member is decompressed and parsed in a single pass (TXT members are decompressed into memory 
+    and parsed from there).
+
+    If a ``cache`` is given, zip files are fetched through it (and kept) rather than downloaded to a 
+    temporary file, and its ``base_url`` is used in place of the USPTO url.
+
+    With ``output_format = "parquet"`` or ``"arrow"`` each week is parsed into patent records and converted 
+    to a typed ``pyarrow.RecordBatch``, which is written as its own Parquet row group or collected into a 
+    ``pyarrow.Table``; no CSV is produced or re-parsed.
+
+    With ``output_format = "tables"`` the parsed records are normalized instead: the single-valued fields 
+    go to a ``patents`` table and each multi-valued field to its own table of (WKU, value) rows 
+    (``inventors``, ``assignees``, ``classifications``, ``citations``). With an `output_file` (a directory) 
+    each table is appended to '<output_file>/<table>.csv' week by week, otherwise a dict of DataFrames is 
+    returned. Lists from the parsers are written as rows directly, never joined and split again.
+    ``output_format = "sqlite"`` loads the same tables into the SQLite database `output_file`, one 
+    transaction per week, and indexes them once all weeks are loaded.
+
+    If ``prefetch`` or a ``downloader`` is given (serial runs only), zip files are downloaded on the 
+    downloader's thread pool: up to ``prefetch`` weeks after the current one are fetched while it is 
+    parsed, each week into its own temporary zip file. Weeks are still converted in `dates_df` order.
+
+    If ``fields`` is given, every engine only extracts (and writes) those columns; the others are 
+    neither searched for in the source files nor concatenated. A ``filter`` is pushed down into the 
+    engines as well: each patent is checked once its issue date, ICL classes and assignees are known, 
+    and rejected patents are skipped without extracting their remaining fields.
+
+    With ``stats``, every week is measured into a ``patentpy.stats.WeekStats`` (in the process that 
+    converts it) and added to the ``ConvertStats`` as it is done, see ``patentpy.stats``.
+
+    With ``dtype_backend = "pyarrow"`` (and no `output_file`), the DataFrame is assembled in memory instead 
+    of read back from a temporary CSV file: each week is parsed into a ``pyarrow.RecordBatch`` as for 
+    Arrow output and the batches are converted to compact dtypes once, see ``columnar.table_to_df()``.
     
     Args: 
         date_df (DataFrame): dataframe with columns: (1) 'year' and (2) 'week'. Values must all be integers. 
-        output_file (str, default None): path of '.csv' file to store data. 
+        output_file (str, default None): path of '.csv' (or '.parquet') file to store data. 
+        workers (int, default 1): number of processes used to convert weeks concurrently.
+        stream (bool, default False): parse weeks straight from the in-memory zip file.
+        cache (ArchiveCache, default None): cache to fetch zip files through.
+        output_format (str, default "csv"): ``"csv"``, ``"parquet"``, ``"arrow"``, ``"tables"`` or ``"sqlite"``.
+        prefetch (int, default 0): number of weeks to download ahead of the one being parsed.
+        downloader (Downloader, default None): downloader to fetch zip files with; a new one is 
+            created (and closed) if ``prefetch`` is set and none is given.
+        fields (list[str], default None): columns (of ``utility.FIELDS``) to convert, all if ``None``.
+        filter (dict, default None): conditions patents have to meet, see ``utility.PatentFilter``.
+        stats (bool or ConvertStats, default None): collect per-week measurements (into a new 
+            ``ConvertStats`` if ``True``) and return them with the result.
+        dtype_backend (str, default None): ``"pyarrow"`` to assemble the DataFrame in memory with compact 
+            dtypes, ``None`` to read it back from CSV.
+        temp_dir (str, default None): directory to create the run's workspace in, the system temporary 
+            directory if ``None``.
 
         **Note**: This function omits error checking for values / types in dataframe argument as its intended use
         is to be called by the ``get_bulk_patent_data()`` function
     
     Returns:
-        DataFrame or bool: returns (``pandas.DataFrame`` object if `output_file` is ``None``
-        or boolean ``True`` if `output_file` is provided) AND at least one week of data is able to be parsed 
-        and converted to CSV format
+        DataFrame, Table, dict or bool: returns (``pandas.DataFrame`` object if `output_file` is ``None``, 
+        ``pyarrow.Table`` for Arrow output, dict of DataFrames for normalized tables, or boolean ``True`` if `output_file` is provided) AND at least 
+        one week of data is able to be parsed and converted to CSV format; with `stats`, a pair of this 
+        and the ``ConvertStats``
 
     Raises:
         ValueError: 
             -  `dates_df` does not contain columns 1) 'year' or 2) 'week' or `output_file` is not end with '.csv'.
+            -  `output_format` is unknown, `output_file` is not a new '.parquet' file for Parquet output, 
+               is given for Arrow output, is an existing file (not a directory) for normalized tables or 
+               is not a '.db', '.sqlite' or '.sqlite3' file (with tables of the same `fields`, if it exists) 
+               for SQLite output.
+            -  `workers` is not a positive integer.
+            -  `prefetch` is not a non-negative integer, or `prefetch` or `downloader` are given with 
+               more than one worker.
+            -  `fields` is empty or holds names not in ``utility.FIELDS``.
+            -  `filter` holds unknown keys or bad conditions.
+            -  `stats` is neither a bool nor a ``ConvertStats``.
+            -  `dtype_backend` is not ``None`` or ``"pyarrow"``, or is given with an `output_file` or an 
+               `output_format` other than ``"csv"``.
+            -  `temp_dir` is not a string or ``None``.
     """
     # check format of df; internal function so should not occur
     if not ('year' == dates_df.columns[0] and 'week' == dates_df.columns[1]):
         raise ValueError("`dates_df` parameter must have `year` and `week` columns; current columns = {}"
                          .format(dates_df.columns))
-    # check if output file is CSV
+    # check output format
+    if output_format not in ("csv", "parquet", "arrow", "tables", "sqlite"):
+        raise ValueError('`output_format` parameter must be "csv", "parquet", "arrow", "tables" or "sqlite"; '
+                         'current value = {}'.format(output_format))
+    # check if output file is CSV (or Parquet)
     if output_file is not None:
         if not isinstance(output_file, str):
             raise ValueError("`output_file` parameter must be a path in the form of a string")
-        elif output_file[len(output_file)-4:len(output_file)] != ".csv":
+        elif output_format == "csv" and output_file[len(output_file)-4:len(output_file)] != ".csv":
             raise ValueError('`output_file` parameter must be a ".csv" file')
+        elif output_format == "parquet" and not output_file.endswith(".parquet"):
+            raise ValueError('`output_file` parameter must be a ".parquet" file for Parquet output')
+        elif output_format == "parquet" and path.exists(output_file):
+            raise ValueError("`output_file` {} already exists; Parquet output cannot be appended to".format(output_file))
+        elif output_format == "arrow":
+            raise ValueError("`output_file` parameter must be None for Arrow output")
+        elif output_format == "tables" and path.exists(output_file) and not path.isdir(output_file):
+            raise ValueError("`output_file` parameter must be a directory for normalized tables; {} is a file"
+                             .format(output_file))
+        elif output_format == "sqlite" and not output_file.endswith((".db", ".sqlite", ".sqlite3")):
+            raise ValueError('`output_file` parameter must be a ".db", ".sqlite" or ".sqlite3" file for SQLite output')
+    elif output_format == "parquet":
+        raise ValueError('`output_file` parameter must be a ".parquet" file for Parquet output')
+    elif output_format == "sqlite":
+        raise ValueError('`output_file` parameter must be a ".db", ".sqlite" or ".sqlite3" file for SQLite output')
+    # check DataFrame backend, only used when a DataFrame is returned
+    if dtype_backend not in (None, "pyarrow"):
+        raise ValueError('`dtype_backend` parameter must be None or "pyarrow"; current value = {}'.format(dtype_backend))
+    if dtype_backend is not None and (output_file is not None or output_format != "csv"):
+        raise ValueError('`dtype_backend` parameter requires a DataFrame result, i.e. "csv" `output_format` and no '
+                         '`output_file`; current value = {}'.format(dtype_backend))
     
-    # base vars
-    uspto_url = "https://bulkdata.uspto.gov/data/patent/grant/redbook/fulltext/"
-    dest_file = "temp-output.zip"
-    temp_output_file = "temp-patent-package-output.csv"
+    # check number of workers
+    if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+        raise ValueError("`workers` parameter must be a positive integer; current value = {}".format(workers))
+    # check prefetching, downloads are only shared between weeks of a serial run
+    if not isinstance(prefetch, int) or isinstance(prefetch, bool) or prefetch < 0:
+        raise ValueError("`prefetch` parameter must be a non-negative integer; current value = {}".format(prefetch))
+    if workers > 1 and (prefetch > 0 or downloader is not None):
+        raise ValueError("`prefetch` and `downloader` parameters require `workers` = 1; current value = {}"
+                         .format(workers))
+    fields, patent_filter, run_stats = check_fields(fields), check_filter(filter), check_stats(stats)
+    temp_dir = _check_temp_dir(temp_dir)
+
+    started = perf_counter()
+    with Workspace(temp_dir) as workspace:
+        if output_format in ("tables", "sqlite"):
+            result = _convert_tables(dates_df, output_file, workers, stream, cache, prefetch, downloader, fields,
+                                     patent_filter, sqlite = output_format == "sqlite", run_stats = run_stats,
+                                     workspace = workspace)
+        elif output_format != "csv" or dtype_backend is not None:
+            result = _convert_columnar(dates_df, output_file, workers, stream, cache, prefetch, downloader, fields,
+                                       patent_filter, run_stats, workspace)
+            if dtype_backend is not None:
+                result = table_to_df(result)
+        else:
+            result = _convert_csv(dates_df, output_file, workers, stream, cache, prefetch, downloader, fields,
+                                  patent_filter, run_stats, workspace)
+    if run_stats is None:
+        return result
+    run_stats.finish(perf_counter() - started)
+    return result, run_stats
+
+
+def _convert_csv(dates_df, output_file, workers, stream, cache, prefetch = 0, downloader = None, fields = None,
+                 patent_filter = None, run_stats = None, workspace = None):
+    """Converts weeks to CSV, appended to `output_file` (or read into a DataFrame if ``None``).
+
+    Internal helper for ``convert_to_df()``; arguments have already been checked. Rows are collected in a 
+    staged file (see ``Workspace.staged()``) that is published to `output_file` once all weeks are done.
+    """
     total_patents = 0
-    
-    # check if file exists/add header if needed
-    csv_file = output_file if output_file else temp_output_file
+    staged = workspace.staged(output_file, append = True) if output_file else nullcontext(workspace.path("output.csv"))
+    with staged as csv_file:
+        # add header unless appending to an existing file
+        with open(csv_file, 'w') as f:
+            if not (output_file and path.exists(output_file)):
+                f.write(csv_header(fields))
+
+        if workers == 1:
+            # convert all rows in df to that year & week's tuesday date (if exists)
+            rows = list(dates_df.itertuples(index = False))
+            with _prefetched_weeks(rows, prefetch, downloader, stream, cache, workspace) as prefetched:
+                for row, ((curr_year, curr_week), fetched) in enumerate(tqdm(zip(rows, prefetched), total = len(rows))):
+                    pat_count, week_stats = _convert_week(curr_year, curr_week, csv_file, workspace.week_zip(row),
+                                                          stream = stream, cache = cache, prefetched = fetched,
+                                                          fields = fields, patent_filter = patent_filter,
+                                                          week_stats = _new_week_stats(run_stats, curr_year, curr_week))
+                    total_patents += pat_count if pat_count else 0  # not used atm, may use in future
+                    if week_stats is not None:
+                        run_stats.add(week_stats)
+        else:
+            # each week gets its own zip and shard file, named after its row in `dates_df`
+            shards = [workspace.path("shard-{}.csv".format(row)) for row in range(dates_df.shape[0])]
+            with ProcessPoolExecutor(max_workers = workers) as executor:
+                futures = [executor.submit(_convert_week, curr_year, curr_week, shards[row],
+                                           workspace.week_zip(row), stream = stream, cache = cache,
+                                           fields = fields, patent_filter = patent_filter,
+                                           week_stats = _new_week_stats(run_stats, curr_year, curr_week))
+                           for row, (_, curr_year, curr_week) in enumerate(dates_df.itertuples())]
+                for future in tqdm(as_completed(futures), total = len(futures)):
+                    pat_count, week_stats = future.result()
+                    total_patents += pat_count if pat_count else 0  # not used atm, may use in future
+                    if week_stats is not None:
+                        run_stats.add(week_stats)
+
+            # merge shards in the same order a serial run would have written them
+            with open(csv_file, 'ab') as fout:
+                for shard in shards:
+                    if path.exists(shard):
+                        with open(shard, 'rb') as fin:
+                            shutil.copyfileobj(fin, fout)
+                        remove(shard)
+
+        # read into pandas as df if no output file specified
+        if output_file is None:
+            try:
+                df = pd.read_csv(csv_file)
+            except UnicodeDecodeError:
+                # keep the data, as the workspace is removed
+                kept_file = path.abspath(path.basename(workspace.dir) + ".csv")
+                shutil.move(csv_file, kept_file)
+                raise Exception("PANDAS UNABLE TO PARSE FINAL CSV FILE, DATA IS STORED IN STILL STORED IN FILE: {}. DELETE AS NECESSARY!!!".format(kept_file))
+            # a filter may legitimately keep no patents
+            if df.shape[0] <= 0 and patent_filter is None:
+                raise Exception("ERROR, NO PATENTS FOUND, PLEASE RAISE A GITHUB ISSUE @ https://github.com/JYProjs/patentpy/issues")
+
+    return True if output_file else df
+
+
+def _convert_columnar(dates_df, output_file, workers, stream, cache, prefetch = 0, downloader = None, fields = None,
+                      patent_filter = None, run_stats = None, workspace = None):
+    """Converts weeks to ``pyarrow.RecordBatch`` objects and writes them to Parquet (or returns a Table).
+
+    Internal helper for ``convert_to_df()``; arguments have already been checked. The Parquet file is 
+    staged (see ``Workspace.staged()``) and only renamed to `output_file` once all weeks are written.
+    """
+    records_week = partial(_records_week, stream = stream, cache = cache, fields = fields, patent_filter = patent_filter)
+    batches = []
+    with workspace.staged(output_file) if output_file else nullcontext() as parquet_file:
+        output = ParquetOutput(parquet_file, fields = fields) if output_file else None
+        try:
+            with _week_results(dates_df, records_week, workers, stream, cache, prefetch, downloader, run_stats,
+                               workspace) as results:
+                for batch, week_stats in tqdm(results, total = dates_df.shape[0]):
+                    if batch is not None:
+                        with written(week_stats, parquet_file):
+                            if output is not None:
+                                output.write(batch)
+                            else:
+                                batches.append(batch)
+                        if week_stats is not None and output is None:
+                            week_stats.bytes_out = batch.nbytes
+                    if week_stats is not None:
+                        run_stats.add(week_stats)
+        finally:
+            if output is not None:
+                output.close()
+
+    if output_file:
+        return True
+    table = batches_to_table(batches, fields)
+    if table.num_rows <= 0 and patent_filter is None:
+        raise Exception("ERROR, NO PATENTS FOUND, PLEASE RAISE A GITHUB ISSUE @ https://github.com/JYProjs/patentpy/issues")
+    return table
+
+
+def _convert_tables(dates_df, output_dir, workers, stream, cache, prefetch = 0, downloader = None, fields = None,
+                    patent_filter = None, sqlite = False, run_stats = None, workspace = None):
+    """Converts weeks to normalized tables and appends them to CSV files in `output_dir` (or returns DataFrames), 
+    or loads them into the SQLite database `output_dir` if `sqlite`.
+
+    Internal helper for ``convert_to_df()``; arguments have already been checked.
+    """
+    tables_week = partial(_records_week, stream = stream, cache = cache, fields = fields, patent_filter = patent_filter,
+                          output_format = "tables")
+    if sqlite:
+        output = SQLiteOutput(output_dir, fields)
+    else:
+        output = TablesOutput(output_dir, fields) if output_dir else None
+    weeks = []
     try:
-        f = open(csv_file)
-    except FileNotFoundError:        # no file exists, create file and write header
-        with open(csv_file, 'w+') as f:
-            f.write("WKU,Title,App_Date,Issue_Date,Inventor,Assignee,ICL_Class,References,Claims\n")
+        with _week_results(dates_df, tables_week, workers, stream, cache, prefetch, downloader, run_stats,
+                           workspace) as results:
+            for rows, week_stats in tqdm(results, total = dates_df.shape[0]):
+                if rows is not None:
+                    with written(week_stats, output_dir):
+                        if output is not None:
+                            output.write(rows)
+                        else:
+                            weeks.append(rows)
+                if week_stats is not None:
+                    run_stats.add(week_stats)
+    finally:
+        if output is not None:
+            output.close()
+
+    if output_dir:
+        return True
+    tables = rows_to_dfs(weeks, fields)
+    if tables["patents"].shape[0] <= 0 and patent_filter is None:
+        raise Exception("ERROR, NO PATENTS FOUND, PLEASE RAISE A GITHUB ISSUE @ https://github.com/JYProjs/patentpy/issues")
+    return tables
+
+
+@contextmanager
+def _week_results(dates_df, week_function, workers, stream, cache, prefetch = 0, downloader = None, run_stats = None,
+                  workspace = None):
+    """Yields an iterator over ``week_function(year, week, dest_file, week_stats = ...)`` of every row of 
+    `dates_df`, in order.
+
+    Internal helper for ``_convert_columnar()`` and ``_convert_tables()``. Weeks are run in a process pool 
+    if `workers` is greater than 1, otherwise one after the other with their zip files (optionally) 
+    prefetched by ``_prefetched_weeks()`` and passed on as `prefetched`. Each week gets a new 
+    ``WeekStats`` if `run_stats` is given, ``None`` otherwise. Zip files are stored in `workspace`.
+    """
+    rows = list(dates_df.itertuples(index = False))
+    dest_files = [workspace.week_zip(row) for row in range(len(rows))]
+    week_stats = [_new_week_stats(run_stats, curr_year, curr_week) for curr_year, curr_week in rows]
+    executor = ProcessPoolExecutor(max_workers = workers) if workers > 1 else None
+    try:
+        with _prefetched_weeks(rows, prefetch, downloader, stream, cache, workspace) as prefetched:
+            # results come back in `dates_df` order
+            if executor is not None:
+                futures = [executor.submit(week_function, curr_year, curr_week, dest_file, week_stats = stats)
+                           for (curr_year, curr_week), dest_file, stats in zip(rows, dest_files, week_stats)]
+                yield (future.result() for future in futures)
+            else:
+                yield (week_function(curr_year, curr_week, dest_file, prefetched = fetched, week_stats = stats)
+                       for (curr_year, curr_week), dest_file, fetched, stats in zip(rows, dest_files, prefetched,
+                                                                                     week_stats))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+@contextmanager
+def _prefetched_weeks(rows, prefetch, downloader, stream, cache, workspace = None):
+    """Yields an iterator over futures of the zip files of `rows` (``(year, week)`` pairs), in order.
+
+    Internal helper for ``convert_to_df()``. Weeks are fetched with ``fetch_week()`` on the thread 
+    pool of `downloader` (a new one if ``None``), up to `prefetch` weeks ahead of the one last taken 
+    from the iterator; each into its own zip file in `workspace` (``Workspace.week_zip()``). If there is neither `prefetch` 
+    nor a `downloader`, the iterator yields ``None`` for every row (weeks are fetched when converted). 
+    Downloaded weeks that are not converted are removed on exit.
+    """
+    if prefetch == 0 and downloader is None:
+        yield itertools.repeat(None, len(rows))
+        return
+
+    own_downloader = downloader is None
+    downloader = Downloader() if own_downloader else downloader
+    futures = {}
+
+    def prefetched():
+        for row in range(len(rows)):
+            for ahead in range(row, min(row + prefetch + 1, len(rows))):
+                if ahead not in futures:
+                    futures[ahead] = downloader.submit(fetch_week, rows[ahead][0], rows[ahead][1],
+                                                       workspace.week_zip(ahead), stream, cache, downloader)
+            yield futures.pop(row)
+
+    try:
+        yield prefetched()
+    finally:
+        for future in futures.values():
+            if future.cancel() or future.exception() is not None:
+                continue
+            fetched = future.result()
+            if fetched is not None and cache is None and not stream:
+                remove(fetched[1])
+        if own_downloader:
+            downloader.close()
+
+
+def fetch_week(curr_year, curr_week, dest_file, stream = False, cache = None, downloader = None):
+    """Downloads (or gets from `cache`) the zip file of a week of USPTO data.
+
+    Used by ``convert_to_df()`` and ``store.sync()``. The zip file is stored at `dest_file`, kept in
+    memory if `stream`, or left in the cache. Download errors are raised.
+
+    Args:
+        curr_year (int): year of the week.
+        curr_week (int): week of the year, as in ``utility.plan_weeks()``.
+        dest_file (str): path to download the zip file to; unused if `stream` or `cache`.
+        stream (bool, default False): keep the zip file in memory instead of writing it to `dest_file`.
+        cache (ArchiveCache, default None): cache to get the zip file from (downloading it if missing).
+        downloader (Downloader, default None): downloader to fetch with; a plain request if ``None``.
+
+    Returns:
+        tuple or None: expected file name and the zip file (path or ``BytesIO``), or ``None`` if the 
+        week has no file name
+    """
+    # get file name and url
+    curr_file = plan_weeks([int(curr_year)], [int(curr_week)]).file_name[0]
+    if curr_file is None:
+        return None
+
+    # try to download data with complete file name (or get it from cache)
+    if cache is not None:
+        return curr_file, cache.fetch(curr_year, curr_file, downloader)
+    url = get_url(curr_year, curr_file)
+    if stream:
+        return curr_file, downloader.fetch(url) if downloader is not None else fetch_zip(url)
+    if downloader is not None:
+        downloader.download(url, dest_file)
     else:
-        f.close()        # close file if exists
-    
-    # convert all rows in df to that year & week's tuesday date (if exists)
-    for row, curr_year, curr_week in tqdm(dates_df.itertuples(), total = dates_df.shape[0]):
-        # get file name and url
-        curr_file = get_file_name(curr_year, curr_week)
+        download_zip(url, dest_file)
+    return curr_file, dest_file
+
+
+@contextmanager
+def _week_file(curr_year, curr_week, dest_file, stream = False, cache = None, prefetched = None, week_stats = None):
+    """Fetches a week of USPTO data and yields its extracted file (or an open stream of it if `stream`).
+
+    Internal helper for ``_convert_week()`` and ``_records_week()``. Yields ``None`` if the week is 
+    skipped (errors are printed). The extracted file is removed (or the stream closed) afterwards.
+    If the week was `prefetched`, its zip file is taken from that future (of ``fetch_week()``).
+    Download and unzip times, zip file size and peak memory are recorded in `week_stats` if given.
+    """
+    try:
+        with timed(week_stats, "download"):
+            if prefetched is not None:
+                fetched = prefetched.result()
+            else:
+                fetched = fetch_week(curr_year, curr_week, dest_file, stream, cache)
+        if fetched is not None:
+            # try to find and uncompress (or open) file from zip, and delete zip unless cached
+            curr_file, zip_file = fetched
+            if week_stats is not None:
+                week_stats.file = curr_file
+                week_stats.bytes_in = path.getsize(zip_file) if isinstance(zip_file, str) else zip_file.getbuffer().nbytes
+            with timed(week_stats, "unzip"):
+                if stream:
+                    curr_file = open_zip_member(curr_file, zip_file)
+                else:
+                    # extracted next to the zip file, i.e. in the run's workspace
+                    curr_file = uncompress_zip(curr_file, zip_file, remove_zip = cache is None,
+                                               dest_dir = path.dirname(dest_file))
+    except Exception as e:
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        traceback.print_exception(exc_type, exc_value, e.__traceback__)
+        print("UNABLE TO GET DATA, SKIPPING PATENT DATA FOR WEEK {} OF YEAR {}...".format(curr_week, curr_year))
+        _week_error(week_stats, "skipped", e)
+        yield None
+        return
+    if fetched is None:
+        print("SKIPPING PATENT DATA FOR WEEK {} OF YEAR {}...".format(curr_week, curr_year))
+        _week_error(week_stats, "skipped", None)
+        yield None
+        return
+
+    try:
+        yield curr_file
+    finally:
+        # remove xml (or close stream) before next iteration
+        if stream:
+            curr_file.close()
+        else:
+            remove(curr_file)
+        if week_stats is not None:
+            week_stats.peak_memory = peak_memory()
+
+
+def _new_week_stats(run_stats, curr_year, curr_week):
+    # `WeekStats` to measure a week into if stats are collected
+    return WeekStats(curr_year, curr_week) if run_stats is not None else None
+
+
+def _week_error(week_stats, status, e):
+    # record why a week was skipped or failed
+    if week_stats is not None:
+        week_stats.status, week_stats.error = status, repr(e) if e is not None else None
+
+
+def _convert_week(curr_year, curr_week, csv_file, dest_file, stream = False, cache = None, prefetched = None,
+                  fields = None, patent_filter = None, week_stats = None):
+    """Downloads, uncompresses and converts a single week of USPTO data, appending it to `csv_file`.
+
+    Internal helper for ``convert_to_df()``. Kept at module level so that it can be sent to worker 
+    processes. Errors are printed and the week is skipped, as in a serial run.
+
+    Args:
+        curr_year (int): year of the week to convert.
+        curr_week (int): week (within `curr_year`) to convert.
+        csv_file (str): path of '.csv' file that converted rows are appended to (no header is written).
+        dest_file (str): path the downloaded zip file is temporarily stored at.
+        stream (bool, default False): parse weeks straight from the in-memory zip file.
+        cache (ArchiveCache, default None): cache to fetch zip files through.
+        prefetched (Future, default None): download of the week started by ``_prefetched_weeks()``.
+        fields (tuple, default None): columns to convert, all if ``None``.
+        patent_filter (PatentFilter, default None): conditions patents have to meet to be converted.
+        week_stats (WeekStats, default None): measurements of the week to fill in.
+
+    Returns:
+        tuple: number of patents read (``None`` if the week was skipped), and `week_stats`
+    """
+    with _week_file(curr_year, curr_week, dest_file, stream, cache, prefetched, week_stats) as curr_file:
         if curr_file is None:
-            print("SKIPPING PATENT DATA FOR WEEK {} OF YEAR {}...".format(curr_week, curr_year))
-            continue
-        curr_url = uspto_url + "{}/".format(curr_year) + curr_file[:-4] + ".zip"
-        
+            return None, week_stats
+        offset = path.getsize(csv_file) if week_stats is not None and path.exists(csv_file) else 0
+
+        # convert to TXT or XML data to CSV format, skip this year's week's data if unable to read
         try:
-            # try to download data with complete file name
-            download_zip(curr_url, dest_file)
-            # try to find and uncompress file from zip, and delete zip
-            curr_file = uncompress_zip(curr_file, dest_file)
+            # always append, no header, checked in file
+            with timed(week_stats, "parse"):
+                pat_count, rows = convert_file(curr_year, curr_file, csv_file, fields = fields,
+                                               patent_filter = patent_filter, with_rows = True)
         except Exception as e:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             traceback.print_exception(exc_type, exc_value, e.__traceback__)
-            print("UNABLE TO GET DATA, SKIPPING PATENT DATA FOR WEEK {} OF YEAR {}...".format(curr_week, curr_year))
-            continue
+            print("UNABLE TO CONVERT ALL PATENT DATA FOR WEEK {} OF YEAR {} DUE TO ABOVE EXCEPTION, SKIPPING REST...".format(curr_week, curr_year))
+            _week_error(week_stats, "failed", e)
+            return None, week_stats
+
+        if week_stats is not None:
+            # rows as counted by the writers, patents read include those filtered out
+            week_stats.bytes_out = path.getsize(csv_file) - offset
+            week_stats.patents = rows
+            week_stats.skipped = pat_count - rows
+        return pat_count, week_stats
+
+
+def convert_file(curr_year, curr_file, csv_file, append = True, header = False, fields = None, patent_filter = None,
+                 with_rows = False):
+    """Converts a week's extracted file to CSV with the converter for the format used that year.
+
+    Used by ``convert_to_df()`` and ``store.sync()``. TXT (before 2002), XML1 (2002-2004) and XML2
+    (from 2005) files are converted by ``txt_to_df()``, ``xml1_to_df()`` and ``xml2_to_df()``.
+
+    Args:
+        curr_year (int): year of the week, which selects the converter.
+        curr_file (str or file-like): path of the extracted file, or an open stream of it.
+        csv_file (str): path of the CSV file to write.
+        append (bool, default True): append to `csv_file` instead of overwriting it.
+        header (bool, default False): write a header row (unless appending).
+        fields (list, default None): fields to write; all of ``utility.FIELDS`` if ``None``.
+        patent_filter (PatentFilter, default None): filter of the patents to write.
+        with_rows (bool, default False): also return the number of rows written.
+
+    Returns:
+        int or tuple: number of patents read, and the number of rows written if `with_rows`
+    """
+    if curr_year < 2002:
+        # streamed TXT is parsed from memory
+        return txt_to_df(curr_file if isinstance(curr_file, str) else curr_file.read(), csv_file, append, header,
+                         check_fields(fields), patent_filter, with_rows)
+    elif curr_year < 2005:
+        return xml1_to_df(curr_file, csv_file, append, header, fields = fields, filter = patent_filter,
+                          with_rows = with_rows)
+    return xml2_to_df(curr_file, csv_file, append, header, fields = fields, filter = patent_filter, with_rows = with_rows)
+
+
+def _iter_records(curr_year, curr_file, fields = None, patent_filter = None):
+    # patent records from a week's extracted file (or stream), in the format used that year
+    if curr_year < 2002:
+        return iter_txt_records(curr_file, fields, patent_filter)
+    elif curr_year < 2005:
+        return iter_xml1_records(curr_file, fields, patent_filter)
+    return iter_xml2_records(curr_file, fields = fields, filter = patent_filter)
+
 
-        # convert to TXT or XML data to CSV format
+def _records_week(curr_year, curr_week, dest_file, stream = False, cache = None, prefetched = None, fields = None,
+                  patent_filter = None, output_format = "arrow", week_stats = None):
+    """Downloads, uncompresses and parses a single week of USPTO data into a ``pyarrow.RecordBatch``, or 
+    into the rows of normalized tables if `output_format` is ``"tables"``.
+
+    Internal helper for ``convert_to_df()`` with columnar or normalized output; see ``_convert_week()``.
+
+    Returns:
+        tuple: the week's patents as a RecordBatch (dict of table name to rows from 
+        ``tables.records_to_rows()``), or ``None`` if the week was skipped; and `week_stats`
+    """
+    with _week_file(curr_year, curr_week, dest_file, stream, cache, prefetched, week_stats) as curr_file:
+        if curr_file is None:
+            return None, week_stats
+        skipped = skipped_count()
         try:
-            if curr_year < 2002:
-                pat_count = txt_to_df(curr_file, csv_file, True, False)
-            elif curr_year < 2005:
-                pat_count = xml1_to_df(curr_file, csv_file, True, False)   # always append, no header, checked in file
-            else:
-                pat_count = xml2_to_df(curr_file, csv_file, True, False)   # always append, no header, checked in file
-            total_patents += pat_count  # not used atm, may use in future
+            with timed(week_stats, "parse"):
+                if output_format == "tables":
+                    result = records_to_rows(_iter_records(curr_year, curr_file, table_fields(fields), patent_filter),
+                                             fields)
+                else:
+                    result = records_to_batch(list(_iter_records(curr_year, curr_file, fields, patent_filter)), fields)
         except Exception as e:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             traceback.print_exception(exc_type, exc_value, e.__traceback__)
             print("UNABLE TO CONVERT ALL PATENT DATA FOR WEEK {} OF YEAR {} DUE TO ABOVE EXCEPTION, SKIPPING REST...".format(curr_week, curr_year))
-            continue
-        finally:
-            # remove xml before next iteration, skip this year's week's data if unable to read
-            remove(curr_file)
-    
-    # get temp file contents and read into pandas as df if no output file specified
-    if output_file is None:
-        try:
-            df = pd.read_csv(temp_output_file)
-            if df.shape[0] <= 0:
-                remove(temp_output_file)
-                raise Exception("ERROR, NO PATENTS FOUND, PLEASE RAISE A GITHUB ISSUE @ https://github.com/JYProjs/patentpy/issues")
-        except UnicodeDecodeError:
-            raise Exception("PANDAS UNABLE TO PARSE FINAL CSV FILE, DATA IS STORED IN STILL STORED IN FILE: {}. DELETE AS NECESSARY!!!".format(temp_output_file))
-        remove(temp_output_file)
+            _week_error(week_stats, "failed", e)
+            return None, week_stats
 
-    return True if output_file else df
\ No newline at end of file
+        if week_stats is not None:
+            week_stats.patents = len(result["patents"]) if output_format == "tables" else result.num_rows
+            # the native TXT engine does not report the patents it filters out
+            native_filtered = curr_year < 2002 and patent_filter is not None
+            week_stats.skipped = None if native_filtered else skipped_count() - skipped
+        return result, week_stats
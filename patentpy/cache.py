@@ -0,0 +1,149 @@
+import os, time, hashlib, threading, urllib.request
+from os import remove, path
+
+from patentpy.utility import get_url, uspto_url
+
+
+class ArchiveCache:
+    """On-disk cache of downloaded USPTO weekly zip files.
+
+    Published weeks never change, so each zip file is downloaded once and kept in ``cache_dir`` under
+    its USPTO file name (i.e. ``get_file_name()`` with a '.zip' extension). A SHA-256 checksum is stored
+    next to each zip and verified whenever it is served. When the cache grows beyond ``max_size`` bytes
+    the least recently used zip files are evicted.
+
+    Bookkeeping lives in the file system (checksum sidecar files and modification times), so several
+    processes can share one cache directory.
+
+    Args:
+        cache_dir (str): directory to store zip files in; created if it does not exist.
+        max_size (int, default None): maximum total size of cached zip files in bytes, ``None`` for no limit.
+        offline (bool, default False): if ``True``, never download and only serve cached zip files.
+        base_url (str, default `uspto_url`): url of directory holding one sub-directory per year; may
+            be any url ``urllib`` can open (e.g. a local ``file://`` mirror or test server).
+        verify (bool, default True): check the stored checksum every time a cached zip is served.
+
+    Raises:
+        ValueError:
+            If ``max_size`` is not a positive integer or ``None``.
+    """
+    def __init__(self, cache_dir, max_size = None, offline = False, base_url = uspto_url, verify = True):
+        if max_size is not None and (not isinstance(max_size, int) or max_size <= 0):
+            raise ValueError("`max_size` parameter must be a positive integer or None; current value = {}"
+                             .format(max_size))
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.offline = offline
+        self.base_url = base_url
+        self.verify = verify
+        os.makedirs(cache_dir, exist_ok = True)
+
+    def url(self, year, file_name):
+        """Returns the url the zip file containing ``file_name`` is downloaded from."""
+        return get_url(year, file_name, self.base_url)
+
+    def path(self, file_name):
+        """Returns the path the zip file containing ``file_name`` is (or would be) cached at."""
+        return path.join(self.cache_dir, file_name[:-4] + ".zip")
+
+    def fetch(self, year, file_name, downloader = None):
+        """Returns the path of the cached zip file containing ``file_name``, downloading it if needed.
+
+        Args:
+            year (int): year the file was published.
+            file_name (str): expected file name (from ``get_file_name()``).
+            downloader (Downloader, default None): ``patentpy.downloader.Downloader`` to download 
+                through (retrying and resuming failed transfers), instead of a plain ``urllib`` request.
+
+        Returns:
+            string: path of the cached zip file
+
+        Raises:
+            FileNotFoundError:
+                If the zip file is not cached (or fails verification) and the cache is ``offline``.
+        """
+        zip_path = self.path(file_name)
+        if path.exists(zip_path):
+            if not self.verify or self._checksum(zip_path) == self._stored_checksum(zip_path):
+                os.utime(zip_path)          # mark as recently used
+                return zip_path
+            # corrupt or partially written, drop it
+            self._remove(zip_path)
+
+        if self.offline:
+            raise FileNotFoundError("{} is not in cache {} and the cache is offline"
+                                    .format(path.basename(zip_path), self.cache_dir))
+
+        self._download(self.url(year, file_name), zip_path, downloader)
+        self._evict(keep = zip_path)
+        return zip_path
+
+    def size(self):
+        """Returns total size in bytes of cached zip files."""
+        return sum(path.getsize(zip_path) for zip_path in self._entries())
+
+    def clear(self):
+        """Removes all cached zip files."""
+        for zip_path in self._entries():
+            self._remove(zip_path)
+
+    def _entries(self):
+        return [path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                if name.endswith(".zip")]
+
+    def _download(self, url, zip_path, downloader = None):
+        # download to a private name and rename, so readers never see partial files
+        temp_path = "{}.part-{}-{}".format(zip_path, os.getpid(), threading.get_ident())
+        try:
+            if downloader is not None:
+                downloader.download(url, temp_path)
+                checksum = self._checksum(temp_path)
+            else:
+                sha256 = hashlib.sha256()
+                with urllib.request.urlopen(url) as res, open(temp_path, 'wb') as output_file:
+                    for chunk in iter(lambda: res.read(1 << 20), b''):
+                        sha256.update(chunk)
+                        output_file.write(chunk)
+                checksum = sha256.hexdigest()
+            with open(zip_path + ".sha256", 'w') as f:
+                f.write(checksum)
+            os.replace(temp_path, zip_path)
+        finally:
+            if path.exists(temp_path):
+                remove(temp_path)
+
+    def _evict(self, keep = None):
+        if self.max_size is None:
+            return
+        entries = sorted(self._entries(), key = path.getmtime)      # least recently used first
+        total = sum(path.getsize(zip_path) for zip_path in entries)
+        for zip_path in entries:
+            if total <= self.max_size:
+                break
+            if zip_path == keep:
+                continue
+            total -= path.getsize(zip_path)
+            self._remove(zip_path)
+
+    def _remove(self, zip_path):
+        for file in (zip_path, zip_path + ".sha256"):
+            try:
+                remove(file)
+            except FileNotFoundError:
+                pass            # already evicted by another process
+
+    @staticmethod
+    def _checksum(zip_path):
+        sha256 = hashlib.sha256()
+        with open(zip_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def _stored_checksum(zip_path):
+        try:
+            with open(zip_path + ".sha256") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,189 @@
+# citation graph of a store built by `patentpy.store.sync()`, as compressed sparse row (CSR) adjacency arrays
+from os import path
+import numpy as np
+import pandas as pd
+
+from patentpy.utility import week_files, write_npy
+
+# prefixes of patent numbers; a WKU is encoded as prefix position * NUMBER_SPAN + number
+KINDS = ["", "D", "RE", "PP", "H", "T", "X", "RX", "AI"]
+NUMBER_SPAN = 10 ** 8
+
+# graph files of a store: sorted codes of all patents (nodes), and per direction the CSR row pointers
+# and node ids of the neighbours
+GRAPH_NODES = "citation_nodes.npy"
+GRAPH_FILES = {direction: ("citation_{}_indptr.npy".format(direction), "citation_{}_indices.npy".format(direction))
+               for direction in ["backward", "forward"]}
+
+# citation edge of a week file: codes of the citing and the cited patent
+EDGE_DTYPE = np.dtype([("citing", "<i8"), ("cited", "<i8")])
+
+
+def encode_wkus(wkus):
+    """Encodes WKUs or cited patent numbers as integers.
+
+    Values of the WKU column and of the References column are encoded alike: the prefix (``KINDS``) and
+    the number are kept, leading zeros are dropped, as is the check digit of 9-character (1976-2001) WKUs,
+    e.g. ``"039301000"``, ``"3930100"`` and ``"03930100"`` are the same patent.
+
+    Args:
+        wkus (iterable of str): WKUs or patent numbers.
+
+    Returns:
+        ndarray: int64 code of every value, -1 for values that are not US patent numbers
+    """
+    wkus = pd.Series(list(wkus), dtype = object).astype(str).str.strip()
+    wkus = wkus.where(wkus.str.len() != 9, wkus.str[:-1])
+    parts = wkus.str.extract(r"^([A-Z]*)(\d{1,8})$")
+    kinds = parts[0].map({kind: i for i, kind in enumerate(KINDS)})
+    valid = (kinds.notna() & parts[1].notna()).to_numpy()
+    codes = np.full(len(wkus), -1, dtype = "<i8")
+    codes[valid] = kinds[valid].to_numpy("<i8") * NUMBER_SPAN + parts[1][valid].astype("<i8").to_numpy()
+    return codes
+
+
+def decode_wkus(codes):
+    """Patent numbers of integer codes (from ``encode_wkus()``), as 8-character WKUs like ``"06334220"``."""
+    return ["{0}{1:0{2}d}".format(KINDS[code // NUMBER_SPAN], code % NUMBER_SPAN, 8 - len(KINDS[code // NUMBER_SPAN]))
+            for code in np.asarray(codes).tolist()]
+
+
+def build_citation_graph(store_path):
+    """Builds the citation graph of a store from the References column of its week files.
+
+    The citations of each week file are extracted once into an edge list next to it
+    (``<file>.cites.npy``), which is only rebuilt when the week file changes, so the graph is updated
+    one week at a time as the store grows; ``sync(..., citation_graph = True)`` calls this after
+    converting weeks. The edges of all weeks are then merged into memory-mappable arrays: the sorted
+    codes of all citing and cited patents (``citation_nodes.npy``), and CSR adjacency of node ids in
+    both directions -- backward (patent -> patents it cites) and forward (patent -> patents citing
+    it), see ``CitationGraph``. Repeated citations are counted once.
+
+    Args:
+        store_path (str): directory of the store.
+
+    Returns:
+        int: number of citations in the graph
+    """
+    edges = []
+    for week_file in week_files(store_path):
+        edges_path = week_file[:-4] + ".cites.npy"
+        if not path.exists(edges_path) or path.getmtime(edges_path) < path.getmtime(week_file):
+            write_npy(_week_edges(week_file), edges_path)
+        edges.append(np.load(edges_path))
+    edges = np.concatenate(edges) if edges else np.empty(0, EDGE_DTYPE)
+
+    # node ids are positions in the sorted codes; each edge once, ordered by citing then cited patent
+    nodes, ids = np.unique(np.concatenate([edges["citing"], edges["cited"]]), return_inverse = True)
+    n_nodes = len(nodes)
+    keys = np.unique(ids[:len(edges)] * n_nodes + ids[len(edges):])
+    citing, cited = np.divmod(keys, max(n_nodes, 1))
+
+    for direction, (source, target) in [("backward", (citing, cited)), ("forward", (cited, citing))]:
+        order = np.argsort(source, kind = "stable")
+        indptr = np.zeros(n_nodes + 1, dtype = "<i8")
+        np.cumsum(np.bincount(source, minlength = n_nodes), out = indptr[1:])
+        indptr_file, indices_file = GRAPH_FILES[direction]
+        write_npy(target[order].astype("<i4"), path.join(store_path, indices_file))
+        write_npy(indptr, path.join(store_path, indptr_file))
+    write_npy(nodes, path.join(store_path, GRAPH_NODES))
+    return len(keys)
+
+
+def _week_edges(week_file):
+    # (citing, cited) codes of the citations in a week file, in file order
+    df = pd.read_csv(week_file, usecols = ["WKU", "References"], dtype = str, keep_default_na = False)
+    cited = df.References.str.split(";").explode()
+    cited = cited[cited != ""]
+    edges = np.empty(len(cited), EDGE_DTYPE)
+    edges["citing"] = encode_wkus(df.WKU.to_numpy()[cited.index])
+    edges["cited"] = encode_wkus(cited)
+    return edges[(edges["citing"] >= 0) & (edges["cited"] >= 0)]
+
+
+class CitationGraph:
+    """Citation graph of a store, memory-mapped from the files of ``build_citation_graph()``.
+
+    Nodes are all patents that cite or are cited, identified by their position in ``nodes`` (the sorted
+    ``encode_wkus()`` codes). For each direction, the neighbours of node ``i`` are
+    ``indices[indptr[i]:indptr[i + 1]]``: the patents it cites for ``"backward"``, the patents citing it
+    for ``"forward"``.
+
+    Args:
+        store_path (str): directory of the store.
+
+    Raises:
+        FileNotFoundError:
+            If the store has no citation graph.
+    """
+    def __init__(self, store_path):
+        self.nodes = np.load(path.join(store_path, GRAPH_NODES), mmap_mode = 'r')
+        self.indptr, self.indices = {}, {}
+        for direction, (indptr_file, indices_file) in GRAPH_FILES.items():
+            self.indptr[direction] = np.load(path.join(store_path, indptr_file), mmap_mode = 'r')
+            self.indices[direction] = np.load(path.join(store_path, indices_file), mmap_mode = 'r')
+
+    def node_ids(self, wkus):
+        """Node ids of WKUs or patent numbers, -1 for patents not in the graph."""
+        codes = encode_wkus([wkus] if isinstance(wkus, str) else wkus)
+        ids = np.searchsorted(self.nodes, codes).clip(max = max(len(self.nodes) - 1, 0))
+        found = (codes >= 0) & (len(self.nodes) > 0)
+        found[found] = self.nodes[ids[found]] == codes[found]
+        return np.where(found, ids, -1)
+
+    def citation_counts(self, wkus = None, direction = "forward"):
+        """Number of citations of patents (``"forward"``: times cited, ``"backward"``: patents cited).
+
+        Args:
+            wkus (iterable of str, default None): WKUs or patent numbers, all nodes (in node order) if ``None``.
+            direction (str, default "forward"): ``"forward"`` or ``"backward"``.
+
+        Returns:
+            ndarray: count of every patent, 0 for patents not in the graph
+        """
+        counts = np.diff(self.indptr[self._check_direction(direction)])
+        if wkus is None:
+            return counts
+        ids = self.node_ids(wkus)
+        return np.where(ids >= 0, counts[ids], 0)
+
+    def neighborhood(self, wkus, k = 1, direction = "forward"):
+        """Patents within `k` citations of `wkus`, following citations in `direction`.
+
+        The frontier of each hop is expanded with array operations, not one patent at a time.
+
+        Args:
+            wkus (iterable of str): WKUs or patent numbers to start from.
+            k (int, default 1): number of hops.
+            direction (str, default "forward"): ``"forward"`` (citing patents) or ``"backward"`` (cited patents).
+
+        Returns:
+            list[str]: WKUs (as returned by ``decode_wkus()``) of the patents reached, in node order, not
+            including `wkus` themselves
+
+        Raises:
+            ValueError:
+                If `k` is not a non-negative integer, or `direction` is not ``"forward"`` or ``"backward"``.
+        """
+        indptr, indices = self.indptr[self._check_direction(direction)], self.indices[direction]
+        if not isinstance(k, int) or k < 0:
+            raise ValueError("`k` parameter must be a non-negative integer; current value = {}".format(k))
+
+        ids = self.node_ids(wkus)
+        visited = frontier = np.unique(ids[ids >= 0])
+        for _ in range(k):
+            if not len(frontier):
+                break
+            # positions of all neighbours of the frontier in `indices`
+            starts, counts = indptr[frontier], indptr[frontier + 1] - indptr[frontier]
+            positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            frontier = np.setdiff1d(indices[positions], visited)
+            visited = np.union1d(visited, frontier)
+        return decode_wkus(self.nodes[np.setdiff1d(visited, ids)])
+
+    @staticmethod
+    def _check_direction(direction):
+        if direction not in GRAPH_FILES:
+            raise ValueError("`direction` parameter must be 'forward' or 'backward'; current value = {}"
+                             .format(direction))
+        return direction
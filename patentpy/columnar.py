@@ -0,0 +1,111 @@
+# columnar (Apache Arrow / Parquet) output of converted patent data
+# requires the optional `pyarrow` dependency (`pip install patentpy[parquet]`)
+import pandas as pd
+
+from patentpy.utility import FIELDS, MULTI_VALUED, check_fields
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:         # optional dependency, checked when used
+    pa = None
+
+DATE_FIELDS = ["App_Date", "Issue_Date"]
+# fields with few distinct values, held as categoricals in compact DataFrames
+CATEGORY_FIELDS = ["Assignee", "ICL_Class"]
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet and Arrow output require `pyarrow`; install it with `pip install pyarrow`")
+
+
+def get_schema(fields = None):
+    """Returns the ``pyarrow.Schema`` of converted patent data.
+
+    Dates are stored as ``date32`` and the multi-valued Inventor, Assignee, ICL_Class and References
+    fields as lists of strings. `fields` selects columns (in ``utility.FIELDS`` order), all if ``None``.
+    """
+    _require_pyarrow()
+    return pa.schema([(field, pa.date32() if field in DATE_FIELDS else
+                              pa.list_(pa.string()) if field in MULTI_VALUED else pa.string())
+                      for field in check_fields(fields)])
+
+
+def _to_dates(values):
+    # USPTO dates are YYYYMMDD strings; invalid dates (e.g. day "00") become null
+    strings = pa.array(values, type = pa.string())
+    return pc.strptime(strings, format = "%Y%m%d", unit = "s", error_is_null = True).cast(pa.date32())
+
+
+def records_to_batch(records, fields = None):
+    """Converts patent records (from ``iter_txt_records()``, ``iter_xml1_records()`` or
+    ``iter_xml2_records()``) to a ``pyarrow.RecordBatch`` with the schema from ``get_schema()``.
+
+    Args:
+        records (list[tuple]): patent records in ``utility.FIELDS`` order.
+        fields (list, default None): columns the records hold, all if ``None``.
+
+    Returns:
+        RecordBatch: typed batch holding all `records`
+    """
+    schema = get_schema(fields)
+    columns = list(zip(*records)) if records else [()] * len(schema)
+    arrays = []
+    for field, values in zip(schema, columns):
+        if field.name in DATE_FIELDS:
+            arrays.append(_to_dates(values))
+        else:
+            arrays.append(pa.array(values, type = field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema = schema)
+
+
+def batches_to_table(batches, fields = None):
+    """Combines record batches (e.g. one per week) of the columns `fields` into a ``pyarrow.Table``."""
+    return pa.Table.from_batches(batches, schema = get_schema(fields))
+
+
+def table_to_df(table):
+    """Converts a ``pyarrow.Table`` of patent data (see ``get_schema()``) to a compact ``pandas.DataFrame``.
+
+    Columns hold the same values as CSV output read back with ``pandas.read_csv()``, in compact dtypes:
+    dates as ``datetime64[s]`` (``NaT`` for invalid dates), multi-valued fields joined by ``;``, Assignee
+    and ICL_Class as categoricals and all other text as Arrow-backed ``string[pyarrow]``, which keeps
+    the text in Arrow buffers rather than one Python object per value.
+
+    Args:
+        table (Table): patent data, e.g. from ``batches_to_table()``.
+
+    Returns:
+        DataFrame: one row per patent
+    """
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if name in DATE_FIELDS:
+            column = pc.cast(column, pa.timestamp("s"))
+        elif name in MULTI_VALUED:
+            column = pc.binary_join(column, ";")
+        columns[name] = column.dictionary_encode() if name in CATEGORY_FIELDS else column
+    return pa.table(columns).to_pandas(types_mapper = {pa.string(): pd.StringDtype("pyarrow")}.get)
+
+
+class ParquetOutput:
+    """Writes record batches to a Parquet file, one row group per batch (i.e. per week).
+
+    Args:
+        output_file (str): path of '.parquet' file to create.
+        compression (str, default "zstd"): Parquet compression codec.
+        fields (list, default None): columns of the batches, all if ``None``.
+    """
+    def __init__(self, output_file, compression = "zstd", fields = None):
+        _require_pyarrow()
+        self.writer = pq.ParquetWriter(output_file, get_schema(fields), compression = compression)
+
+    def write(self, batch):
+        if batch.num_rows > 0:
+            self.writer.write_batch(batch, row_group_size = batch.num_rows)
+
+    def close(self):
+        self.writer.close()
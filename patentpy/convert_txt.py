@@ -0,0 +1,45 @@
+import mmap
+
+from convert_funcs import txt_to_records
+from patentpy.utility import open_input, check_fields, check_filter
+
+# bytes of TXT data parsed at a time; chunks end before a PATN line, so patents never span chunks
+TXT_CHUNK = 1 << 22
+
+def iter_txt_records(input_file, fields = None, filter = None, chunk_size = TXT_CHUNK):
+    """Generator over the patents in a USPTO (1976-2001) TXT file.
+
+    The file is parsed in memory by the C++ ``txt_to_records``: memory-mapped if `input_file` is a path, 
+    read otherwise. It is parsed in chunks of whole patents of about `chunk_size` bytes, so only the 
+    records of one chunk (a few hundred patents) are held at a time, not those of the whole week.
+
+    Args:
+        input_file:  `string`, path of '.txt' file, or binary file-like object to read data from
+        fields: `list`, columns (of ``utility.FIELDS``) to extract, all if ``None``
+        filter: `dict` or ``utility.PatentFilter``, conditions patents have to meet to be yielded
+        chunk_size: `int`, bytes of data to parse at a time
+
+    Yields:
+        `tuple` -- requested fields of one patent in ``utility.FIELDS`` order; Inventor, Assignee, 
+        ICL_Class and References are lists.
+    """
+    fields, patent_filter = check_fields(fields), check_filter(filter)
+    with open_input(input_file) as f:
+        data = _read_buffer(f)
+        try:
+            start = 0
+            while start < len(data):
+                end = data.find(b"\nPATN", start + chunk_size) + 1 or len(data)
+                yield from txt_to_records(data[start:end], fields, patent_filter)
+                start = end
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def _read_buffer(f):
+    # contents of binary file `f` as a bytes-like object, memory-mapped for regular files
+    try:
+        return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):      # not a regular file (e.g. zip member), or empty
+        return f.read()
@@ -3,105 +3,175 @@ from os import remove
 from lxml import etree
 from io import BytesIO
 import pandas as pd
+from convert_funcs import xml1_to_df as native_xml1_to_df, CsvWriter
 
-from patentpy.utility import get_file_name, uncompress_zip, download_zip
+from patentpy.stats import count_skipped
+from patentpy.utility import (get_file_name, uncompress_zip, download_zip, open_input, format_csv_row, check_fields,
+                              check_filter, FIELDS, CSV_BATCH)
 
-def extractFields1(parsed):
-    # process current patent
+def _text(element):
+    # text of an element, "" if it is empty or missing (as written by every engine)
+    return element.text or "" if element is not None else ""
+
+def extractFields1(parsed, fields = None, patent_filter = None):
+    # process current patent and format as CSV row
+    record = extractRecord1(parsed, fields, patent_filter)
+    return format_csv_row(record) if record is not None else ""
+
+def extractRecord1(parsed, fields = None, patent_filter = None):
+    # process current patent; multi-valued fields are returned as lists, only `fields` are extracted
+    # and patents `patent_filter` rejects are skipped
+    fields = FIELDS if fields is None else fields
+    wanted = fields if patent_filter is None else set(fields).union(patent_filter.fields)
     # check bibliographic data format 
     try:
-        WKU = parsed.find(".//B110//PDAT").text
-        title = parsed.find(".//B540//PDAT").text
-        app_date = parsed.find(".//B220//PDAT").text
-        issue_date = parsed.find(".//B140//PDAT").text
+        WKU = parsed.find(".//B110//PDAT").text or ""
+        title = parsed.find(".//B540//PDAT").text or ""
+        app_date = parsed.find(".//B220//PDAT").text or ""
+        issue_date = parsed.find(".//B140//PDAT").text or ""
     except:
-        return ""         # write nothing / skip 
-    
-    # get Inventor(s)
-    xml_inventors = parsed.findall(".//B721//NAM")
-    inventors = []
-    for i in range(len(xml_inventors)):
-        first_name, last_name = xml_inventors[i].find(".//FNM//PDAT"), xml_inventors[i].find(".//SNM//PDAT")
-        inventor = "{} {}".format(first_name.text if first_name is not None else "", last_name.text if last_name is not None else "")
-        inventors.append(inventor)
-    inventors = ";".join(inventors) if inventors else ""
+        count_skipped()
+        return None         # write nothing / skip 
     
     # get Assignee(s)
-    xml_assignees = parsed.findall(".//B731//NAM")
+    xml_assignees = parsed.findall(".//B731//NAM") if "Assignee" in wanted else []
     assignees = []
     if xml_assignees:
         for i in range(len(xml_assignees)):
             assignee = xml_assignees[i].find(".//ONM//PDAT")
             if assignee is None:
                 first_name, last_name = xml_assignees[i].find(".//FNM//PDAT"), xml_assignees[i].find(".//SNM/PDAT")
-                assignee = "{} {}".format(first_name.text if first_name is not None else "", last_name.text if last_name is not None else "")
+                assignee = "{} {}".format(_text(first_name), _text(last_name))
             else:
-                assignee = assignee.text
+                assignee = _text(assignee)
             assignees.append(assignee)
-    assignees = ";".join(assignees) if assignees else ""
     
     # get ICL Class(es)
-    icl_class = parsed.findall(".//B511/PDAT")
+    icl_class = parsed.findall(".//B511/PDAT") if "ICL_Class" in wanted else []
     if icl_class:
         for i in range(len(icl_class)):
-            icl_class[i] = icl_class[i].text
-    icl_class = ";".join(icl_class) if icl_class else ""
+            icl_class[i] = _text(icl_class[i])
+    
+    # check filter before the remaining fields are searched for
+    if patent_filter is not None and not patent_filter.matches(issue_date, icl_class, assignees):
+        count_skipped()
+        return None         # write nothing / skip
+    
+    # get Inventor(s)
+    xml_inventors = parsed.findall(".//B721//NAM") if "Inventor" in fields else []
+    inventors = []
+    for i in range(len(xml_inventors)):
+        first_name, last_name = xml_inventors[i].find(".//FNM//PDAT"), xml_inventors[i].find(".//SNM//PDAT")
+        inventor = "{} {}".format(_text(first_name), _text(last_name))
+        inventors.append(inventor)
     
     # get Ref(s)
-    xml_references = parsed.findall(".//PCIT")
+    xml_references = parsed.findall(".//PCIT") if "References" in fields else []
     references = []
     if xml_references:
         for i in range(len(xml_references)): 
             if xml_references[i].find(".//CTRY") is None:
-                ref = xml_references[i].find(".//DNUM//PDAT").text
-                if ref is not None:
+                ref = _text(xml_references[i].find(".//DNUM//PDAT"))
+                if ref:
                     references.append(ref)
-    references = ";".join(references) if references else ""
     
     # get Claims
-    claims = parsed.findall(".//CL//CLM//PDAT")
+    claims = parsed.findall(".//CL//CLM//PDAT") if "Claims" in fields else []
     for i in range(len(claims)):
-        claims[i] = claims[i].text if claims[i].text else ""
-    claims = "".join(claims).replace("\"", "") if claims else ""
-    return "\"{}\",\"{}\",\"{}\",\"{}\",\"{}\",\"{}\",\"{}\",\"{}\",\"{}\"\n".format(WKU, title, app_date, issue_date, inventors, assignees, icl_class, references, claims)
+        claims[i] = _text(claims[i])
+    claims = "".join(claims) if claims else ""
+    record = (WKU, title, app_date, issue_date, inventors, assignees, icl_class, references, claims)
+    return tuple(value for name, value in zip(FIELDS, record) if name in fields)
 
 
-def xml1_to_df(input_file, output_file, append, header):
+def xml1_to_df(input_file, output_file, append, header, engine = "native", fields = None, filter = None,
+               with_rows = False):
     """Function that takes USPTO (2002-2004) data from XML file, extracts pertinent fields, 
     and creates (or appends to) CSV output.
 
     Args: 
-        input_file:  `string`, path of '.xml' file to read data from
+        input_file:  `string`, path of '.xml' file to read data from, or binary file-like object 
+            (e.g. from ``utility.open_zip_member()``) to stream data from
         output_file: `string`, path of '.csv' file to store data
         append:  `bool`, open and writes to output_file in append mode if ``true``
         header: `bool`, prints header as first line to csv output_file if ``true``
+        engine: `string`, ``"native"`` (default) converts files with the C++ ``convert_funcs.xml1_to_df``; 
+            ``"python"`` parses each document with lxml. Both give the same output (documents with 
+            broken markup, e.g. mismatched or unclosed tags, are parsed with lxml by either engine); 
+            file-like `input_file` always uses ``"python"``.
+        fields: `list`, columns (of ``utility.FIELDS``) to extract and write, all if ``None``; other 
+            columns are not searched for
+        filter: `dict` or ``utility.PatentFilter``, conditions patents have to meet to be written; 
+            rejected patents are not searched beyond the fields the conditions look at
+        with_rows: `bool`, also return the number of rows written if ``true``
     
     Returns:
-        `int` -- number of patents read from XML file
+        `int` -- number of patents read from XML file (including those filtered out); with `with_rows`, 
+        a `tuple` of it and the number of rows written
     """
-    write_mode = 'a' if append else 'w'
-    with open(input_file, 'rb') as f1, open (output_file, write_mode, encoding='utf-8') as f2:
-        if header:
-            f2.write("WKU,Title,App_Date,Issue_Date,Inventor,Assignee,ICL_Class,References,Claims\n")
+    if engine not in ("native", "python"):
+        raise ValueError('`engine` parameter must be "native" or "python"; current value = {}'.format(engine))
+    fields, patent_filter = check_fields(fields), check_filter(filter)
+    if engine == "native" and isinstance(input_file, str):
+        return native_xml1_to_df(input_file, output_file, append, header, fields, patent_filter, with_rows)
 
-        # initialize vars and parser
-        currLine = f1.readline()
-        parser = etree.XMLParser(recover=True)        # ignore escaped characters for now, add recognization later
-        countPat, inPatent = 0, False
-        while currLine:
-            # check if closing patent tag
-            if currLine[0:8] == b'</PATDOC' and inPatent:
-                parser.feed(currLine.decode("utf-8", "replace"))
-                parsed = parser.close()
-                f2.write(extractFields1(parsed))
-                parser = etree.XMLParser(recover=True)
-                inPatent = False
-            elif currLine[0:7] == b'<PATDOC':
-                inPatent = True
-                countPat += 1
-            if inPatent:
-                parser.feed(currLine.decode("utf-8", "replace"))
-                
-            currLine = f1.readline()   
+    with open_input(input_file) as f1, CsvWriter(output_file, append, header, fields) as f2:
+        countPat, batch = 0, []
+        for parsed in _xml1_documents(f1):
+            countPat += 1
+            record = extractRecord1(parsed, fields, patent_filter)
+            if record is not None:
+                batch.append(record)
+            if len(batch) == CSV_BATCH:
+                f2.write_rows(batch)
+                batch.clear()
+        f2.write_rows(batch)
+    return (countPat, f2.rows) if with_rows else countPat
+
+
+def iter_xml1_records(input_file, fields = None, filter = None):
+    """Generator over the patents in a USPTO (2002-2004) XML file.
+
+    Args:
+        input_file:  `string`, path of '.xml' file, or binary file-like object to read data from
+        fields: `list`, columns (of ``utility.FIELDS``) to extract, all if ``None``
+        filter: `dict` or ``utility.PatentFilter``, conditions patents have to meet to be yielded
+
+    Yields:
+        `tuple` -- requested fields of one patent in ``utility.FIELDS`` order; Inventor, Assignee, 
+        ICL_Class and References are lists. Patents without bibliographic data are skipped.
+    """
+    fields, patent_filter = check_fields(fields), check_filter(filter)
+    with open_input(input_file) as f1:
+        for parsed in _xml1_documents(f1):
+            record = extractRecord1(parsed, fields, patent_filter)
+            if record is not None:
+                yield record
+
+
+def _xml1_row(document, fields = None, patent_filter = None):
+    # CSV row of a single <PATDOC> (`bytes` of its lines) parsed with lxml, "" if skipped; the native engine
+    # hands over documents with markup its parser does not recover the way lxml does
+    parsed, = _xml1_documents(BytesIO(document))
+    return extractFields1(parsed, fields, patent_filter)
+
+
+def _xml1_documents(f1):
+    # yields each <PATDOC> in the file as a parsed tree
+    # initialize vars and parser
+    currLine = f1.readline()
+    parser = etree.XMLParser(recover=True)        # ignore escaped characters for now, add recognization later
+    inPatent = False
+    while currLine:
+        # check if closing patent tag
+        if currLine[0:8] == b'</PATDOC' and inPatent:
+            parser.feed(currLine.decode("utf-8", "replace"))
+            yield parser.close()
+            parser = etree.XMLParser(recover=True)
+            inPatent = False
+        elif currLine[0:7] == b'<PATDOC':
+            inPatent = True
+        if inPatent:
+            parser.feed(currLine.decode("utf-8", "replace"))
             
-    return countPat
\ No newline at end of file
+        currLine = f1.readline()
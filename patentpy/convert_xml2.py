@@ -1,133 +1,332 @@
 # test with multiple years, weeks data v4+
 import sys, traceback, datetime
 import urllib.request, shutil, zipfile, re
+from functools import lru_cache
 from os import remove
 from lxml import etree
 from io import BytesIO
 import pandas as pd
+from convert_funcs import CsvWriter
 
-from patentpy.utility import get_file_name
+from patentpy.stats import count_skipped
+from patentpy.utility import get_file_name, open_input, format_csv_row, check_fields, check_filter, CSV_BATCH
 
-def extractFields2(parsed):
-    # process current patent
-    # check if bibliographic is in the right format
-    try:
-        WKU = parsed.find(".//publication-reference//document-id//doc-number").text
-        title = parsed.find(".//invention-title").text
-        app_date = parsed.find(".//application-reference//date").text
-        issue_date = parsed.find(".//publication-reference//date").text
-    except:
-        return ""       # write nothing and skip patent/extra text (i.e. dna/rna sequence)
+# tags of the outermost element of every path `extractFields2()` queries; collected in a single pass
+TAGS2 = ("publication-reference", "application-reference", "invention-title", "applicants", "us-parties",
+         "assignees", "classification-ipc", "classification-locarno", "classification-ipcr", "patcit", "claims")
+
+# tags (of ``TAGS2``) each column's queries start from; WKU and dates are always looked up, as they decide
+# whether a document is a patent
+FIELD_TAGS2 = {"WKU": ("publication-reference",), "Title": ("invention-title",),
+               "App_Date": ("application-reference",), "Issue_Date": ("publication-reference",),
+               "Inventor": ("applicants", "us-parties"), "Assignee": ("assignees",),
+               "ICL_Class": ("classification-ipc", "classification-locarno", "classification-ipcr"),
+               "References": ("patcit",), "Claims": ("claims",)}
+
+def find_elements2(parsed, tags = TAGS2):
+    """Collects, in one pass over the tree, the elements ``extractFields2()`` starts its queries from.
+
+    Queries are then finished inside these (small) subtrees, so large parts of the document such as the 
+    description are only visited once.
+
+    Args:
+        parsed: root element of a parsed patent.
+        tags (tuple of str, default ``TAGS2``): tags to collect, e.g. only those of the requested columns.
+
+    Returns:
+        dict: maps each tag in ``tags`` to the list of matching elements in document order
+    """
+    found = {tag: [] for tag in tags}
+    for element in parsed.iter(*tags):
+        if element is not parsed:
+            found[element.tag].append(element)
+    return found
+
+def _path(elements, *tags):
+    # continues ElementPath ".//anchor//tag1//tag2" from the anchor `elements`, yielding matches in the same order
+    if not tags:
+        yield from elements
+        return
+    for element in elements:
+        for descendant in element.iterdescendants(tags[0]):
+            yield from _path((descendant,), *tags[1:])
+
+def _find(element, *tags):
+    # same as `element.find(".//tag1//tag2")`
+    if len(tags) == 1:
+        return next(element.iterdescendants(tags[0]), None)
+    return next(_path((element,), *tags), None)
+
+def _text(element):
+    # text of an element, "" if it is empty or missing (as written by every engine)
+    return element.text or "" if element is not None else ""
+
+def _wku2(parsed, found):
+    return next(_path(found["publication-reference"], "document-id", "doc-number")).text or ""
 
-    # get Inventor(s)
-    xml_inventors = (parsed.findall(".//applicants//applicant//addressbook") or 
-                 parsed.findall(".//us-parties//inventors//inventor//addressbook"))
+def _title2(parsed, found):
+    return found["invention-title"][0].text or ""
+
+def _app_date2(parsed, found):
+    return next(_path(found["application-reference"], "date")).text or ""
+
+def _issue_date2(parsed, found):
+    return next(_path(found["publication-reference"], "date")).text or ""
+
+def _inventors2(parsed, found):
+    xml_inventors = (list(_path(found["applicants"], "applicant", "addressbook")) or 
+                     list(_path(found["us-parties"], "inventors", "inventor", "addressbook")))
     inventors = []
-    if xml_inventors:
-        for i in range(len(xml_inventors)):
-            first_name, last_name = xml_inventors[i].find(".//first-name"), xml_inventors[i].find(".//last-name")
-            inventor = "{} {}".format(first_name.text if first_name is not None else "", last_name.text if last_name is not None else "")
-            inventors.append(inventor)
-    inventors = ";".join(inventors) if inventors else ""
-
-    # get Assignee(s)
-    xml_assignees = parsed.findall(".//assignees//assignee")
+    for xml_inventor in xml_inventors:
+        first_name, last_name = _find(xml_inventor, "first-name"), _find(xml_inventor, "last-name")
+        inventor = "{} {}".format(_text(first_name), _text(last_name))
+        inventors.append(inventor)
+    return inventors
+
+def _assignees2(parsed, found):
     assignees = []
-    if xml_assignees:
-        for i in range(len(xml_assignees)):
-            assignee = xml_assignees[i].find(".//addressbook//orgname")
-            if assignee is None:
-                first_name, last_name = xml_assignees[i].find(".//first-name"), xml_assignees[i].find(".//last-name")
-                assignee = "{} {}".format(first_name.text if first_name is not None else "", last_name.text if last_name is not None else "")
-            else:
-                assignee = assignee.text
-            assignees.append(assignee)
-    assignees = ";".join(assignees) if assignees else ""
+    for xml_assignee in _path(found["assignees"], "assignee"):
+        assignee = _find(xml_assignee, "addressbook", "orgname")
+        if assignee is None:
+            first_name, last_name = _find(xml_assignee, "first-name"), _find(xml_assignee, "last-name")
+            assignee = "{} {}".format(_text(first_name), _text(last_name))
+        else:
+            assignee = _text(assignee)
+        assignees.append(assignee)
+    return assignees
 
-    # get ICL_class(es) - locarno or ipc format
-    icl_class = (parsed.findall(".//classification-ipc//main-classification") or 
-                 parsed.findall(".//classification-locarno//main-classification"))
+def _icl_class2(parsed, found):
+    # locarno or ipc format
+    icl_class = (list(_path(found["classification-ipc"], "main-classification")) or 
+                 list(_path(found["classification-locarno"], "main-classification")))
     if icl_class:
-        for i in range(len(icl_class)):
-            icl_class[i] = icl_class[i].text
+        icl_class = [_text(icl) for icl in icl_class]
     else:
         # ipcr format
-        icl_class = parsed.findall(".//classification-ipcr")
-        for i in range(len(icl_class)):
-            icl_components = [icl_class[i].find(".//section"), icl_class[i].find(".//class"), 
-                              icl_class[i].find(".//subclass"), icl_class[i].find(".//main-group"),
-                              icl_class[i].find(".//subgroup")]
-            icl_class[i] = "{}{}{} {}{}".format(*[j.text if j is not None else "" for j in icl_components])
-    icl_class = ";".join(icl_class) if icl_class else ""
-
-    # get Refs
-    all_references = parsed.findall(".//patcit")
+        icl_class = []
+        for ipcr in found["classification-ipcr"]:
+            icl_components = [_find(ipcr, "section"), _find(ipcr, "class"), _find(ipcr, "subclass"),
+                              _find(ipcr, "main-group"), _find(ipcr, "subgroup")]
+            icl_class.append("{}{}{} {}{}".format(*[_text(j) for j in icl_components]))
+    return icl_class
+
+def _references2(parsed, found):
     references = []
-    if all_references:
-        for i in range(len(all_references)): 
-            if all_references[i].find(".//country").text == "US":
-                references.append(all_references[i].find(".//doc-number").text)
-    references = ";".join(references) if references else ""
-
-
-    # get Claims
-    claims = parsed.findall(".//claims//claim//claim-text")
-    for i in range(len(claims)):
-        claim_txt = claims[i].text if claims[i].text else ""
-        claim_ref = claims[i].find(".//claim-ref")
-        if claim_ref is not None:
-            claim_ref_txt = claim_ref.text if claim_ref.text else ""
-            claim_ref_tail = claim_ref.tail if claim_ref.tail else ""
-            claim_txt += claim_ref_txt + claim_ref_tail
-        claims[i] = claim_txt
-    claims = "".join(claims).replace("\"", "") if claims else ""
-
-    return "\"{}\",\"{}\",\"{}\",\"{}\",\"{}\",\"{}\",\"{}\",\"{}\",\"{}\"\n".format(WKU, title, app_date, issue_date, inventors, assignees, icl_class, references, claims)
-        
-
-def xml2_to_df(input_file, output_file, append, header):
+    for reference in found["patcit"]:
+        # first country and doc-number of each citation, in one pass
+        country = doc_number = None
+        for element in reference.iterdescendants("country", "doc-number"):
+            if element.tag == "country":
+                country = element if country is None else country
+            else:
+                doc_number = element if doc_number is None else doc_number
+            if country is not None and doc_number is not None:
+                break
+        if country.text == "US":
+            references.append(doc_number.text or "")
+    return references
+
+def _claims2(parsed, found):
+    # each claim-text contributes its text plus the text and tail of its first claim-ref;
+    # both are picked up in one pass over each claim
+    claims = []
+    for claim in _path(found["claims"], "claim"):
+        waiting = {}        # claim-text elements (still without a claim-ref) -> index in `claims`
+        for element in claim.iterdescendants("claim-text", "claim-ref"):
+            if element.tag == "claim-text":
+                waiting[element] = len(claims)
+                claims.append(element.text if element.text else "")
+                continue
+            claim_ref_txt = (element.text if element.text else "") + (element.tail if element.tail else "")
+            for parent in element.iterancestors():
+                if parent is claim:
+                    break
+                i = waiting.pop(parent, None)
+                if i is not None:
+                    claims[i] += claim_ref_txt
+    return "".join(claims) if claims else ""
+
+# (column, extractor) pairs in CSV column order; each extractor takes (parsed, find_elements2(parsed))
+# and multi-valued columns are returned as lists
+FIELDS2 = [("WKU", _wku2), ("Title", _title2), ("App_Date", _app_date2), ("Issue_Date", _issue_date2),
+           ("Inventor", _inventors2), ("Assignee", _assignees2), ("ICL_Class", _icl_class2),
+           ("References", _references2), ("Claims", _claims2)]
+FIELDS2_NAMES = [name for name, _ in FIELDS2]
+EXTRACTORS2 = dict(FIELDS2)
+
+@lru_cache(maxsize = None)
+def _tags2(fields):
+    # tags `find_elements2()` has to collect for the columns `fields` (a tuple from `check_fields()`)
+    needed = {tag for field in ("WKU", "Title", "App_Date", "Issue_Date") + fields for tag in FIELD_TAGS2[field]}
+    return tuple(tag for tag in TAGS2 if tag in needed)
+
+def extractFields2(parsed, fields = None, patent_filter = None):
+    # process current patent and format as CSV row
+    record = extractRecord2(parsed, fields, patent_filter)
+    return format_csv_row(record) if record is not None else ""
+
+
+def extractRecord2(parsed, fields = None, patent_filter = None):
+    # process current patent; multi-valued fields are returned as lists, only `fields` are extracted
+    # and patents `patent_filter` rejects are skipped
+    fields = tuple(FIELDS2_NAMES) if fields is None else fields
+    found = find_elements2(parsed, _tags2(fields if patent_filter is None else fields + patent_filter.fields))
+    # check if bibliographic is in the right format
+    try:
+        values = {"WKU": _wku2(parsed, found), "Title": _title2(parsed, found),
+                  "App_Date": _app_date2(parsed, found), "Issue_Date": _issue_date2(parsed, found)}
+    except:
+        count_skipped()
+        return None       # write nothing and skip patent/extra text (i.e. dna/rna sequence)
+
+    # check filter before the remaining fields are extracted
+    if patent_filter is not None:
+        for name in patent_filter.fields:
+            if name not in values:
+                values[name] = EXTRACTORS2[name](parsed, found)
+        if not patent_filter.matches(values["Issue_Date"], values.get("ICL_Class"), values.get("Assignee")):
+            count_skipped()
+            return None
+
+    return tuple(values[name] if name in values else extract(parsed, found)
+                 for name, extract in FIELDS2 if name in fields)
+
+
+def split_documents(f, chunk_size = 1 << 20):
+    """Splits a stream of concatenated XML documents (as in USPTO weekly files) into single documents.
+
+    Reads ``f`` in blocks of ``chunk_size`` bytes and cuts it wherever a line starts with an XML 
+    declaration, so no per-line Python work is done.
+
+    Args:
+        f: binary file-like object to read from.
+        chunk_size (int, default 1 MiB): number of bytes read at a time.
+
+    Yields:
+        bytes: one XML document, starting with its XML declaration
+    """
+    marker = b'\n<?xml version="1.0"'
+    buf = bytearray()
+    search_from = 0
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        buf += chunk
+        # cut off every complete document in the buffer
+        pos = buf.find(marker, search_from)
+        while pos != -1:
+            yield bytes(buf[:pos + 1])
+            del buf[:pos + 1]
+            pos = buf.find(marker, 1)
+        # marker may straddle the next chunk
+        search_from = max(0, len(buf) - len(marker))
+    if buf.strip():
+        yield bytes(buf)
+
+
+def xml2_to_df(input_file, output_file, append, header, engine = "split", fields = None, filter = None,
+               with_rows = False):
     """Function that takes USPTO (2005-`present`) data from XML file, extracts pertinent fields, 
     and creates (or appends to) CSV output.
 
     Args: 
-        input_file:  `string`, path of '.xml' file to read data from
+        input_file:  `string`, path of '.xml' file to read data from, or binary file-like object 
+            (e.g. from ``utility.open_zip_member()``) to stream data from
         output_file: `string`, path of '.csv' file to store data
         append:  `bool`, open and writes to output_file in append mode if ``true``
         header: `bool`, prints header as first line to csv output_file if ``true``
+        engine: `string`, ``"split"`` (default) cuts the file into documents with ``split_documents()`` 
+            and parses each with ``etree.fromstring``; ``"feed"`` feeds the file line by line to an 
+            incremental parser. Both give the same output.
+        fields: `list`, columns (of ``utility.FIELDS``) to extract and write, all if ``None``; other 
+            columns are not searched for
+        filter: `dict` or ``utility.PatentFilter``, conditions patents have to meet to be written; 
+            rejected patents are not searched beyond the fields the conditions look at
+        with_rows: `bool`, also return the number of rows written if ``true``
     
     Returns:
-        `int` -- number of patents read from XML file
+        `int` -- number of patents read from XML file (including those filtered out); with `with_rows`, 
+        a `tuple` of it and the number of rows written
     """
-    write_mode = 'a' if append else 'w'
-    with open(input_file, 'rb') as f1, open (output_file, write_mode, encoding='utf-8') as f2:
-        if header:
-            f2.write("WKU,Title,App_Date,Issue_Date,Inventor,Assignee,ICL_Class,References,Claims\n")
+    if engine not in ("split", "feed"):
+        raise ValueError('`engine` parameter must be "split" or "feed"; current value = {}'.format(engine))
+    fields, patent_filter = check_fields(fields), check_filter(filter)
+    with open_input(input_file) as f1, CsvWriter(output_file, append, header, fields) as f2:
+        countPat, batch = 0, []
+        for parsed, is_patent in _xml2_documents(f1, engine):
+            countPat += is_patent
+            record = extractRecord2(parsed, fields, patent_filter)
+            if record is not None:
+                batch.append(record)
+            if len(batch) == CSV_BATCH:
+                f2.write_rows(batch)
+                batch.clear()
+        f2.write_rows(batch)
+    return (countPat, f2.rows) if with_rows else countPat
 
-        # skip first two lines
-        f1.readline()
-        f1.readline()
 
-        # initialize vars and parser
-        currLine = f1.readline()
-        parser = etree.XMLParser()
-        countPat = 1
-        while currLine:
-            # each new xml within file
-            if currLine[0:19] == b'<?xml version="1.0"':
-                # skip line
-                if f1.readline()[0:19] == b'<!DOCTYPE us-patent':
-                    countPat += 1
-
-                # reset params
-                parsed = parser.close()
-                f2.write(extractFields2(parsed))
-                parser = etree.XMLParser()
-            else:
-                parser.feed(currLine)
+def iter_xml2_records(input_file, engine = "split", fields = None, filter = None):
+    """Generator over the patents in a USPTO (2005-`present`) XML file.
+
+    Args:
+        input_file:  `string`, path of '.xml' file, or binary file-like object to read data from
+        engine: `string`, ``"split"`` (default) or ``"feed"``, see ``xml2_to_df()``
+        fields: `list`, columns (of ``utility.FIELDS``) to extract, all if ``None``
+        filter: `dict` or ``utility.PatentFilter``, conditions patents have to meet to be yielded
+
+    Yields:
+        `tuple` -- requested fields of one patent in ``utility.FIELDS`` order; Inventor, Assignee, 
+        ICL_Class and References are lists. Documents without bibliographic data are skipped.
+    """
+    if engine not in ("split", "feed"):
+        raise ValueError('`engine` parameter must be "split" or "feed"; current value = {}'.format(engine))
+    fields, patent_filter = check_fields(fields), check_filter(filter)
+    with open_input(input_file) as f1:
+        for parsed, _ in _xml2_documents(f1, engine):
+            record = extractRecord2(parsed, fields, patent_filter)
+            if record is not None:
+                yield record
+
+
+def _xml2_documents(f1, engine):
+    # yields (parsed tree, whether it is a us-patent document) for each document in the file
+    if engine == "feed":
+        yield from _xml2_feed(f1)
+        return
 
-            currLine = f1.readline()
+    for document in split_documents(f1):
+        # skip xml declaration and doctype lines
+        declaration_end = document.find(b'\n') + 1
+        doctype_end = document.find(b'\n', declaration_end) + 1
+        is_patent = document[declaration_end:declaration_end + 19] == b'<!DOCTYPE us-patent'
+        # each document's tree is freed once its fields are extracted
+        yield etree.fromstring(document[doctype_end:], etree.XMLParser()), is_patent
+
+
+def _xml2_feed(f1):
+    # line by line engine for `xml2_to_df()`
+    # skip first two lines
+    f1.readline()
+    f1.readline()
+
+    # initialize vars and parser
+    currLine = f1.readline()
+    parser = etree.XMLParser()
+    is_patent = True
+    while currLine:
+        # each new xml within file
+        if currLine[0:19] == b'<?xml version="1.0"':
+            # reset params
+            yield parser.close(), is_patent
+            parser = etree.XMLParser()
+
+            # skip line
+            is_patent = f1.readline()[0:19] == b'<!DOCTYPE us-patent'
+        else:
+            parser.feed(currLine)
+
+        currLine = f1.readline()
 
-        # get last patent
-        parsed = parser.close()
-        f2.write(extractFields2(parsed))
-    return countPat
\ No newline at end of file
+    # get last patent
+    yield parser.close(), is_patent
@@ -0,0 +1,102 @@
+# SQLite output of converted patent data, as the normalized tables of `patentpy.tables`
+import sqlite3
+
+from patentpy.tables import TABLES, table_columns
+
+# secondary indexes (name: (table, column)), built once all weeks are loaded; WKU is each table's primary key
+INDEXES = {
+    "patents_issue_date": ("patents", "Issue_Date"),
+    "classifications_icl_class": ("classifications", "ICL_Class"),
+    "citations_citation": ("citations", "Citation"),
+}
+
+
+def _create_statements(columns):
+    # CREATE TABLE statements of the tables `columns` (from `table_columns()`); multi-valued tables are keyed
+    # by (WKU, Position), the position of the value within its patent
+    for name, table in columns.items():
+        if name == "patents":
+            body = ", ".join(["WKU TEXT PRIMARY KEY"] + ["{} TEXT".format(column) for column in table[1:]])
+            yield "CREATE TABLE IF NOT EXISTS patents ({})".format(body)
+        else:
+            yield ("CREATE TABLE IF NOT EXISTS {} (WKU TEXT NOT NULL, Position INTEGER NOT NULL, {} TEXT, "
+                   "PRIMARY KEY (WKU, Position)) WITHOUT ROWID".format(name, table[1]))
+
+
+def _positions(rows):
+    # (WKU, position, value) rows from (WKU, value) rows; values are numbered per WKU in order, also if the
+    # rows of a WKU are not consecutive (e.g. a patent that appears twice in a week)
+    positions = {}
+    for wku, value in rows:
+        position = positions.get(wku, 0)
+        positions[wku] = position + 1
+        yield wku, position, value
+
+
+def _schema(columns):
+    # columns of the database tables of `columns` (from `table_columns()`)
+    return {name: table if name == "patents" else ["WKU", "Position", table[1]] for name, table in columns.items()}
+
+
+class SQLiteOutput:
+    """Loads the normalized tables of each week into a SQLite database.
+
+    Each week is written in a single transaction with one ``executemany`` per table. Patents are upserted
+    (on WKU) and the multi-valued rows of a re-loaded patent replace its earlier ones, so loading a week
+    again leaves the database as if it was loaded once. The database uses WAL journaling; secondary
+    indexes (``INDEXES``) are created when the output is closed, i.e. after the bulk load.
+
+    Args:
+        output_file (str): path of the database; created if missing, added to otherwise.
+        fields (list, default None): requested columns, all if ``None``.
+
+    Raises:
+        ValueError:
+            If the database already holds tables of another selection of `fields`.
+    """
+    def __init__(self, output_file, fields = None):
+        self.columns = table_columns(fields)
+        self.connection = sqlite3.connect(output_file, isolation_level = None)
+        existing = {name: [row[1] for row in self.connection.execute("PRAGMA table_info({})".format(name))]
+                    for name in TABLES}
+        existing = {name: columns for name, columns in existing.items() if columns}
+        if existing and existing != _schema(self.columns):
+            self.connection.close()
+            raise ValueError("`fields` parameter must select the columns of existing database {}; database tables = {}, "
+                             "current value = {}".format(output_file, existing, fields))
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        for statement in _create_statements(self.columns):
+            self.connection.execute(statement)
+
+        patents = self.columns["patents"]
+        updates = ", ".join("{0} = excluded.{0}".format(column) for column in patents[1:])
+        self.upsert = "INSERT INTO patents ({}) VALUES ({}) ON CONFLICT (WKU) DO {}".format(
+            ", ".join(patents), ", ".join("?" * len(patents)), "UPDATE SET " + updates if updates else "NOTHING")
+
+    def write(self, rows):
+        """Writes the rows of one week (from ``tables.records_to_rows()``) in one transaction."""
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN")
+        try:
+            cursor.executemany(self.upsert, rows["patents"])
+            wkus = [(row[0],) for row in rows["patents"]]
+            for name in self.columns:
+                if name == "patents":
+                    continue
+                cursor.executemany("DELETE FROM {} WHERE WKU = ?".format(name), wkus)
+                cursor.executemany("INSERT OR REPLACE INTO {} VALUES (?, ?, ?)".format(name), _positions(rows[name]))
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        """Builds the secondary indexes of the loaded tables and closes the database."""
+        try:
+            for index, (table, column) in INDEXES.items():
+                if table in self.columns and column in self.columns[table]:
+                    self.connection.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(index, table, column))
+            self.connection.execute("PRAGMA optimize")
+        finally:
+            self.connection.close()
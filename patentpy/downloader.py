@@ -0,0 +1,245 @@
+import os, re, time, threading, http.client
+from io import BytesIO
+from urllib.parse import urlsplit, urljoin
+from urllib.error import HTTPError
+from concurrent.futures import ThreadPoolExecutor
+
+from patentpy.utility import download_zip, fetch_zip
+
+
+class Downloader:
+    """Thread pool that downloads USPTO zip files over persistent HTTP connections.
+
+    Each pool thread keeps one keep-alive connection per host, so consecutive weeks from the same
+    server reuse connections instead of opening a new one per file. Failed transfers (connection
+    errors, truncated bodies and 5xx responses) are retried with exponential backoff, resuming
+    from the bytes already received with an HTTP ``Range`` request when the server supports it. A
+    partial response that does not start at the requested byte restarts the download from scratch.
+    Urls that are not http(s) (e.g. a local ``file://`` mirror) are read with ``urllib`` instead.
+
+    Args:
+        max_connections (int, default 2): maximum number of concurrent downloads (and of open
+            connections per host).
+        max_rate (int, default None): combined bandwidth limit of all downloads in bytes per
+            second, ``None`` for no limit.
+        retries (int, default 3): number of times a failed download is retried.
+        timeout (float, default 60): socket timeout in seconds.
+        backoff (float, default 1): seconds to wait before the first retry, doubled on each further one.
+
+    Raises:
+        ValueError:
+            If ``max_connections`` is not a positive integer, ``max_rate`` is not positive or
+            ``None``, or ``retries`` is negative.
+    """
+    chunk_size = 1 << 16
+    max_redirects = 5
+
+    def __init__(self, max_connections = 2, max_rate = None, retries = 3, timeout = 60, backoff = 1):
+        if not isinstance(max_connections, int) or isinstance(max_connections, bool) or max_connections < 1:
+            raise ValueError("`max_connections` parameter must be a positive integer; current value = {}"
+                             .format(max_connections))
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError("`max_rate` parameter must be positive or None; current value = {}".format(max_rate))
+        if not isinstance(retries, int) or retries < 0:
+            raise ValueError("`retries` parameter must be a non-negative integer; current value = {}".format(retries))
+        self.max_connections = max_connections
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self._limiter = _RateLimiter(max_rate) if max_rate else None
+        self._local = threading.local()
+        self._connections = []          # all open connections, closed by `close()`
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers = max_connections, thread_name_prefix = "patentpy-download")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedules ``fn(*args, **kwargs)`` on the download pool and returns its ``Future``.
+
+        ``fn`` typically calls ``download()`` or ``fetch()``, which then run on (and reuse the
+        connections of) a pool thread.
+        """
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def download(self, url, dest_file):
+        """Downloads ``url`` to ``dest_file``.
+
+        The data is written to ``dest_file + '.part'`` and renamed once complete; the '.part' file is
+        removed if the download fails.
+
+        Args:
+            url (str): url of file to download.
+            dest_file (str): path to store the file at.
+
+        Returns:
+            string: ``dest_file``
+
+        Raises:
+            HTTPError:
+                If the server answers with a 4xx status, or a 5xx status after all retries.
+            OSError:
+                If the download still fails after all retries.
+        """
+        if urlsplit(url).scheme not in ("http", "https"):
+            download_zip(url, dest_file)
+            return dest_file
+
+        part_file = dest_file + ".part"
+        try:
+            with open(part_file, 'w+b') as output_file:
+                self._retrieve(url, output_file)
+            os.replace(part_file, dest_file)
+        finally:
+            if os.path.exists(part_file):
+                os.remove(part_file)
+        return dest_file
+
+    def fetch(self, url):
+        """Downloads ``url`` into memory.
+
+        Args:
+            url (str): url of file to download.
+
+        Returns:
+            BytesIO: in-memory copy of the file, rewound to the start
+
+        Raises:
+            HTTPError:
+                If the server answers with a 4xx status, or a 5xx status after all retries.
+            OSError:
+                If the download still fails after all retries.
+        """
+        if urlsplit(url).scheme not in ("http", "https"):
+            return fetch_zip(url)
+
+        data = BytesIO()
+        self._retrieve(url, data)
+        data.seek(0)
+        return data
+
+    def close(self):
+        """Cancels pending downloads, waits for running ones and closes all connections."""
+        self._executor.shutdown(wait = True, cancel_futures = True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    def _retrieve(self, url, output_file):
+        # append `url` to the seekable `output_file`, resuming from its current size after failures
+        attempt = 0
+        while True:
+            try:
+                self._request(url, output_file)
+                return
+            except HTTPError as e:
+                if e.code < 500 or attempt >= self.retries:
+                    raise
+            except (OSError, http.client.HTTPException):
+                if attempt >= self.retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def _request(self, url, output_file):
+        for _ in range(self.max_redirects + 1):
+            offset = output_file.seek(0, os.SEEK_END)
+            headers = {"Range": "bytes={}-".format(offset)} if offset else {}
+            conn = self._connection(url)
+            try:
+                parts = urlsplit(url)
+                conn.request("GET", parts.path + ("?" + parts.query if parts.query else ""), headers = headers)
+                res = conn.getresponse()
+                if res.status in (301, 302, 303, 307, 308) and res.getheader("Location"):
+                    res.read()
+                    url = urljoin(url, res.getheader("Location"))
+                    continue
+                if res.status == 416 and offset:
+                    # range not satisfiable, e.g. the file changed on the server; start over
+                    res.read()
+                    output_file.seek(0)
+                    output_file.truncate()
+                    continue
+                if res.status not in (200, 206):
+                    res.read()
+                    raise HTTPError(url, res.status, res.reason, res.headers, None)
+                if res.status == 200 and offset:
+                    # server ignored the range, it sends the whole file again
+                    output_file.seek(0)
+                    output_file.truncate()
+                if res.status == 206 and _range_start(res.getheader("Content-Range")) != offset:
+                    # part of the file other than the one requested; don't read it, start over
+                    self._drop_connection(url)
+                    output_file.seek(0)
+                    output_file.truncate()
+                    continue
+                self._copy(res, output_file)
+                if res.will_close:
+                    self._drop_connection(url)
+                return
+            except BaseException:
+                # connection is in an unknown state, don't reuse it
+                self._drop_connection(url)
+                raise
+        raise HTTPError(url, 310, "Too many redirects", None, None)
+
+    def _copy(self, res, output_file):
+        while True:
+            chunk = res.read(self.chunk_size)
+            if not chunk:
+                # connection closed before Content-Length bytes arrived
+                if res.length:
+                    raise http.client.IncompleteRead(b'', res.length)
+                return
+            output_file.write(chunk)
+            if self._limiter is not None:
+                self._limiter.wait(len(chunk))
+
+    def _connection(self, url):
+        # one persistent connection per thread and host
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        connections = self._local.__dict__.setdefault("connections", {})
+        if key not in connections:
+            conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            connections[key] = conn_class(parts.netloc, timeout = self.timeout)
+            with self._lock:
+                self._connections.append(connections[key])
+        return connections[key]
+
+    def _drop_connection(self, url):
+        # under the lock, as `close()` may be closing and clearing all connections meanwhile
+        parts = urlsplit(url)
+        conn = self._local.__dict__.get("connections", {}).pop((parts.scheme, parts.netloc), None)
+        if conn is not None:
+            with self._lock:
+                conn.close()
+                if conn in self._connections:
+                    self._connections.remove(conn)
+
+
+def _range_start(content_range):
+    # first byte of a "bytes <first>-<last>/<size>" Content-Range header, None if missing or malformed
+    match = re.match(r"bytes\s+(\d+)-", content_range or "")
+    return int(match.group(1)) if match else None
+
+
+class _RateLimiter:
+    # shared bandwidth budget: each chunk pushes back the time the next one may be read
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self, size):
+        with self.lock:
+            now = time.monotonic()
+            self.next_time = max(self.next_time, now) + size / self.rate
+            delay = self.next_time - now
+        if delay > 0:
+            time.sleep(delay)
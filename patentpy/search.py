@@ -0,0 +1,261 @@
+# full-text search of the titles and claims of a store built by `patentpy.store.sync()`
+import os, re, csv, mmap
+from itertools import chain
+from os import path
+import numpy as np
+
+from patentpy.utility import week_files, write_npy
+
+# columns whose text is indexed
+TEXT_FIELDS = ["Title", "Claims"]
+# terms are lowercase runs of ASCII letters and digits, truncated to TERM_LENGTH bytes in the index
+TOKEN = re.compile(r"[0-9a-z]+")
+TERM_LENGTH = 24
+
+# term dictionary entry: term, and start and length of its posting list
+TERMS_DTYPE = np.dtype([("term", "S{}".format(TERM_LENGTH)), ("start", "<i8"), ("count", "<i4")])
+# document of the store-wide index: WKU, week file number, and offset and length of its row in the week file
+DOCS_DTYPE = np.dtype([("wku", "S16"), ("week", "<i4"), ("offset", "<i8"), ("length", "<i8")])
+# week file of the store-wide index: path in the store, year, and number of its first document
+WEEKS_DTYPE = np.dtype([("file", "S64"), ("year", "<i4"), ("first", "<i8")])
+
+# files of the store-wide index: lexicon of all terms, posting lists of document numbers, documents and week files
+TEXT_FILES = {name: "text_{}.npy".format(name) for name in ["postings", "docs", "weeks", "terms"]}
+
+
+def tokenize(text):
+    """Terms of `text`, in order (lowercase runs of ASCII letters and digits)."""
+    return TOKEN.findall(text.lower())
+
+
+def build_text_index(store_path):
+    """Builds the full-text index of a store, indexing the week files that are not indexed yet.
+
+    Every week file gets an index segment of its own: a sorted term dictionary (``<file>.terms.npy``) and
+    the posting lists it points into (``<file>.postings.npy``), each the sorted row numbers (within the
+    week file) of the patents whose title or claims contain the term. Row numbers are stored as 16-bit
+    integers when the week has fewer than 65536 patents, which is true of all USPTO weeks. Segments of
+    week files that are unchanged since they were indexed are kept, so only new weeks are tokenized as
+    the store grows; ``sync(..., text_index = True)`` calls this after converting weeks.
+
+    The segments are then merged into one store-wide index for ``TextIndex``: a lexicon of all terms
+    (``text_terms.npy``), their posting lists of document numbers (``text_postings.npy``), and the WKU,
+    week file and row of every document (``text_docs.npy``, ``text_weeks.npy``). Documents are numbered
+    in store order (by week, then row). The merge is only redone if a segment or the set of week files
+    changed; it holds all postings in memory once.
+
+    Args:
+        store_path (str): directory of the store.
+
+    Returns:
+        int: number of week files indexed
+    """
+    indexed = 0
+    files = week_files(store_path)
+    for week_file in files:
+        terms_path = week_file[:-4] + ".terms.npy"
+        if path.exists(terms_path) and path.getmtime(terms_path) >= path.getmtime(week_file):
+            continue
+        terms, postings = _text_segment(week_file)
+        # postings first, so an existing term dictionary always has its posting lists
+        write_npy(postings, week_file[:-4] + ".postings.npy")
+        write_npy(terms, terms_path)
+        indexed += 1
+
+    names = [path.relpath(week_file, store_path).replace(os.sep, "/").encode("utf-8") for week_file in files]
+    try:
+        current = np.load(path.join(store_path, TEXT_FILES["weeks"]))["file"].tolist() == names
+    except FileNotFoundError:
+        current = False
+    if indexed or not current or not path.exists(path.join(store_path, TEXT_FILES["terms"])):
+        _merge_segments(store_path, files, names)
+    return indexed
+
+
+def _merge_segments(store_path, files, names):
+    # store-wide lexicon, postings, documents and week files from the segments and row indexes of the week files
+    weeks = np.zeros(len(files), WEEKS_DTYPE)
+    segments, docs = [], []
+    for i, week_file in enumerate(files):
+        index = np.load(week_file[:-4] + ".idx.npy")
+        week_docs = np.empty(len(index), DOCS_DTYPE)
+        for field in ["wku", "offset", "length"]:
+            week_docs[field] = index[field]
+        week_docs["week"] = i
+        weeks[i] = (names[i], int(path.basename(path.dirname(week_file))), sum(len(x) for x in docs))
+        segments.append((np.load(week_file[:-4] + ".terms.npy"), np.load(week_file[:-4] + ".postings.npy")))
+        docs.append(week_docs)
+
+    # term numbers in the lexicon of every posting; a stable sort by term keeps each list in document order
+    if segments:
+        words = np.unique(np.concatenate([terms["term"] for terms, _ in segments]))
+        term_ids = np.concatenate([np.repeat(np.searchsorted(words, terms["term"]), terms["count"])
+                                   for terms, _ in segments])
+        doc_ids = np.concatenate([postings.astype("<u4") + np.uint32(first)
+                                  for (_, postings), first in zip(segments, weeks["first"])])
+    else:
+        words, term_ids, doc_ids = np.empty(0, TERMS_DTYPE["term"]), np.empty(0, "<i8"), np.empty(0, "<u4")
+    lexicon = np.empty(len(words), TERMS_DTYPE)
+    lexicon["term"] = words
+    lexicon["count"] = np.bincount(term_ids, minlength = len(words))
+    lexicon["start"] = np.cumsum(lexicon["count"]) - lexicon["count"]
+
+    # term dictionary last, so a complete set of files is in place once it is
+    write_npy(doc_ids[np.argsort(term_ids, kind = "stable")], path.join(store_path, TEXT_FILES["postings"]))
+    write_npy(np.concatenate(docs) if docs else np.empty(0, DOCS_DTYPE), path.join(store_path, TEXT_FILES["docs"]))
+    write_npy(weeks, path.join(store_path, TEXT_FILES["weeks"]))
+    write_npy(lexicon, path.join(store_path, TEXT_FILES["terms"]))
+
+
+def search(store_path, query, year_range = None):
+    """Finds the patents of a store whose title or claims match a boolean query.
+
+    Shorthand for ``TextIndex(store_path).search(query, year_range)``; keep a ``TextIndex`` to run
+    several queries against the same store.
+    """
+    return TextIndex(store_path).search(query, year_range)
+
+
+class TextIndex:
+    """Full-text index of a store, memory-mapped from the files of ``build_text_index()``.
+
+    The lexicon, posting lists and documents are mapped once, so a query costs a binary search per term
+    and reads only the posting lists of its terms, regardless of the number of week files.
+
+    Args:
+        store_path (str): directory of the store.
+
+    Raises:
+        FileNotFoundError:
+            If the store has no text index.
+    """
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.terms, self.postings, self.docs, self.weeks = (
+            np.load(path.join(store_path, TEXT_FILES[name]), mmap_mode = 'r')
+            for name in ["terms", "postings", "docs", "weeks"])
+
+    def search(self, query, year_range = None):
+        """Finds the patents whose title or claims match a boolean query.
+
+        The query is a list of terms, all of which have to occur (``AND`` between them is optional);
+        ``OR`` separates alternatives, e.g. ``semiconductor wafer OR "solar cell"``. A quoted phrase (or a
+        word like ``semi-conductor`` that consists of several terms) has to occur as consecutive terms.
+        Matching is case-insensitive and ignores punctuation. Candidates are found in the lexicon and only
+        the rows of phrase candidates are read from the week files.
+
+        Args:
+            query (str): query to match.
+            year_range (tuple, default None): ``(first, last)`` years of the week files to search, all
+                if ``None``.
+
+        Returns:
+            list[str]: WKUs of the matching patents, in store order (by week, then row)
+
+        Raises:
+            ValueError:
+                If `query` has no terms, or `year_range` is not a ``(first, last)`` pair of years.
+        """
+        groups = _parse_query(query)
+        if year_range is not None and not (isinstance(year_range, tuple) and len(year_range) == 2 and
+                                           all(isinstance(year, int) for year in year_range) and
+                                           year_range[0] <= year_range[1]):
+            raise ValueError("`year_range` parameter must be a (first, last) pair of years; current value = {}"
+                             .format(year_range))
+
+        # documents of the week files in the year range, a contiguous range as weeks are in year order
+        first, last = 0, len(self.docs)
+        if year_range is not None:
+            first, last = (int(np.append(self.weeks["first"], len(self.docs))[i])
+                           for i in np.searchsorted(self.weeks["year"], [year_range[0], year_range[1] + 1]))
+
+        docs = np.empty(0, self.postings.dtype)
+        for group in groups:
+            candidates = None
+            for words in group:
+                for word in words:
+                    found = self._postings(word, first, last)
+                    candidates = found if candidates is None else np.intersect1d(candidates, found, assume_unique = True)
+            phrases = [words for words in group if len(words) > 1]
+            if phrases and len(candidates):
+                candidates = self._verify_phrases(candidates, phrases)
+            docs = np.union1d(docs, candidates)
+        return [wku.decode("ascii") for wku in self.docs["wku"][docs]]
+
+    def _postings(self, word, first, last):
+        # documents from `first` to `last` (exclusive) containing a term, empty if the term does not occur
+        key = word.encode("ascii")[:TERM_LENGTH]
+        i = np.searchsorted(self.terms["term"], key)
+        if i == len(self.terms) or self.terms["term"][i] != key:
+            return np.empty(0, self.postings.dtype)
+        postings = self.postings[self.terms["start"][i]:self.terms["start"][i] + self.terms["count"][i]]
+        return np.asarray(postings[np.searchsorted(postings, first):np.searchsorted(postings, last)])
+
+    def _verify_phrases(self, docs, phrases):
+        # documents whose text contains every phrase as consecutive terms; week files are mapped as needed
+        kept, files = [], {}
+        try:
+            for doc in docs:
+                entry = self.docs[doc]
+                week, offset, length = int(entry["week"]), int(entry["offset"]), int(entry["length"])
+                if week not in files:
+                    with open(path.join(self.store_path, self.weeks["file"][week].decode("utf-8")), 'rb') as f:
+                        data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+                    header = next(csv.reader([data[:data.find(b'\n')].decode("utf-8")]))
+                    files[week] = data, _text_columns(header)
+                data, columns = files[week]
+                record = next(csv.reader([data[offset:offset + length].decode("utf-8", errors = "replace")]))
+                text = " " + " ".join(tokenize(" ".join(record[i] for i in columns if i < len(record)))) + " "
+                if all(" " + " ".join(words) + " " in text for words in phrases):
+                    kept.append(doc)
+        finally:
+            for data, _ in files.values():
+                data.close()
+        return np.array(kept, dtype = docs.dtype)
+
+
+def _parse_query(query):
+    # alternatives (separated by OR) of the query, each a list of phrases that have to match, each a list of terms
+    groups, group = [], []
+    for phrase, word in re.findall(r'"([^"]*)"?|(\S+)', query):
+        if not phrase and word in ("OR", "AND"):
+            if word == "OR" and group:
+                groups.append(group)
+                group = []
+            continue
+        words = tokenize(phrase or word)
+        if words:
+            group.append(words)
+    if group:
+        groups.append(group)
+    if not groups:
+        raise ValueError("`query` parameter must contain at least one term; current value = {}".format(query))
+    return groups
+
+
+def _text_segment(week_file):
+    # term dictionary and posting lists of a week file
+    postings, n_rows = {}, 0
+    with open(week_file, newline = '', encoding = 'utf-8', errors = 'replace') as f:
+        reader = csv.reader(f)
+        columns = _text_columns(next(reader))
+        for row, record in enumerate(reader):
+            text = " ".join(record[i] for i in columns if i < len(record))
+            for term in {word[:TERM_LENGTH] for word in tokenize(text)}:
+                postings.setdefault(term, []).append(row)
+            n_rows = row + 1
+
+    # rows are appended in order, so each posting list is sorted
+    words = sorted(postings)
+    terms = np.empty(len(words), TERMS_DTYPE)
+    terms["term"] = [word.encode("ascii") for word in words]
+    terms["count"] = [len(postings[word]) for word in words]
+    terms["start"] = np.cumsum(terms["count"]) - terms["count"]
+    row_dtype = "<u2" if n_rows <= 1 << 16 else "<u4"
+    return terms, np.fromiter(chain.from_iterable(postings[word] for word in words), dtype = row_dtype,
+                              count = int(terms["count"].sum()))
+
+
+def _text_columns(columns):
+    # positions of the indexed columns in a week file's header
+    return [columns.index(field) for field in TEXT_FIELDS if field in columns]
@@ -0,0 +1,197 @@
+# instrumentation of conversions: per-week timings, sizes and patent counts, collected into a `ConvertStats`
+import sys, json
+from os import path, scandir
+from time import perf_counter
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:         # not available on Windows, peak memory is not recorded
+    resource = None
+
+# stages of converting a week, timed separately
+STAGES = ["download", "unzip", "parse", "write"]
+
+# patents the Python engines skipped in this process (unparsable or filtered out), see `count_skipped()`
+_skipped = [0]
+
+
+def count_skipped():
+    """Counts a patent that an engine read but did not output."""
+    _skipped[0] += 1
+
+
+def skipped_count():
+    """Number of patents counted by ``count_skipped()`` in this process so far."""
+    return _skipped[0]
+
+
+def peak_memory():
+    """Peak resident memory of this process in bytes, or ``None`` if it cannot be determined."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024     # bytes on macOS, KiB elsewhere
+
+
+def disk_usage(output):
+    """Bytes on disk of an output file (with its SQLite write-ahead log, if any) or directory of files."""
+    if path.isdir(output):
+        return sum(entry.stat().st_size for entry in scandir(output) if entry.is_file())
+    return sum(path.getsize(name) for name in [output, output + "-wal"] if path.exists(name))
+
+
+def count_csv_rows(csv_file, offset = 0, chunk_size = 1 << 20):
+    """Number of CSV rows in `csv_file` from byte `offset` on; quoted fields may span lines.
+
+    The file is read in chunks of `chunk_size` bytes, so memory use does not grow with its size. The
+    converters report the rows they write themselves, so this is not needed to measure a conversion.
+    """
+    rows, odd = 0, 0
+    with open(csv_file, 'rb') as f:
+        f.seek(offset)
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            data = np.frombuffer(chunk, dtype = np.uint8)
+            # a newline ends a row if it follows an even number of quotes; parity is carried between chunks
+            parity = (np.cumsum(data == ord('"'), dtype = np.uint8) + odd) & 1
+            rows += int(np.count_nonzero((data == ord('\n')) & (parity == 0)))
+            odd = int(parity[-1])
+    return rows
+
+
+@contextmanager
+def timed(week_stats, stage):
+    """Adds the time spent in the ``with`` block to `stage` of `week_stats` (nothing if it is ``None``)."""
+    if week_stats is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        week_stats.timings[stage] += perf_counter() - start
+
+
+@contextmanager
+def written(week_stats, output = None):
+    """Times the ``with`` block as the ``"write"`` stage of `week_stats` (nothing if it is ``None``) and
+    records the bytes it added to `output` (file or directory, see ``disk_usage()``) if given."""
+    if week_stats is None:
+        yield
+        return
+    size = disk_usage(output) if output is not None else 0
+    with timed(week_stats, "write"):
+        yield
+    if output is not None:
+        week_stats.bytes_out = disk_usage(output) - size
+
+
+class WeekStats:
+    """Measurements of converting one week.
+
+    Attributes:
+        year (int), week (int): the week.
+        file (str): name of the USPTO file the week was converted from, ``None`` if it has none.
+        status (str): ``"ok"``, ``"skipped"`` (the week could not be fetched or extracted) or ``"failed"``
+            (converting it raised an error, its patents may be incomplete).
+        error (str): representation of the error of a skipped or failed week, ``None`` otherwise.
+        timings (dict): seconds spent in each of ``STAGES``. ``"download"`` is the time the week waited
+            for its zip file (short if it was prefetched or cached); ``"unzip"`` the time taken to
+            extract it (streamed weeks are decompressed while parsing instead); ``"parse"`` the time
+            taken to parse it (for CSV output including writing, as the engines write while parsing);
+            ``"write"`` the time taken to write it to Parquet, normalized tables or SQLite.
+        bytes_in (int): size of the week's zip file.
+        bytes_out (int): bytes written for the week (in memory for Arrow output), ``None`` for
+            normalized tables returned as DataFrames.
+        patents (int): patents output.
+        skipped (int): patents read but not output, as they could not be parsed or were filtered out;
+            ``None`` where it is unknown (filtered TXT weeks converted to records).
+        peak_memory (int): peak resident memory (bytes) of the process that converted the week, so far.
+    """
+    def __init__(self, year, week):
+        self.year, self.week = int(year), int(week)
+        self.file = self.error = None
+        self.status = "ok"
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.bytes_in = self.bytes_out = self.patents = self.skipped = self.peak_memory = None
+
+    def to_dict(self):
+        """The measurements as a flat dict, with timings as ``<stage>_seconds``."""
+        values = {"year": self.year, "week": self.week, "file": self.file, "status": self.status, "error": self.error}
+        values.update(("{}_seconds".format(stage), round(self.timings[stage], 6)) for stage in STAGES)
+        values.update(bytes_in = self.bytes_in, bytes_out = self.bytes_out, patents = self.patents,
+                      skipped = self.skipped, peak_memory = self.peak_memory)
+        return values
+
+
+class ConvertStats:
+    """Collects the ``WeekStats`` of a conversion, see ``get_bulk_patent_data(..., stats = ...)``.
+
+    Each week is added once it is done: it is appended to ``weeks``, written as one JSON line to
+    `metrics_file` (if given) and passed to every hook. When the conversion ends, ``elapsed`` is set
+    and a last JSON line with the totals is written.
+
+    Args:
+        metrics_file (str, default None): JSON-lines file to append a ``{"event": "week", ...}`` line per
+            week and a ``{"event": "run", ...}`` line per conversion to.
+        hooks (list, default None): callables called with each ``WeekStats`` in the calling process.
+
+    Attributes:
+        weeks (list): ``WeekStats`` of the weeks done, in the order they were done.
+        elapsed (float): seconds the conversion took, ``None`` until it ends.
+    """
+    def __init__(self, metrics_file = None, hooks = None):
+        self.metrics_file = metrics_file
+        self.hooks = list(hooks) if hooks is not None else []
+        self.weeks = []
+        self.elapsed = None
+
+    def add(self, week_stats):
+        """Records a week that is done."""
+        self.weeks.append(week_stats)
+        self._write_metrics(dict(event = "week", **week_stats.to_dict()))
+        for hook in self.hooks:
+            hook(week_stats)
+
+    def finish(self, elapsed):
+        """Records the end of the conversion, which took `elapsed` seconds."""
+        self.elapsed = elapsed
+        self._write_metrics(dict(event = "run", elapsed_seconds = round(elapsed, 6), **self.totals()))
+
+    def totals(self):
+        """Totals over all weeks: number of weeks by status (``weeks_ok``, ...), seconds per stage, bytes and patents."""
+        totals = {"weeks_" + status: sum(w.status == status for w in self.weeks) for status in ["ok", "skipped", "failed"]}
+        totals.update(("{}_seconds".format(stage), round(sum(w.timings[stage] for w in self.weeks), 6))
+                      for stage in STAGES)
+        for name in ["bytes_in", "bytes_out", "patents", "skipped"]:
+            totals[name] = sum(getattr(w, name) or 0 for w in self.weeks)
+        totals["peak_memory"] = max((w.peak_memory or 0 for w in self.weeks), default = 0)
+        return totals
+
+    def to_df(self):
+        """The ``WeekStats`` of all weeks as a ``pandas.DataFrame``, one row (``WeekStats.to_dict()``) per week."""
+        return pd.DataFrame([week_stats.to_dict() for week_stats in self.weeks])
+
+    def _write_metrics(self, line):
+        if self.metrics_file is not None:
+            with open(self.metrics_file, 'a') as f:
+                f.write(json.dumps(line) + "\n")
+
+
+def check_stats(stats):
+    """Returns the ``ConvertStats`` to collect into for the `stats` argument: a new one if ``True``, none
+    if ``None`` or ``False``.
+
+    Raises:
+        ValueError:
+            If `stats` is neither a bool nor a ``ConvertStats``.
+    """
+    if stats is None or stats is False:
+        return None
+    if stats is True:
+        return ConvertStats()
+    if not isinstance(stats, ConvertStats):
+        raise ValueError("`stats` parameter must be a bool or ConvertStats; current value = {}".format(stats))
+    return stats
@@ -0,0 +1,305 @@
+import os, sys, io, csv, json, mmap, hashlib, datetime, tempfile, traceback, zipfile
+from os import path
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from patentpy.acquire import fetch_week, convert_file
+from patentpy.citations import build_citation_graph
+from patentpy.search import build_text_index
+from patentpy.utility import FIELDS, get_date_tues, plan_weeks, find_zip_member, write_npy
+
+MANIFEST = "manifest.csv"
+MANIFEST_FIELDS = ["year", "week", "source_file", "patents", "checksum", "status", "error", "synced_at"]
+WKU_INDEX = "wku_index.npy"
+WKU_PARTITIONS = "wku_index.json"
+
+# index entry: WKU, and offset and length of its row in the week file
+INDEX_DTYPE = np.dtype([("wku", "S16"), ("offset", "<i8"), ("length", "<i8")])
+
+
+def sync(store_path, start, end = None, cache = None, downloader = None, text_index = False,
+         citation_graph = False):
+    """Brings a store of converted weeks up to date, converting only weeks that are new or failed before.
+
+    The store is a directory holding one CSV file (with header) per week at ``<year>/<file>.csv``, named
+    after the USPTO file the week was converted from, and a ``manifest.csv`` with one row per synced week:
+    year, week, source file, patent count, SHA-256 checksum of the source zip file, status (``"ok"`` or
+    ``"failed"``), error message and time of syncing. Weeks from `start` to `end` that are ``"ok"`` in the
+    manifest (and whose file exists) are skipped; all others are downloaded and converted. A week that
+    fails is recorded as ``"failed"`` and retried on the next call. Week files and the manifest are
+    replaced atomically, so an interrupted sync only loses the week in progress.
+
+    Each week file gets an index of the byte range of every patent's row, and the indexes of all weeks
+    are merged into a sorted WKU index of the store (see ``build_index()``) for ``get_patents()``.
+
+    With `text_index`, week files are also indexed for full-text search of their titles and claims (see
+    ``patentpy.search.build_text_index()``); only weeks not indexed yet are. With `citation_graph`, the
+    citation graph of the store is updated likewise (see ``patentpy.citations.build_citation_graph()``).
+
+    Weeks are enumerated with ``utility.plan_weeks()``, so weeks in the future are never synced.
+
+    Args:
+        store_path (str): directory of the store; created if it does not exist.
+        start (date or tuple): first issue date (``datetime.date``) or ``(year, week)`` pair to sync.
+        end (date or tuple, default None): last issue date or ``(year, week)`` pair to sync, today if ``None``.
+        cache (ArchiveCache, default None): cache to fetch zip files through; otherwise zip files are
+            downloaded into memory.
+        downloader (Downloader, default None): ``patentpy.downloader.Downloader`` to download zip files with.
+        text_index (bool, default False): whether to update the full-text index of the store.
+        citation_graph (bool, default False): whether to update the citation graph of the store.
+
+    Returns:
+        DataFrame: the manifest after syncing, one row per week in date order
+
+    Raises:
+        TypeError:
+            If `start` or `end` is not a date or ``(year, week)`` pair.
+        ValueError:
+            If `start` is after `end`, or a ``(year, week)`` pair is not a published week.
+    """
+    weeks = _week_range(start, end)
+    os.makedirs(store_path, exist_ok = True)
+    manifest = _read_manifest(store_path)
+
+    pending = [(curr_year, curr_week) for curr_year, curr_week in weeks
+               if not _is_synced(store_path, manifest.get((curr_year, curr_week)))]
+    for curr_year, curr_week in tqdm(pending):
+        entry = {"year": curr_year, "week": curr_week, "source_file": "", "patents": "", "checksum": "",
+                 "status": "ok", "error": ""}
+        try:
+            entry["source_file"], entry["patents"], entry["checksum"] = _sync_week(store_path, curr_year, curr_week,
+                                                                                   cache, downloader)
+        except Exception as e:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, e.__traceback__)
+            print("UNABLE TO SYNC PATENT DATA FOR WEEK {} OF YEAR {}, WILL RETRY ON NEXT SYNC...".format(curr_week, curr_year))
+            entry["status"], entry["error"] = "failed", repr(e)
+        entry["synced_at"] = datetime.datetime.now().isoformat(timespec = "seconds")
+        manifest[(curr_year, curr_week)] = entry
+        _write_manifest(store_path, manifest)      # after every week, so progress survives interruptions
+
+    if not path.exists(path.join(store_path, MANIFEST)):
+        _write_manifest(store_path, manifest)
+    if pending or not path.exists(path.join(store_path, WKU_INDEX)):
+        build_index(store_path)
+    if text_index:
+        build_text_index(store_path)
+    if citation_graph:
+        build_citation_graph(store_path)
+    return pd.read_csv(path.join(store_path, MANIFEST), dtype = {"patents": "Int64"}, keep_default_na = False,
+                       na_values = {"patents": [""]})
+
+
+def _week_range(start, end):
+    # (year, week) pairs of all weeks with a Tuesday from `start` to `end`
+    start = _as_date(start, "start")
+    end = _as_date(end, "end") if end is not None else datetime.date.today()
+    if start > end:
+        raise ValueError("`start` must not be after `end`; start = {}, end = {}".format(start, end))
+
+    plan = plan_weeks(start_date = start, end_date = end)
+    return [(int(curr_year), int(curr_week)) for curr_year, curr_week in zip(plan.year, plan.week)]
+
+
+def _as_date(value, name):
+    # issue date of a `datetime.date` or (year, week) pair
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if isinstance(value, tuple) and len(value) == 2 and all(isinstance(x, int) for x in value):
+        return get_date_tues(*value)
+    raise TypeError("`{}` parameter must be a datetime.date or (year, week) pair of integers; current value = {}"
+                    .format(name, value))
+
+
+def _partition_path(store_path, curr_year, curr_file):
+    return path.join(store_path, str(curr_year), curr_file[:-4] + ".csv")
+
+
+def _is_synced(store_path, entry):
+    return (entry is not None and entry["status"] == "ok" and
+            path.exists(_partition_path(store_path, int(entry["year"]), entry["source_file"])))
+
+
+def _sync_week(store_path, curr_year, curr_week, cache, downloader):
+    """Downloads and converts a week into its store file; returns its file name, patent count and checksum.
+
+    Internal helper for ``sync()``. Unlike ``convert_to_df()``, errors are raised. Zip files not fetched
+    through `cache` are held in memory; the week's member is extracted into a temporary directory inside
+    the store (so the native converters can read it) and removed afterwards.
+    """
+    curr_file, zip_file = fetch_week(curr_year, curr_week, None, True, cache, downloader)
+    checksum = _checksum(zip_file)
+
+    partition = _partition_path(store_path, curr_year, curr_file)
+    os.makedirs(path.dirname(partition), exist_ok = True)
+    with tempfile.TemporaryDirectory(prefix = ".sync-", dir = store_path) as temp_dir:
+        with zipfile.ZipFile(zip_file, 'r') as zip_uspto:
+            member = find_zip_member(curr_file, zip_uspto)
+            if member is None:
+                raise FileNotFoundError("Unable to find file {} in downloaded zip file".format(curr_file))
+            extracted = zip_uspto.extract(member, temp_dir)
+        temp_csv = path.join(temp_dir, "week.csv")
+        patents = convert_file(curr_year, extracted, temp_csv, False, True)
+        write_npy(_partition_index(temp_csv), partition[:-4] + ".idx.npy")
+        os.replace(temp_csv, partition)
+    return curr_file, patents, checksum
+
+
+def _checksum(zip_file):
+    # SHA-256 of a zip file given by path or as an in-memory BytesIO
+    if not isinstance(zip_file, str):
+        return hashlib.sha256(zip_file.getbuffer()).hexdigest()
+    sha256 = hashlib.sha256()
+    with open(zip_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _read_manifest(store_path):
+    # manifest rows keyed by (year, week)
+    try:
+        with open(path.join(store_path, MANIFEST), newline = '') as f:
+            return {(int(row["year"]), int(row["week"])): row for row in csv.DictReader(f)}
+    except FileNotFoundError:
+        return {}
+
+
+def _write_manifest(store_path, manifest):
+    # write to a temporary file and rename, so the manifest is never partially written
+    temp_path = path.join(store_path, MANIFEST + ".part")
+    with open(temp_path, 'w', newline = '') as f:
+        writer = csv.DictWriter(f, fieldnames = MANIFEST_FIELDS)
+        writer.writeheader()
+        writer.writerows(manifest[key] for key in sorted(manifest))
+    os.replace(temp_path, path.join(store_path, MANIFEST))
+
+
+def build_index(store_path):
+    """Builds the WKU index of a store from the indexes of its week files.
+
+    The index maps each WKU to the week file (partition) and byte range of its row. It is stored as a
+    sorted NumPy structured array (``wku_index.npy``), which ``get_patents()`` memory-maps and binary
+    searches, plus the list of week files it refers to (``wku_index.json``). ``sync()`` rebuilds it
+    after converting weeks; week files without an index of their own (e.g. from an older version) are
+    indexed first.
+
+    Args:
+        store_path (str): directory of the store.
+
+    Returns:
+        int: number of indexed patents
+    """
+    # week files keep their number once listed, so that an index being read stays valid
+    try:
+        with open(path.join(store_path, WKU_PARTITIONS)) as f:
+            partitions = json.load(f)
+    except FileNotFoundError:
+        partitions = []
+    for key, entry in sorted(_read_manifest(store_path).items()):
+        if not _is_synced(store_path, entry):
+            continue
+        partition = path.relpath(_partition_path(store_path, key[0], entry["source_file"]), store_path)
+        if partition not in partitions:
+            partitions.append(partition)
+
+    indexes = []
+    for partition in partitions:
+        partition = path.join(store_path, partition)
+        index_path = partition[:-4] + ".idx.npy"
+        if not path.exists(partition):
+            indexes.append(np.empty(0, INDEX_DTYPE))
+            continue
+        if not path.exists(index_path):
+            write_npy(_partition_index(partition), index_path)
+        indexes.append(np.load(index_path))
+
+    # one sorted array of all WKUs, with the number of their partition
+    index = np.concatenate(indexes) if indexes else np.empty(0, INDEX_DTYPE)
+    partition_ids = np.repeat(np.arange(len(indexes), dtype = "<i4"), [len(x) for x in indexes])
+    order = np.argsort(index["wku"], kind = "stable")
+    merged = np.empty(len(index), np.dtype(INDEX_DTYPE.descr + [("partition", "<i4")]))
+    for field in INDEX_DTYPE.names:
+        merged[field] = index[field][order]
+    merged["partition"] = partition_ids[order]
+
+    # partition list first, an old index refers to a prefix of it
+    temp_path = path.join(store_path, WKU_PARTITIONS + ".part")
+    with open(temp_path, 'w') as f:
+        json.dump(partitions, f)
+    os.replace(temp_path, path.join(store_path, WKU_PARTITIONS))
+    write_npy(merged, path.join(store_path, WKU_INDEX))
+    return len(merged)
+
+
+def get_patents(store_path, wkus):
+    """Looks up patents by WKU in a store built by ``sync()``.
+
+    WKUs are found by binary search in the memory-mapped WKU index, and only the rows of the matching
+    patents are read from the (memory-mapped) week files, so lookups take milliseconds regardless of
+    the size of the store.
+
+    Args:
+        store_path (str): directory of the store.
+        wkus (str or list[str]): WKU(s) to look up, as written in the WKU column of the converted data
+            (e.g. ``"06334220"`` for 2002-present patents, including the check digit for 1976-2001 ones).
+
+    Returns:
+        DataFrame: rows of the patents found, in the order of `wkus` (missing WKUs are left out), with
+        the WKU column read as strings
+
+    Raises:
+        FileNotFoundError:
+            If the store has no WKU index.
+    """
+    wkus = [wkus] if isinstance(wkus, str) else list(wkus)
+    index = np.load(path.join(store_path, WKU_INDEX), mmap_mode = 'r')
+    with open(path.join(store_path, WKU_PARTITIONS)) as f:
+        partitions = json.load(f)
+
+    # range of matching entries for every WKU
+    keys = np.array([wku.encode("ascii") for wku in wkus], dtype = "S16")
+    first = np.searchsorted(index["wku"], keys, side = "left")
+    last = np.searchsorted(index["wku"], keys, side = "right")
+    matches = [index[i] for start, stop in zip(first, last) for i in range(start, stop)]
+
+    header, rows, files = None, [], {}
+    try:
+        for match in matches:
+            partition = int(match["partition"])
+            if partition not in files:
+                with open(path.join(store_path, partitions[partition]), 'rb') as f:
+                    files[partition] = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+                header = header or files[partition][:files[partition].find(b'\n') + 1]
+            rows.append(files[partition][match["offset"]:match["offset"] + match["length"]])
+    finally:
+        for data in files.values():
+            data.close()
+
+    if header is None:
+        return pd.DataFrame(columns = FIELDS)
+    return pd.read_csv(io.BytesIO(header + b"".join(rows)), dtype = {"WKU": str})
+
+
+def _partition_index(csv_file):
+    # WKU and byte range of every row of a week file; quoted fields may span lines, so a row ends at the
+    # first newline after an even number of quotes
+    with open(csv_file, 'rb') as f:
+        data = f.read()
+    entries = []
+    start = pos = data.find(b'\n') + 1        # skip header
+    quotes = 0
+    while True:
+        newline = data.find(b'\n', pos)
+        if newline < 0:
+            break
+        quotes += data.count(b'"', pos, newline)
+        pos = newline + 1
+        if quotes % 2 == 0:
+            entries.append((data[start:data.find(b',', start)].strip(b'"'), start, pos - start))
+            start, quotes = pos, 0
+    return np.array(entries, dtype = INDEX_DTYPE)
+
@@ -0,0 +1,101 @@
+# normalized (relational) output of converted patent data: one table of patents, one per multi-valued field
+import csv
+from os import makedirs, path
+
+import pandas as pd
+
+from patentpy.utility import MULTI_VALUED, check_fields
+
+# table name: (multi-valued field it holds, or None for the patents table; columns)
+TABLES = {
+    "patents":         (None, None),
+    "inventors":       ("Inventor", ["WKU", "Inventor"]),
+    "assignees":       ("Assignee", ["WKU", "Assignee"]),
+    "classifications": ("ICL_Class", ["WKU", "ICL_Class"]),
+    "citations":       ("References", ["WKU", "Citation"]),
+}
+
+
+def table_fields(fields = None):
+    """Fields to extract for normalized output of the columns `fields` (all if ``None``).
+
+    WKU is always included, as every table is keyed by it.
+    """
+    fields = check_fields(fields)
+    return fields if "WKU" in fields else check_fields(("WKU",) + fields)
+
+
+def table_columns(fields = None):
+    """Returns the tables (name: columns) normalized output of `fields` (all if ``None``) consists of.
+
+    The patents table holds WKU and the requested single-valued fields; each requested multi-valued field
+    gets its own table of (WKU, value) rows, in the order values appear in the patent.
+    """
+    fields = table_fields(fields)
+    columns = {"patents": [field for field in fields if field not in MULTI_VALUED]}
+    for name, (field, field_columns) in TABLES.items():
+        if field is not None and field in fields:
+            columns[name] = field_columns
+    return columns
+
+
+def records_to_rows(records, fields = None):
+    """Splits patent records into the rows of each table.
+
+    Args:
+        records (iterable of tuple): patent records of the fields ``table_fields(fields)``, in
+            ``utility.FIELDS`` order, with multi-valued fields as lists (as yielded by
+            ``iter_txt_records()``, ``iter_xml1_records()`` and ``iter_xml2_records()``).
+        fields (list, default None): requested columns, all if ``None``.
+
+    Returns:
+        dict: table name -> list of row tuples, for the tables of ``table_columns(fields)``
+    """
+    fields = table_fields(fields)
+    single = [i for i, field in enumerate(fields) if field not in MULTI_VALUED]
+    multi = [(name, fields.index(field)) for name, (field, _) in TABLES.items() if field in fields]
+    rows = {"patents": []}
+    rows.update((name, []) for name, _ in multi)
+    for record in records:
+        wku = record[0]
+        rows["patents"].append(tuple(record[i] for i in single))
+        for name, i in multi:
+            rows[name].extend((wku, value) for value in record[i])
+    return rows
+
+
+def rows_to_dfs(weeks, fields = None):
+    """Combines the table rows of several weeks (from ``records_to_rows()``) into one DataFrame per table."""
+    return {name: pd.DataFrame([row for rows in weeks for row in rows[name]], columns = columns)
+            for name, columns in table_columns(fields).items()}
+
+
+class TablesOutput:
+    """Appends table rows to one CSV file per table in a directory, '<table>.csv'.
+
+    Files are created with a header if they do not exist yet, and appended to otherwise (like CSV output
+    of ``convert_to_df()``).
+
+    Args:
+        output_dir (str): directory to write the tables to; created if missing.
+        fields (list, default None): requested columns, all if ``None``.
+    """
+    def __init__(self, output_dir, fields = None):
+        makedirs(output_dir, exist_ok = True)
+        self.files, self.writers = {}, {}
+        for name, columns in table_columns(fields).items():
+            file_name = path.join(output_dir, name + ".csv")
+            exists = path.exists(file_name)
+            self.files[name] = open(file_name, 'a', newline = '', encoding = 'utf-8')
+            self.writers[name] = csv.writer(self.files[name])
+            if not exists:
+                self.writers[name].writerow(columns)
+
+    def write(self, rows):
+        for name, writer in self.writers.items():
+            writer.writerows(rows[name])
+            self.files[name].flush()      # each week is on disk once written
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
@@ -1,6 +1,150 @@
 import sys, traceback, datetime
 import urllib.request, shutil, zipfile, re
-from os import remove
+import os
+from os import remove, path
+from glob import glob
+from io import BytesIO
+from contextlib import nullcontext
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+uspto_url = "https://bulkdata.uspto.gov/data/patent/grant/redbook/fulltext/"
+
+# columns of converted patent data, and those holding several `;`-separated values in CSV output
+FIELDS = ["WKU", "Title", "App_Date", "Issue_Date", "Inventor", "Assignee", "ICL_Class", "References", "Claims"]
+MULTI_VALUED = ["Inventor", "Assignee", "ICL_Class", "References"]
+# records the Python engines hand to ``convert_funcs.CsvWriter.write_rows()`` at a time
+CSV_BATCH = 256
+
+def format_csv_row(record):
+    """Formats a patent record (tuple of fields, lists for multi-valued fields, ``None`` for empty ones) as a quoted
+    CSV row, with quotes inside fields doubled; same as a row written by ``convert_funcs.CsvWriter``."""
+    values = (";".join(value) if isinstance(value, list) else value or "" for value in record)
+    return ",".join("\"{}\"".format(value.replace("\"", "\"\"")) for value in values) + "\n"
+
+def check_fields(fields):
+    """Checks a selection of columns to convert.
+
+    Args:
+        fields (iterable of str or None): column names from ``FIELDS``; ``None`` selects all columns.
+
+    Returns:
+        tuple: the selected column names, in ``FIELDS`` order (the order of columns in any output)
+
+    Raises:
+        ValueError:
+            If ``fields`` is empty or holds a name not in ``FIELDS``.
+    """
+    if fields is None:
+        return tuple(FIELDS)
+    fields = [fields] if isinstance(fields, str) else list(fields)
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown or not fields:
+        raise ValueError("`fields` parameter must be a non-empty list of names in FIELDS; current value = {}".format(fields))
+    return tuple(field for field in FIELDS if field in fields)
+
+def csv_header(fields = None):
+    """Header line of CSV output holding the columns ``fields`` (all if ``None``)."""
+    return ",".join(check_fields(fields)) + "\n"
+
+class PatentFilter:
+    """Conditions patents have to meet to be converted; all given conditions must hold.
+
+    Converters check them as soon as the issue date, ICL classes and assignees of a patent are known, so 
+    rejected patents are not searched any further (e.g. for references and claims) and never written.
+
+    Args:
+        icl_prefix (str or list[str], default None): keep patents with an ICL class starting with (one of) 
+            these prefixes. Whitespace is ignored, as its use inside classes differs between years.
+        assignee_regex (str or re.Pattern, default None): keep patents with an assignee this regular 
+            expression matches (with ``re.search``).
+        issue_date_range (tuple, default None): ``(first, last)`` issue dates to keep, inclusive; each a 
+            ``datetime.date``, a 'YYYYMMDD' string or ``None`` for an open end.
+
+    Raises:
+        ValueError:
+            If a condition is not of the above form.
+    """
+    def __init__(self, icl_prefix = None, assignee_regex = None, issue_date_range = None):
+        if icl_prefix is None:
+            self.icl_prefixes = None
+        else:
+            prefixes = [icl_prefix] if isinstance(icl_prefix, str) else list(icl_prefix)
+            if not prefixes or not all(isinstance(prefix, str) and prefix.strip() for prefix in prefixes):
+                raise ValueError("`icl_prefix` filter must be a non-empty string or list of strings; current value = {}"
+                                 .format(icl_prefix))
+            self.icl_prefixes = tuple("".join(prefix.split()) for prefix in prefixes)
+
+        try:
+            self.assignee_regex = re.compile(assignee_regex) if assignee_regex is not None else None
+        except (re.error, TypeError) as e:
+            raise ValueError("`assignee_regex` filter must be a regular expression; current value = {} ({})"
+                             .format(assignee_regex, e))
+
+        self.date_from = self.date_to = None
+        if issue_date_range is not None:
+            if not (isinstance(issue_date_range, (tuple, list)) and len(issue_date_range) == 2):
+                raise ValueError("`issue_date_range` filter must be a (first, last) pair; current value = {}"
+                                 .format(issue_date_range))
+            self.date_from, self.date_to = (self._as_date(day) for day in issue_date_range)
+
+        # fields the conditions look at, in FIELDS order
+        self.fields = tuple(field for field, condition in (("Issue_Date", issue_date_range),
+                                                           ("Assignee", self.assignee_regex),
+                                                           ("ICL_Class", self.icl_prefixes)) if condition is not None)
+
+    @staticmethod
+    def _as_date(day):
+        # 'YYYYMMDD' string of an issue date bound, as USPTO files write them
+        if day is None:
+            return None
+        if isinstance(day, datetime.date):
+            return day.strftime("%Y%m%d")
+        if isinstance(day, str) and re.fullmatch("[0-9]{8}", day):
+            return day
+        raise ValueError("`issue_date_range` filter bounds must be dates, 'YYYYMMDD' strings or None; current value = {}"
+                         .format(day))
+
+    def matches(self, issue_date, icl_classes, assignees):
+        """Whether a patent with this issue date ('YYYYMMDD'), ICL classes and assignees (lists) is kept.
+
+        Fields no condition looks at may be ``None``.
+        """
+        if self.date_from is not None and not issue_date >= self.date_from:
+            return False
+        if self.date_to is not None and not issue_date <= self.date_to:
+            return False
+        if self.icl_prefixes is not None and not any("".join(icl.split()).startswith(self.icl_prefixes)
+                                                     for icl in icl_classes if icl):
+            return False
+        if self.assignee_regex is not None and not any(self.assignee_regex.search(assignee) for assignee in assignees):
+            return False
+        return True
+
+def check_filter(filter):
+    """Checks the conditions patents are filtered by.
+
+    Args:
+        filter (dict, PatentFilter or None): ``PatentFilter`` or dict of its arguments (``icl_prefix``, 
+            ``assignee_regex``, ``issue_date_range``).
+
+    Returns:
+        PatentFilter or None: the filter, or ``None`` if it has no conditions (every patent is kept)
+
+    Raises:
+        ValueError:
+            If ``filter`` is of another type, holds unknown keys or bad conditions.
+    """
+    if filter is None or isinstance(filter, PatentFilter):
+        return filter if filter is None or filter.fields else None
+    if not isinstance(filter, dict):
+        raise ValueError("`filter` parameter must be a dict or PatentFilter; current value = {}".format(filter))
+    unknown = set(filter) - {"icl_prefix", "assignee_regex", "issue_date_range"}
+    if unknown:
+        raise ValueError("`filter` parameter keys must be icl_prefix, assignee_regex or issue_date_range; current keys = {}"
+                         .format(sorted(unknown)))
+    return check_filter(PatentFilter(**filter))
 
 
 def get_date_tues(year, week):
@@ -25,12 +169,11 @@ def get_date_tues(year, week):
     if not (isinstance(year, int) and isinstance(week, int)):
         raise TypeError("`year` and `week` arguments must be integers")
         
-    curr_day = datetime.datetime.now().date()
+    curr_day = datetime.date.today()
         
-    # get first day of the year
+    # get first tuesday of the year
     first_day = datetime.date(year, 1, 1)
-    while first_day.weekday() != 1:
-        first_day += datetime.timedelta(days=1)
+    first_day += datetime.timedelta(days = (1 - first_day.weekday()) % 7)
     
     # calcuate tuesday
     tues = first_day + datetime.timedelta(days=7*(week-1))
@@ -76,34 +219,240 @@ def get_file_name(year, week):
         file_name = "ipg{:02d}{:02d}{:02d}".format(year-2000, month, day) + ".xml"
     return file_name
 
+def plan_weeks(year = None, week = None, start_date = None, end_date = None, base_url = uspto_url):
+    """Computes the issue date (Tuesday), file name and url of many weeks at once.
+
+    Weeks are given either as `year` and `week` values (integers or equal-length lists, as for 
+    ``get_bulk_patent_data()``) or as the range of issue dates from `start_date` to `end_date`. All 
+    weeks are computed in one pass of NumPy date arithmetic, without printing anything, and plans are 
+    memoized (per day, as weeks become available), so planning thousands of weeks again is instant.
+
+    Args:
+        year (int or list[int], default None): year of each week.
+        week (int or list[int], default None): week (within its year) of each week.
+        start_date (date or str, default None): first issue date of the range, a ``datetime.date`` or a 
+            'YYYYMMDD' or 'YYYY-MM-DD' string.
+        end_date (date or str, default None): last issue date of the range, today if ``None``.
+        base_url (str, default `uspto_url`): url of the directory of yearly directories, see ``get_url()``.
+
+    Returns:
+        DataFrame: one row per week with columns year, week, issue_date, file_name and url. For `year` 
+        and `week`, rows are in the given order and weeks that are not published (in the future, or 
+        past the end of their year) have a missing issue_date, file_name and url. For a date range, 
+        rows are all published weeks with a Tuesday in the range (from 1976 on), in date order.
+
+    Raises:
+        ValueError:
+            If neither or both of `year`/`week` and `start_date` are given, `year` and `week` are not of 
+            equal length, a date is not of the above form, or `start_date` is after `end_date`.
+    """
+    today = datetime.date.today()
+    if start_date is not None or end_date is not None:
+        if year is not None or week is not None:
+            raise ValueError("`year` and `week` parameters cannot be combined with `start_date` and `end_date`")
+        if start_date is None:
+            raise ValueError("`start_date` parameter must be given with `end_date`")
+        start, end = _as_issue_date(start_date, "start_date"), _as_issue_date(end_date, "end_date") or today
+        if start > end:
+            raise ValueError("`start_date` must not be after `end_date`; start_date = {}, end_date = {}"
+                             .format(start, end))
+        return _plan_range(start, end, today, base_url).copy()
+
+    if year is None or week is None:
+        raise ValueError("`year` and `week` parameters, or `start_date`, must be given")
+    year = (year,) if isinstance(year, int) else tuple(year)
+    week = (week,) if isinstance(week, int) else tuple(week)
+    if len(year) != len(week):
+        raise ValueError("`year` and `week` parameters should be of equal lengths: \nyear = {}\nweek = {}"
+                         .format(year, week))
+    return _plan(year, week, today, base_url).copy()
+
+
+def _as_issue_date(day, name):
+    # `datetime.date` of a date or 'YYYYMMDD' / 'YYYY-MM-DD' string, None stays None
+    if day is None or (isinstance(day, datetime.date) and not isinstance(day, datetime.datetime)):
+        return day
+    if isinstance(day, datetime.datetime):
+        return day.date()
+    if isinstance(day, str) and re.fullmatch("[0-9]{4}-?[0-9]{2}-?[0-9]{2}", day):
+        try:
+            return datetime.datetime.strptime(day.replace("-", ""), "%Y%m%d").date()
+        except ValueError:
+            pass
+    raise ValueError("`{}` parameter must be a date or a 'YYYYMMDD' or 'YYYY-MM-DD' string; current value = {}"
+                     .format(name, day))
+
+
+@lru_cache(maxsize = 128)
+def _plan(year, week, today, base_url):
+    # plan of `plan_weeks()` for tuples of years and weeks, as of `today`
+    years, weeks = np.array(year, dtype = np.int64), np.array(week, dtype = np.int64)
+
+    # first Tuesday of each year: 1970-01-01 (day 0) was a Thursday
+    jan1 = (years - 1970).astype("datetime64[Y]").astype("datetime64[D]")
+    tues = jan1 + (-2 - jan1.astype(np.int64)) % 7 + 7 * (weeks - 1)
+    published = ((weeks >= 1) & (tues <= np.datetime64(today)) &
+                 (tues.astype("datetime64[Y]").astype(np.int64) + 1970 == years))
+
+    issue_date = pd.Series(np.where(published, tues, np.datetime64("NaT")), dtype = "datetime64[s]")
+    # file names as in `get_file_name()`
+    txt_names = "pftaps" + issue_date.dt.strftime("%Y%m%d") + "_wk" + pd.Series(weeks).astype(str).str.zfill(2) + ".txt"
+    names = np.select([years < 2002, years < 2005], [txt_names, "pg" + issue_date.dt.strftime("%y%m%d") + ".xml"],
+                      "ipg" + issue_date.dt.strftime("%y%m%d") + ".xml")
+    file_name = pd.Series(names, dtype = object).where(published, None)
+    base_url = base_url if base_url.endswith("/") else base_url + "/"
+    url = base_url + pd.Series(years).astype(str) + "/" + file_name.str[:-4] + ".zip"
+    url = url.astype(object).where(published, None)
+    return pd.DataFrame({"year": years, "week": weeks, "issue_date": issue_date, "file_name": file_name, "url": url})
+
+
+@lru_cache(maxsize = 128)
+def _plan_range(start, end, today, base_url):
+    # plan of `plan_weeks()` for the published weeks with a Tuesday from `start` to `end`
+    years = np.arange(max(start.year, 1976), end.year + 1)
+    plan = _plan(tuple(np.repeat(years, 53).tolist()), tuple(np.tile(np.arange(1, 54), len(years)).tolist()),
+                 today, base_url)
+    in_range = plan.issue_date.between(pd.Timestamp(start), pd.Timestamp(end))
+    return plan[in_range].reset_index(drop = True)
+
+
+def get_url(year, file_name, base_url = uspto_url):
+    """Formats the url of the zip file containing ``file_name``.
+
+    Args:
+        year (int): year the file was published, used as the directory name.
+        file_name (str): expected file name (from ``get_file_name()``).
+        base_url (str, default `uspto_url`): url of directory holding one sub-directory per year; may 
+            be any url ``urllib`` can open (e.g. a local ``file://`` mirror).
+
+    Returns:
+        string: returns url of the zip file
+    """
+    base_url = base_url if base_url.endswith("/") else base_url + "/"
+    return base_url + "{}/".format(year) + file_name[:-4] + ".zip"
+
 def download_zip(url, zip_name):
     with urllib.request.urlopen(url) as res, open(zip_name, 'w+b') as output_file:
         shutil.copyfileobj(res, output_file)
     return
 
-def uncompress_zip(file_name, zip_name):
+def fetch_zip(url):
+    """Helper function used to download a zip file from uspto url link into memory.
+
+    Args:
+        url (str): url of zip file containing uspto bulk patent data.
+
+    Returns:
+        BytesIO: in-memory copy of the zip file, rewound to the start
+    """
+    zip_data = BytesIO()
+    with urllib.request.urlopen(url) as res:
+        shutil.copyfileobj(res, zip_data)
+    zip_data.seek(0)
+    return zip_data
+
+def find_zip_member(file_name, zip_uspto):
+    """Helper function used to find the file containing uspto bulk patent data in an open zip file.
+
+    Args:
+        file_name (str): expected file name of in XML or TXT document containing uspto bulk patent data.
+        zip_uspto (ZipFile): open ``zipfile.ZipFile`` to search.
+
+    Returns:
+        string: returns name of matching zip member, or ``None`` if there is no match
+    """
+    regex_to_match = re.compile("(./)?(?i:{})".format(file_name))
+    files = " ".join([file.filename for file in zip_uspto.infolist()])
+    poss_match = regex_to_match.search(files)
+    return poss_match[0] if poss_match else None
+
+def open_zip_member(file_name, zip_file):
+    """Helper function used to open the file containing uspto bulk patent data without extracting it.
+
+    The returned file object decompresses the member as it is read, so it can be passed straight to 
+    ``xml1_to_df()`` or ``xml2_to_df()``.
+        
+    Args: 
+        file_name (str): expected file name of in XML or TXT document containing uspto bulk patent data.
+        zip_file (str or file-like): path of zip file, or binary file-like object holding it.
+    
+    Returns:
+        file-like: binary file object reading the (decompressed) zip member
+
+    Raises:
+        FileNotFoundError: 
+            If expected filename could not be found in zip folder.
+    """
+    with zipfile.ZipFile(zip_file, 'r') as zip_uspto:
+        member = find_zip_member(file_name, zip_uspto)
+        if member is None:
+            raise FileNotFoundError("Unable to find file {} in downloaded zip file".format(file_name))
+        # member stays readable after the archive is closed
+        return zip_uspto.open(member)
+
+def open_input(input_file):
+    """Helper function used by converters to accept either a path or an open binary file-like object.
+
+    Args:
+        input_file (str or file-like): path of file, or binary file-like object to read from.
+
+    Returns:
+        context manager: yields a binary file object; only closes it if it was opened here
+    """
+    if hasattr(input_file, 'read'):
+        return nullcontext(input_file)
+    return open(input_file, 'rb')
+
+def uncompress_zip(file_name, zip_name, remove_zip = True, dest_dir = None):
     """Helper function used to uncompress zip file downloaded in from uspto url link. 
         
     Args: 
         zip_file (str): name of zip file from which file containing uspto bulk patent data will be extracted
         file_name (str): expected file name of in XML or TXT document containing uspto bulk patent data.
+        remove_zip (bool, default True): delete zip file after extracting (``False`` for cached zips).
+        dest_dir (str, default None): directory to extract to, the current directory if ``None``.
     
     Returns:
-        string: returns filename of output file if completed successfully else False
+        string: returns path of output file if completed successfully else False
 
     Raises:
         FileNotFoundError: 
             If expected filename could not be found in zip folder.
     """
-    regex_to_match = re.compile("(./)?(?i:{})".format(file_name))
     with zipfile.ZipFile(zip_name, 'r') as zip_uspto:
-        files = " ".join([file.filename for file in zip_uspto.infolist()])
-        poss_match = regex_to_match.search(files)
-        if poss_match:
+        output_file = find_zip_member(file_name, zip_uspto)
+        if output_file:
             # file found
-            output_file = poss_match[0]
-            zip_uspto.extract(output_file)
-    remove(zip_name)            # delete zip
-    if not poss_match:
+            output_file = zip_uspto.extract(output_file, dest_dir)
+    if remove_zip:
+        remove(zip_name)            # delete zip
+    if not output_file:
         raise FileNotFoundError("Unable to extract file {} from downloaded zip file".format(file_name)) 
-    return output_file
\ No newline at end of file
+    return output_file
+
+def week_files(store_path):
+    """Week files of a store built by ``store.sync()``, in store order (by year, then file name).
+
+    Args:
+        store_path (str): directory of the store.
+
+    Returns:
+        list[str]: paths of the week files (``<store_path>/<year>/<file>.csv``)
+    """
+    files = []
+    for year_dir in sorted(glob(path.join(store_path, "[0-9]" * 4))):
+        files.extend(sorted(glob(path.join(year_dir, "*.csv"))))
+    return files
+
+def write_npy(array, file_path):
+    """Saves a NumPy array to `file_path` atomically: it is written to a temporary file that is then
+    renamed, so readers (e.g. memory-mapping the file) never see a partial array.
+
+    Args:
+        array (ndarray): array to save.
+        file_path (str): path of the ``.npy`` file.
+    """
+    temp_path = file_path + ".part"
+    with open(temp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(temp_path, file_path)
@@ -0,0 +1,79 @@
+# private temporary directory of a conversion run, so several runs can share a working directory or host
+import os, shutil, tempfile, uuid
+from os import path
+from contextlib import contextmanager
+
+
+class Workspace:
+    """Temporary directory holding the intermediate files of one conversion run.
+
+    Every run gets a directory of its own (``patentpy-<unique>`` under `root`), so downloaded zip files,
+    extracted weeks and shards of concurrent runs never collide, whatever their working directory. The
+    directory and everything in it is removed when the workspace is closed, also if the run fails.
+    Finished outputs are written through ``staged()`` and only appear under their final name once
+    complete.
+
+    Args:
+        root (str, default None): directory to create the workspace in, e.g. on a fast local disk or
+            tmpfs; created if it does not exist. The system temporary directory (``TMPDIR``) if ``None``.
+
+    Attributes:
+        dir (str): path of the workspace directory.
+    """
+    def __init__(self, root = None):
+        if root is not None:
+            os.makedirs(root, exist_ok = True)
+        self.dir = tempfile.mkdtemp(prefix = "patentpy-", dir = root)
+
+    def path(self, name):
+        """Returns the path of the file ``name`` in the workspace."""
+        return path.join(self.dir, name)
+
+    def week_zip(self, row):
+        """Returns the path to store the zip file of row `row` of a run at.
+
+        Each row gets a directory of its own, which its member is extracted into as well, so rows for the
+        same week (e.g. converted by concurrent workers) never share or remove each other's files.
+        """
+        row_dir = self.path("row-{}".format(row))
+        os.makedirs(row_dir, exist_ok = True)
+        return path.join(row_dir, "week.zip")
+
+    @contextmanager
+    def staged(self, output_file, append = False):
+        """Yields a temporary path to write `output_file` to, and publishes it once the block is done.
+
+        The temporary file has a unique name next to `output_file` (on the same file system, so it can
+        be renamed). If the block completes, it is atomically renamed to `output_file`; if `append` and
+        `output_file` already exists, its contents are appended to it instead, in one go. If the block
+        raises, the temporary file is removed and `output_file` is left as it was.
+
+        Args:
+            output_file (str): path of the finished output.
+            append (bool, default False): append to an existing `output_file` instead of replacing it.
+
+        Yields:
+            string: path of the temporary file (not created yet)
+        """
+        directory, name = path.split(path.abspath(output_file))
+        temp_file = path.join(directory, ".{}.{}.part".format(name, uuid.uuid4().hex))
+        try:
+            yield temp_file
+            if append and path.exists(output_file):
+                with open(output_file, 'ab') as fout, open(temp_file, 'rb') as fin:
+                    shutil.copyfileobj(fin, fout)
+            elif path.exists(temp_file):
+                os.replace(temp_file, output_file)
+        finally:
+            if path.exists(temp_file):
+                os.remove(temp_file)
+
+    def close(self):
+        """Removes the workspace directory and all files in it."""
+        shutil.rmtree(self.dir, ignore_errors = True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -27,8 +27,8 @@ __version__ = get_version("patentpy/__init__.py")
 
 ext_modules = [
     Pybind11Extension("convert_funcs",
-        ["src/convert_funcs.cpp", "src/wrapper.cpp"],
-        cxx_std=11,
+        ["src/convert_funcs.cpp", "src/convert_xml1.cpp", "src/wrapper.cpp"],
+        cxx_std=17,
         define_macros = [('VERSION_INFO', __version__)],
         ),
 ]
@@ -45,6 +45,7 @@ setup(
     packages = ["patentpy"],
     ext_modules = ext_modules,
     install_requires = ["pandas", "lxml", "tqdm"],
+    extras_require = {"parquet": ["pyarrow"]},
     classifiers = [
             "Programming Language :: Python :: 3",
             "Programming Language :: C++",
@@ -1,315 +1,508 @@
 #include <iostream>
 #include <fstream>
 #include <string>
+#include <string_view>
 #include <algorithm>
 #include <cctype>
+#include <cstring>
+#include <functional>
+#include <vector>
 
+#include "convert_funcs.hpp"
 
-// checks if string starts w/ a prefix
-// WORKS (basic test cases)
-bool startsWith(const std::string &text, const std::string &prefix)
+// size of blocks the input is read in, and of the output buffer
+const size_t BLOCK_SIZE = 1 << 20;
+
+const char *FIELD_NAMES[N_FIELDS] = {"WKU", "Title", "App_Date", "Issue_Date", "Inventor", "Assignee",
+                                     "ICL_Class", "References", "Claims"};
+
+std::string csvHeader(unsigned fields)
 {
-    return (text.find(prefix) == 0);
+    std::string header;
+    for (int i = 0; i < N_FIELDS; i++)
+    {
+        if (!(fields & (1u << i))) continue;
+        if (!header.empty()) header.push_back(',');
+        header.append(FIELD_NAMES[i]);
+    }
+    return header + "\n";
 }
 
-// remove bad chars, 0x9b for now
-void replaceBadChars(std::string &text) 
+CsvWriter::CsvWriter(const std::string &output_file, bool append, bool header, unsigned fields)
 {
-    std::replace(text.begin(), text.end(), '\x9b', '!');
+    // writes are done in whole blocks from `buffer`, so the stream itself is unbuffered
+    fout.rdbuf()->pubsetbuf(nullptr, 0);
+    fout.open(output_file, append ? std::ios::binary | std::ios::app : std::ios::binary);
+    buffer.reserve(BLOCK_SIZE + (BLOCK_SIZE >> 2));
+    if (header) buffer.append(csvHeader(fields));
 }
 
-// remove whitespace from beginning of a string
-// WORKS (basic test cases)
-int findBeginWhitespace(std::string &text)
+CsvWriter::~CsvWriter()
 {
-    int start = 0;
-    while (text[start] == ' ' || text[start] == '\n' || text[start] == '\t' || text[start] == '\r')
-        start++;
-    return start;
+    close();
 }
 
-// remove whitespace from end of a string
-// WORKS (basic test cases)
-int findEndWhitespace(std::string &text)
+void CsvWriter::field(std::string_view value, bool quote)
 {
-    int end = text.length();
-    while (text[end - 1] == ' ' || text[end - 1] == '\n' || text[end - 1] == '\t' || text[end - 1] == '\r')
-      end--;
-    return end;
+    if (!rowStart) buffer.push_back(',');
+    rowStart = false;
+    if (!quote && value.find_first_of(",\"\r\n") == std::string_view::npos)
+    {
+        buffer.append(value);
+        return;
+    }
+    // copy the runs between quotes, doubling each quote
+    buffer.push_back('"');
+    size_t start = 0, end;
+    while ((end = value.find('"', start)) != std::string_view::npos)
+    {
+        buffer.append(value.substr(start, end + 1 - start));
+        buffer.push_back('"');
+        start = end + 1;
+    }
+    buffer.append(value.substr(start));
+    buffer.push_back('"');
 }
 
-// remove whitespace from beginning and end
-void stripEdgeWhitespace(std::string &text)
+void CsvWriter::joinedField(const std::vector<std::string> &values, bool quote)
 {
-    int start = findBeginWhitespace(text);
-    int end = findEndWhitespace(text);
-    text = text.substr(start, end);
+    std::string joined;
+    for (size_t k = 0; k < values.size(); k++)
+    {
+        if (k > 0) joined.push_back(';');
+        joined += values[k];
+    }
+    field(joined, quote);
 }
 
-// extract single-line field and strip whitespace
-std::string extractField(const std::string &line, int startPos)
+void CsvWriter::endRow()
 {
-    // extract, strip whitespace, and return
-    std::string ans = line.substr(startPos);
-    stripEdgeWhitespace(ans);
-    return ans;
+    buffer.push_back('\n');
+    rowStart = true;
+    countRows++;
+    if (buffer.size() >= BLOCK_SIZE) flush();
 }
 
-void formatName(std::string &name)
+void CsvWriter::rawRow(std::string_view row)
 {
-    long unsigned int semicolon = name.find(';');
+    buffer.append(row);
+    countRows++;
+    if (buffer.size() >= BLOCK_SIZE) flush();
+}
 
-    // leave as-is if there's no semi colon or if the format is not as expected
-    if (semicolon == std::string::npos || name.length() < semicolon + 2) return ;
+void CsvWriter::flush()
+{
+    if (buffer.empty()) return;
+    fout.write(buffer.data(), buffer.size());
+    fout.flush();
+    buffer.clear();
+}
 
-    std::string temp = name.substr(0, semicolon),
-                revised = name.substr(semicolon + 2);
+void CsvWriter::close()
+{
+    if (!fout.is_open()) return;
+    flush();
+    fout.close();
+}
+
+unsigned PatentFilter::fields() const
+{
+    return (dateFrom.empty() && dateTo.empty() ? 0 : ISSUE_DATE) | (iclPrefixes.empty() ? 0 : ICL_CLASS) |
+           (assigneeMatch ? ASSIGNEE : 0);
+}
+
+// whether `pred` holds for any of the ';'-separated values of `field`
+// (by reference: copying `assigneeMatch` would copy what it holds, possibly w/o the GIL)
+template <typename Pred>
+bool anyValue(const std::string &field, const Pred &pred)
+{
+    size_t start = 0;
+    while (start < field.size())
+    {
+        size_t end = field.find(';', start);
+        if (end == std::string::npos) end = field.size();
+        if (pred(field.substr(start, end - start))) return true;
+        start = end + 1;
+    }
+    return false;
+}
 
-    name = revised + " " + temp;
+bool PatentFilter::matches(const std::string &issDate, const std::string &iclClass, const std::string &assignee) const
+{
+    if (!dateFrom.empty() && issDate < dateFrom) return false;
+    if (!dateTo.empty() && issDate > dateTo) return false;
+    if (!iclPrefixes.empty() && !anyValue(iclClass, [this](const std::string &icl) {
+            // whitespace inside classes differs between years, so it is ignored
+            std::string compact;
+            for (char c : icl)
+                if (!isspace((unsigned char) c)) compact.push_back(c);
+            for (const std::string &prefix : iclPrefixes)
+                if (compact.compare(0, prefix.size(), prefix) == 0) return true;
+            return false;
+        }))
+        return false;
+    if (assigneeMatch && !anyValue(assignee, assigneeMatch)) return false;
+    return true;
 }
 
-void appendToField(std::string &orig, const std::string &addon)
+
+// reads lines from a stream (or a block of memory) through one reusable buffer; lines are
+// string_views into the buffer and stay valid until the next call
+class LineReader
 {
-    if (orig == "")
-      orig = addon;
-    else
-      orig = orig + ';' + addon;
+public:
+    explicit LineReader(std::istream &fin) : fin(&fin), buffer(BLOCK_SIZE), data(buffer.data()) {}
+    LineReader(const char *data, size_t size) : fin(nullptr), data(data), end(size) {}
+
+    // next line w/o '\n'; false (like getline() setting eof) if no '\n' was found, `line` then
+    // holds the rest of the input
+    bool next(std::string_view &line)
+    {
+        while (true)
+        {
+            const char *newline = (const char *) memchr(data + pos, '\n', end - pos);
+            if (newline != nullptr)
+            {
+                line = std::string_view(data + pos, newline - (data + pos));
+                pos = newline - data + 1;
+                return true;
+            }
+            if (!refill())
+            {
+                line = std::string_view(data + pos, end - pos);
+                pos = end;
+                return false;
+            }
+        }
+    }
+
+private:
+    std::istream *fin;
+    std::vector<char> buffer;
+    const char *data;
+    size_t pos = 0, end = 0;
+
+    // move unread part to front of buffer and read next block, false at end of input
+    bool refill()
+    {
+        if (fin == nullptr || !*fin) return false;
+        size_t rest = end - pos;
+        if (rest > buffer.size() / 2) buffer.resize(buffer.size() * 2);        // very long line
+        std::memmove(buffer.data(), buffer.data() + pos, rest);
+        fin->read(buffer.data() + rest, buffer.size() - rest);
+        data = buffer.data();
+        pos = 0;
+        end = rest + fin->gcount();
+        return fin->gcount() > 0;
+    }
+};
+
+
+// checks if string starts w/ a prefix
+inline bool startsWith(std::string_view text, std::string_view prefix)
+{
+    return text.substr(0, prefix.size()) == prefix;
 }
 
-void alphaDigitOnly(std::string &text)
+inline bool isEdgeWhitespace(char c)
 {
-    std::string ans = "";
-    int len = text.length();
-    for (int i = 0; i < len; i++)
-        if (isdigit(text[i]) || isalpha(text[i]))
-          ans.push_back(text[i]);
+    return c == ' ' || c == '\n' || c == '\t' || c == '\r';
+}
 
-    text = ans;
+// remove whitespace from beginning and end
+// NOTE: keeps the behavior of the original std::string version (`substr(start, end)`), i.e. at most
+// as many trailing whitespace chars are removed as there are non-whitespace chars plus leading ones
+std::string_view stripEdgeWhitespace(std::string_view text)
+{
+    size_t start = 0, end = text.size();
+    while (start < text.size() && isEdgeWhitespace(text[start])) start++;
+    while (end > 0 && isEdgeWhitespace(text[end - 1])) end--;
+    return text.substr(start, end);
 }
 
-void removeQuotes(std::string &text)
+// extract single-line field and strip whitespace
+inline std::string_view extractField(std::string_view line, size_t startPos)
 {
-    std::replace(text.begin(), text.end(), '\"', ' ');
-    std::replace(text.begin(), text.end(), '\'', ' ');
+    return stripEdgeWhitespace(line.substr(startPos));
 }
 
-// pybind11 export
-int txt_to_df_cpp(std::string input_file, std::string output_file, bool append, bool header)
+// "Last; First" -> "First Last"
+void formatName(std::string_view name, std::string &out)
 {
-    // setup IO
-    std::ifstream fin(input_file);
-    std::ofstream fout;
+    size_t semicolon = name.find(';');
+    out.clear();
 
-    // initialize ofstream depending on append param
-    if (append)
+    // leave as-is if there's no semi colon or if the format is not as expected
+    if (semicolon == std::string_view::npos || name.length() < semicolon + 2)
     {
-        fout = std::ofstream(output_file, std::ios::app);
+        out.append(name);
+        return;
     }
-    else
-    {
-        fout = std::ofstream(output_file);
 
-        // output header line to CSV (if necessary)
-        if (header) fout << "WKU,Title,App_Date,Issue_Date,Inventor,Assignee,ICL_Class,References,Claims\n";
+    out.append(name.substr(semicolon + 2));
+    out.push_back(' ');
+    out.append(name.substr(0, semicolon));
+}
+
+inline void appendToField(std::string &orig, std::string_view addon)
+{
+    if (!orig.empty()) orig.push_back(';');
+    orig.append(addon);
+}
+
+void alphaDigitOnly(std::string_view text, std::string &out)
+{
+    out.clear();
+    for (char c : text)
+        if (isalnum((unsigned char) c))
+            out.push_back(c);
+}
+
+// replace bad chars, 0x9b for now
+void replaceBadChars(std::string &text)
+{
+    std::replace(text.begin(), text.end(), '\x9b', '!');
+}
+
+// write the `fields` of a patent as CSV row
+void writeTxtRow(CsvWriter &out, const TxtPatent &patent, unsigned fields)
+{
+    const std::string *values[N_FIELDS] = {&patent.id, &patent.title, &patent.appDate, &patent.issDate,
+                                           &patent.inventor, &patent.assignee, &patent.iclClass,
+                                           &patent.refs, &patent.claims};
+    // WKU and dates are only quoted if needed
+    const unsigned quoted = ALL_FIELDS & ~(WKU | APP_DATE | ISSUE_DATE);
+
+    for (int i = 0; i < N_FIELDS; i++)
+    {
+        unsigned field = 1u << i;
+        if (fields & field) out.field(*values[i], quoted & field);
     }
+    out.endRow();
+}
+
+// read TXT data line-by-line and call `onPatent` for each patent `filter` keeps (all if null); fields not in 
+// `fields` are left empty
+int parseTxt(LineReader &reader, unsigned fields, const PatentFilter *filter,
+             const std::function<void(TxtPatent &)> &onPatent)
+{
+    // fields looked at by the filter are extracted, even if not requested
+    const unsigned wanted = fields;
+    if (filter) fields |= filter->fields();
+
+    // variables holding patent properties, reused for all patents
+    TxtPatent patent;
+    patent.title.reserve(256);
+    patent.inventor.reserve(256);
+    patent.assignee.reserve(256);
+    patent.iclClass.reserve(256);
+    patent.refs.reserve(1024);
+    patent.claims.reserve(16384);
+
+    std::string_view currLine, tempLine;
+    std::string tempInvt, tempAssg, tempRef;
 
-    // variables holding patent properties
-    std::string currID = "",
-                title = "",
-                appDate = "",
-                issDate = "",
-                inventor = "",
-                assignee = "",
-                iclClass = "",
-                refs = "",
-                currLine,
-                tempLine,
-                tempInvt = "",
-                tempAssg = "",
-                tempClass = "",
-                tempRef = "",
-                currClaims = "",
-                tempClaims = "";
-                
     bool inPatent = false,
          gotAPD = false,
          gotISD = false,
          inClaims = false;
+    // filter result of the current patent: 0 not checked yet, 1 kept, -1 rejected (rest of it is skipped)
+    int verdict = 0;
 
-    // read input file line-by-line and store patent data
-    getline(fin, currLine);
+    // check filter once the fields it looks at are complete, i.e. before references and claims
+    auto checkPatent = [&]() {
+        if (verdict != 0) return;
+        verdict = !filter || filter->matches(patent.issDate, patent.iclClass, patent.assignee) ? 1 : -1;
+        if (verdict == -1) inClaims = false;
+    };
+
+    // clean up fields of a finished patent and hand it on
+    auto finishPatent = [&]() {
+        checkPatent();
+        if (verdict == -1) return;
+        if (wanted & CLAIMS) replaceBadChars(patent.claims);
+        if (wanted & TITLE) replaceBadChars(patent.title);
+        onPatent(patent);
+    };
+
+    // read input line-by-line and store patent data (a line is only handled if terminated by '\n')
     int countPat = 0;
-    while (!fin.eof())
+    while (reader.next(currLine))
     {
         // look at current line
         if (startsWith(currLine, "PATN"))
         {
             // print past patent (unless this is the first one)
             if (inPatent)
-            {
-                // remove quotes from text claims field first to avoid CSV issues
-                removeQuotes(currClaims);
-                removeQuotes(inventor);
-                removeQuotes(assignee);
-                removeQuotes(title);
-                replaceBadChars(title);
-
-                fout << currID
-                     << ",\"" << title
-                     << "\"," << appDate
-                     << "," << issDate
-                     << ",\"" << inventor
-                     << "\",\"" << assignee
-                     << "\",\"" << iclClass
-                     << "\",\"" << refs
-                     << "\",\"" << currClaims
-                     << "\"\n";
-            }
+                finishPatent();
             else inPatent = true;
 
             // update counter/tracker vars
             countPat++;
             gotAPD = false;
             gotISD = false;
-            title = "";
-            appDate = "";
-            issDate = "";
-            tempInvt = "";
-            inventor = "";
-            tempAssg = "";
-            assignee = "";
-            tempClass = "";
-            iclClass = "";
-            tempRef = "";
-            refs = "";
-            currClaims = "";
-            tempClaims = "";
             inClaims = false;
+            verdict = 0;
+            patent.title.clear();
+            patent.appDate.clear();
+            patent.issDate.clear();
+            patent.inventor.clear();
+            patent.assignee.clear();
+            patent.iclClass.clear();
+            patent.refs.clear();
+            patent.claims.clear();
+            tempInvt.clear();
+            tempAssg.clear();
+            tempRef.clear();
+        }
+        else if (!inPatent)
+        {
+            inClaims = false;
+        }
+        else if (verdict == -1)
+        {
+            // rejected by filter, skip until next patent
         }
-        else if (inPatent && startsWith(currLine, "TTL  "))
+        else if (startsWith(currLine, "TTL  "))
         {
-            title = extractField(currLine, 5);
+            patent.title.assign(extractField(currLine, 5));
         }
-        else if (inPatent && startsWith(currLine, "WKU  "))
+        else if (startsWith(currLine, "WKU  "))
         {
-            currID = extractField(currLine, 5);
+            patent.id.assign(extractField(currLine, 5));
         }
-        else if (inPatent && !gotAPD && startsWith(currLine, "APD  "))
+        else if (!gotAPD && startsWith(currLine, "APD  "))
         {
             gotAPD = true;
-            appDate = extractField(currLine, 5);
+            patent.appDate.assign(extractField(currLine, 5));
         }
-        else if (inPatent && !gotISD && startsWith(currLine, "ISD  "))
+        else if (!gotISD && startsWith(currLine, "ISD  "))
         {
             gotISD = true;
-            issDate = extractField(currLine, 5);
+            patent.issDate.assign(extractField(currLine, 5));
         }
-        else if (inPatent && startsWith(currLine, "INVT"))
+        else if (startsWith(currLine, "INVT"))
         {
             // read next line to get inventor name (and confirm format)
-            getline(fin, tempLine);
-            if (startsWith(tempLine, "NAM  "))
+            bool more = reader.next(tempLine);
+            if (wanted & INVENTOR)
             {
-                tempInvt = extractField(tempLine, 5);
-                formatName(tempInvt);
-            }
+                if (startsWith(tempLine, "NAM  "))
+                    formatName(extractField(tempLine, 5), tempInvt);
 
-            // add this inventor to set of inventors for this patent
-            appendToField(inventor, tempInvt);
+                // add this inventor to set of inventors for this patent
+                appendToField(patent.inventor, tempInvt);
+            }
+            if (!more) break;
         }
-        else if (inPatent && startsWith(currLine, "ASSG"))
+        else if (startsWith(currLine, "ASSG"))
         {
             // read next line to get assignee name (and confirm format)
-            getline(fin, tempLine);
-            if (startsWith(tempLine, "NAM  "))
+            bool more = reader.next(tempLine);
+            if (fields & ASSIGNEE)
             {
-                tempAssg = extractField(tempLine, 5);
-
                 // fix name format if person (and not corporation)
-                if (tempAssg.find(';') != std::string::npos)
-                  formatName(tempAssg);
-            }
+                if (startsWith(tempLine, "NAM  "))
+                    formatName(extractField(tempLine, 5), tempAssg);
 
-            // add this assignee to set of assignees for this patent
-            appendToField(assignee, tempAssg);
+                // add this assignee to set of assignees for this patent
+                appendToField(patent.assignee, tempAssg);
+            }
+            if (!more) break;
         }
-        else if (inPatent && startsWith(currLine, "ICL  "))
+        else if (startsWith(currLine, "ICL  "))
         {
-            tempClass = extractField(currLine, 5);
-            appendToField(iclClass, tempClass);
+            if (fields & ICL_CLASS) appendToField(patent.iclClass, extractField(currLine, 5));
         }
-        else if (inPatent && startsWith(currLine, "UREF"))
+        else if (startsWith(currLine, "UREF"))
         {
             // read next line to get patent number (and confirm format)
-            getline(fin, tempLine);
-            if (startsWith(tempLine, "PNO  "))
+            bool more = reader.next(tempLine);
+            if (filter) checkPatent();
+            if (verdict != -1 && (fields & REFERENCES))
             {
-                tempRef = extractField(tempLine, 5);
-                alphaDigitOnly(tempRef);
-            }
+                if (startsWith(tempLine, "PNO  "))
+                    alphaDigitOnly(extractField(tempLine, 5), tempRef);
 
-            // add this reference to set of references for this patent
-            appendToField(refs, tempRef);
+                // add this reference to set of references for this patent
+                appendToField(patent.refs, tempRef);
+            }
+            if (!more) break;
         }
-        else if (inPatent && (startsWith(currLine, "CLMS") || startsWith(currLine, "DCLM")))
+        else if (startsWith(currLine, "CLMS") || startsWith(currLine, "DCLM"))
         {
-            // we're in claims, text will be coming soon
-            inClaims = true;
+            // we're in claims, text will be coming soon (claims lines are skipped if not wanted)
+            if (filter) checkPatent();
+            inClaims = verdict != -1 && (fields & CLAIMS);
         }
         // start of claims section marked with STM
-        else if (inPatent && inClaims && startsWith(currLine, "STM "))
+        else if (inClaims && startsWith(currLine, "STM "))
         {
-            tempClaims = extractField(currLine, 5);
-            stripEdgeWhitespace(tempClaims);
-            replaceBadChars(tempClaims);
-            currClaims = tempClaims;
+            patent.claims.assign(stripEdgeWhitespace(extractField(currLine, 5)));
         }
-        else if (inPatent && inClaims && startsWith(currLine, "NUM "))
+        else if (inClaims && startsWith(currLine, "NUM "))
         {
             // don't do anything, but don't want to go to else branch either
         }
-        else if (inPatent && inClaims && (startsWith(currLine, "PAR  ") ||
-                                          startsWith(currLine, "PA1  ") ||
-                                          startsWith(currLine, "PAL  ") ||
-                                          startsWith(currLine, "     ")))
+        else if (inClaims && (startsWith(currLine, "PAR  ") ||
+                              startsWith(currLine, "PA1  ") ||
+                              startsWith(currLine, "PAL  ") ||
+                              startsWith(currLine, "     ")))
         {
             // add claims text
-            tempClaims = extractField(currLine, 5);
-            stripEdgeWhitespace(tempClaims);
-            replaceBadChars(tempClaims);
-            currClaims += " " + tempClaims;
+            patent.claims.push_back(' ');
+            patent.claims.append(stripEdgeWhitespace(extractField(currLine, 5)));
         }
         else
         {
             // not in claims anymore
             inClaims = false;
         }
-
-        // read next line
-        getline(fin, currLine);
     }
 
-    // output details of last patent
-    removeQuotes(currClaims);
-    removeQuotes(inventor);
-    removeQuotes(assignee);
-    removeQuotes(title);
-    replaceBadChars(title);
-    fout << currID
-         << ",\"" << title
-         << "\"," << appDate
-         << "," << issDate
-         << ",\"" << inventor
-         << "\",\"" << assignee
-         << "\",\"" << iclClass
-         << "\",\"" << refs
-         << "\",\"" << currClaims
-         << "\"\n";
-
-    // close IO
-    fin.close();
-    fout.close();
+    // output details of last patent (if any, e.g. a chunk of the file may hold none)
+    if (inPatent)
+        finishPatent();
 
     // return number of patents
     return countPat;
-}
\ No newline at end of file
+}
+
+// convert TXT data from `reader` to CSV
+int txtToDf(LineReader &reader, const std::string &output_file, bool append, bool header, unsigned fields,
+            const PatentFilter *filter, int *rowsWritten)
+{
+    // the header is only written to new files
+    CsvWriter out(output_file, append, header && !append, fields);
+    int countPat = parseTxt(reader, fields, filter, [&](TxtPatent &patent) { writeTxtRow(out, patent, fields); });
+    out.close();
+    if (rowsWritten) *rowsWritten = out.rows();
+    return countPat;
+}
+
+// pybind11 export
+int txt_to_df_cpp(std::string input_file, std::string output_file, bool append, bool header, unsigned fields,
+                  const PatentFilter *filter, int *rowsWritten)
+{
+    std::ifstream fin(input_file, std::ios::binary);
+    LineReader reader(fin);
+    return txtToDf(reader, output_file, append, header, fields, filter, rowsWritten);
+}
+
+// pybind11 export (buffer version)
+int txt_buffer_to_df_cpp(const char *data, size_t size, std::string output_file, bool append, bool header,
+                         unsigned fields, const PatentFilter *filter, int *rowsWritten)
+{
+    LineReader reader(data, size);
+    return txtToDf(reader, output_file, append, header, fields, filter, rowsWritten);
+}
+
+// pybind11 export (records version)
+std::vector<TxtPatent> txt_buffer_to_records_cpp(const char *data, size_t size, unsigned fields,
+                                                 const PatentFilter *filter)
+{
+    LineReader reader(data, size);
+    std::vector<TxtPatent> patents;
+    parseTxt(reader, fields, filter, [&patents](TxtPatent &patent) { patents.push_back(patent); });
+    return patents;
+}
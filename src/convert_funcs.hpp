@@ -1,3 +1,96 @@
+#include<fstream>
+#include<functional>
 #include<string>
+#include<string_view>
+#include<vector>
 
-int txt_to_df_cpp(std::string input_file, std::string output_file, bool append, bool header);
+// columns of converted patent data (utility.FIELDS), as bits of a field mask
+enum Field
+{
+    WKU = 1 << 0,
+    TITLE = 1 << 1,
+    APP_DATE = 1 << 2,
+    ISSUE_DATE = 1 << 3,
+    INVENTOR = 1 << 4,
+    ASSIGNEE = 1 << 5,
+    ICL_CLASS = 1 << 6,
+    REFERENCES = 1 << 7,
+    CLAIMS = 1 << 8
+};
+const int N_FIELDS = 9;
+const unsigned ALL_FIELDS = (1 << N_FIELDS) - 1;
+extern const char *FIELD_NAMES[N_FIELDS];
+
+// CSV header line of the columns in `fields`
+std::string csvHeader(unsigned fields);
+
+// buffered CSV output (RFC 4180, rows end w/ '\n'): fields holding quotes have them doubled; the buffer is
+// written in blocks of about BLOCK_SIZE bytes
+class CsvWriter
+{
+public:
+    // opens (or appends to) `output_file` and writes the header of `fields` if `header`
+    CsvWriter(const std::string &output_file, bool append, bool header = false, unsigned fields = ALL_FIELDS);
+    ~CsvWriter();
+
+    // next field of the current row; if `quote` is false, it is only quoted if it holds a comma, quote or line end
+    void field(std::string_view value, bool quote = true);
+    // next field holding `values` joined by ';'
+    void joinedField(const std::vector<std::string> &values, bool quote = true);
+    // end the current row
+    void endRow();
+    // a whole row already formatted as CSV (ending w/ '\n')
+    void rawRow(std::string_view row);
+    // write the buffer to the file
+    void flush();
+    void close();
+    // whether the file was opened and not closed yet
+    bool isOpen() const { return fout.is_open(); }
+    // number of rows ended so far (not counting the header)
+    int rows() const { return countRows; }
+
+private:
+    std::ofstream fout;
+    std::string buffer;
+    bool rowStart = true;
+    int countRows = 0;
+};
+
+// conditions on the cheap fields of a patent (utility.PatentFilter), checked before expensive ones are extracted
+struct PatentFilter
+{
+    // issue dates as YYYYMMDD, empty for an open end
+    std::string dateFrom, dateTo;
+    // ICL class prefixes w/o whitespace, any of them has to match
+    std::vector<std::string> iclPrefixes;
+    // called with each assignee name, unset if assignees are not checked
+    std::function<bool(const std::string &)> assigneeMatch;
+
+    // fields the conditions look at
+    unsigned fields() const;
+    // whether a patent with these (';'-joined) fields is kept
+    bool matches(const std::string &issDate, const std::string &iclClass, const std::string &assignee) const;
+};
+
+// fields of a patent from TXT data, multi-valued fields joined by ';'
+struct TxtPatent
+{
+    std::string id, title, appDate, issDate, inventor, assignee, iclClass, refs, claims;
+};
+
+// `filter` may be null (all patents kept); the number of rows written is stored in `rowsWritten` unless null
+int txt_to_df_cpp(std::string input_file, std::string output_file, bool append, bool header,
+                  unsigned fields = ALL_FIELDS, const PatentFilter *filter = nullptr, int *rowsWritten = nullptr);
+int txt_buffer_to_df_cpp(const char *data, size_t size, std::string output_file, bool append, bool header,
+                         unsigned fields = ALL_FIELDS, const PatentFilter *filter = nullptr,
+                         int *rowsWritten = nullptr);
+std::vector<TxtPatent> txt_buffer_to_records_cpp(const char *data, size_t size, unsigned fields = ALL_FIELDS,
+                                                 const PatentFilter *filter = nullptr);
+// formats the CSV row of a <PATDOC> (its raw lines, from the <PATDOC line to the </PATDOC line) into `row`,
+// false if the patent is skipped
+using Xml1Fallback = std::function<bool(const std::string &doc, std::string &row)>;
+// documents with markup that had to be recovered (mismatched, garbled or unclosed tags) are converted by
+// `fallback` if it is given
+int xml1_to_df_cpp(std::string input_file, std::string output_file, bool append, bool header,
+                   unsigned fields = ALL_FIELDS, const PatentFilter *filter = nullptr, int *rowsWritten = nullptr,
+                   const Xml1Fallback &fallback = nullptr);
@@ -0,0 +1,664 @@
+#include <cctype>
+#include <fstream>
+#include <string>
+#include <vector>
+
+#include "convert_funcs.hpp"
+
+// native version of patentpy/convert_xml1.py: every <PATDOC> is parsed into a small flat tree
+// following the rules of the lxml recovering parser used there (undefined entities dropped, bad
+// bytes replaced, ...) so that output is identical; documents with broken markup (mismatched,
+// garbled or unclosed tags, malformed start tags) are recovered differently by libxml2, so these
+// are handed back to the lxml engine (see xml1_to_df_cpp)
+
+
+// -- utf-8 handling --
+
+// append code point as utf-8
+void appendUtf8(std::string &out, unsigned long cp)
+{
+    if (cp < 0x80)
+        out.push_back((char) cp);
+    else if (cp < 0x800)
+    {
+        out.push_back((char) (0xC0 | (cp >> 6)));
+        out.push_back((char) (0x80 | (cp & 0x3F)));
+    }
+    else if (cp < 0x10000)
+    {
+        out.push_back((char) (0xE0 | (cp >> 12)));
+        out.push_back((char) (0x80 | ((cp >> 6) & 0x3F)));
+        out.push_back((char) (0x80 | (cp & 0x3F)));
+    }
+    else
+    {
+        out.push_back((char) (0xF0 | (cp >> 18)));
+        out.push_back((char) (0x80 | ((cp >> 12) & 0x3F)));
+        out.push_back((char) (0x80 | ((cp >> 6) & 0x3F)));
+        out.push_back((char) (0x80 | (cp & 0x3F)));
+    }
+}
+
+// replace invalid utf-8 w/ U+FFFD, one per maximal invalid subpart (same as Python's
+// bytes.decode("utf-8", "replace"))
+void sanitizeUtf8(const std::string &in, std::string &out)
+{
+    out.clear();
+    out.reserve(in.size());
+    size_t i = 0, n = in.size();
+    while (i < n)
+    {
+        unsigned char c = in[i];
+        if (c < 0x80)
+        {
+            out.push_back(c);
+            i++;
+            continue;
+        }
+
+        // expected continuation bytes and allowed range of the first one
+        int need = 0;
+        unsigned char lo = 0x80, hi = 0xBF;
+        if (c >= 0xC2 && c <= 0xDF) need = 1;
+        else if (c == 0xE0) { need = 2; lo = 0xA0; }
+        else if (c == 0xED) { need = 2; hi = 0x9F; }
+        else if (c >= 0xE1 && c <= 0xEF) need = 2;
+        else if (c == 0xF0) { need = 3; lo = 0x90; }
+        else if (c >= 0xF1 && c <= 0xF3) need = 3;
+        else if (c == 0xF4) { need = 3; hi = 0x8F; }
+
+        size_t j = i + 1;
+        int got = 0;
+        while (got < need && j < n)
+        {
+            unsigned char d = in[j];
+            if (d < lo || d > hi) break;
+            lo = 0x80;
+            hi = 0xBF;
+            j++;
+            got++;
+        }
+
+        if (need > 0 && got == need)
+            out.append(in, i, j - i);
+        else
+            out.append("\xEF\xBF\xBD");
+        i = (got > 0) ? j : i + 1;
+    }
+}
+
+
+// -- tree of a single <PATDOC> --
+
+struct XmlNode
+{
+    std::string tag;
+    std::string text;       // text before first child, empty means None
+    bool textOpen;          // still collecting text
+    int parent;
+    int end;                // one past last descendant (nodes are in document order)
+};
+
+bool isNameStart(unsigned char c)
+{
+    return isalpha(c) || c == '_' || c == ':' || c >= 0x80;
+}
+
+bool isNameChar(unsigned char c)
+{
+    return isNameStart(c) || isdigit(c) || c == '-' || c == '.';
+}
+
+// end of name starting at `pos` (U+FFFE and U+FFFF are no name characters)
+size_t nameEnd(const std::string &doc, size_t pos)
+{
+    size_t n = doc.size();
+    while (pos < n && isNameChar(doc[pos]) &&
+           !(doc.compare(pos, 2, "\xEF\xBF") == 0 && pos + 2 < n && ((unsigned char) doc[pos + 2] & 0xFE) == 0xBE))
+        pos++;
+    return pos;
+}
+
+class XmlTree
+{
+public:
+    std::vector<XmlNode> nodes;
+
+    void parse(const std::string &doc);
+
+    // first `tag` descendant of `node` (lxml: node.find(".//tag"))
+    int first(int node, const std::string &tag) const;
+
+    // all `tag` descendants of `node` (lxml: node.findall(".//tag"))
+    void all(int node, const std::string &tag, std::vector<int> &out) const;
+
+    // `tag` children of `node` (lxml: node.findall("tag"))
+    void children(int node, const std::string &tag, std::vector<int> &out) const;
+
+    // whether the markup of the last document was broken, i.e. the tree may differ from lxml's
+    bool recovered() const { return brokenMarkup; }
+
+private:
+    std::vector<int> stack;
+    bool wellFormed;        // no error found yet
+    bool brokenMarkup;      // error in the structure found (not only in entities or characters)
+
+    void recover();
+
+    void appendText(const std::string &doc, size_t from, size_t to);
+    size_t entity(const std::string &doc, size_t pos, std::string &out);
+    size_t attributes(const std::string &doc, size_t pos, bool &empty);
+    void closeText();
+};
+
+void XmlTree::closeText()
+{
+    if (!stack.empty()) nodes[stack.back()].textOpen = false;
+}
+
+// XML character (as allowed in char references)
+bool isXmlChar(unsigned long cp)
+{
+    return cp == 0x9 || cp == 0xA || cp == 0xD || (cp >= 0x20 && cp <= 0xD7FF) ||
+           (cp >= 0xE000 && cp <= 0xFFFD) || (cp >= 0x10000 && cp <= 0x10FFFF);
+}
+
+// resolve entity/char reference starting at `doc[pos] == '&'`, returns position after it
+size_t XmlTree::entity(const std::string &doc, size_t pos, std::string &out)
+{
+    size_t n = doc.size(), i = pos + 1;
+    if (i < n && doc[i] == '#')
+    {
+        bool hex = (i + 1 < n && doc[i + 1] == 'x');
+        size_t j = i + (hex ? 2 : 1);
+        unsigned long cp = 0;
+        while (j < n && (hex ? isxdigit((unsigned char) doc[j]) : isdigit((unsigned char) doc[j])))
+        {
+            int digit = isdigit((unsigned char) doc[j]) ? doc[j] - '0' : tolower((unsigned char) doc[j]) - 'a' + 10;
+            cp = cp * (hex ? 16 : 10) + digit;
+            if (cp > 0x10FFFF) cp = 0x110000;
+            j++;
+        }
+        if (j < n && doc[j] == ';')
+        {
+            // invalid chars are an error, control chars are kept nonetheless
+            if (!isXmlChar(cp)) wellFormed = false;
+            if (cp > 0 && cp < 0x20) out.push_back((char) cp);
+            else if (isXmlChar(cp)) appendUtf8(out, cp);
+            return j + 1;
+        }
+        wellFormed = false;
+        return j;       // unterminated, dropped
+    }
+
+    if (i >= n || !isNameStart(doc[i]))
+    {
+        wellFormed = false;
+        return i;       // lone '&' dropped
+    }
+
+    size_t j = nameEnd(doc, i);
+    if (j < n && doc[j] == ';')
+    {
+        std::string name = doc.substr(i, j - i);
+        if (name != "amp" && name != "lt" && name != "gt" && name != "quot" && name != "apos")
+            wellFormed = false;         // undefined entities (no DTD) are dropped
+        else if (wellFormed)            // once the document is not well-formed, libxml2 drops these as well
+            out.push_back(name == "amp" ? '&' : name == "lt" ? '<' : name == "gt" ? '>' : name == "quot" ? '"' : '\'');
+        return j + 1;
+    }
+    wellFormed = false;
+    return j;           // unterminated, dropped
+}
+
+// add character data doc[from, to) to text of current element
+void XmlTree::appendText(const std::string &doc, size_t from, size_t to)
+{
+    std::string ignored;
+    bool collect = !stack.empty() && nodes[stack.back()].textOpen;
+    std::string &text = collect ? nodes[stack.back()].text : ignored;
+
+    size_t i = from, run = text.size();     // start of pending characters
+    while (i < to)
+    {
+        unsigned char c = doc[i];
+        if (c == '&')
+        {
+            i = entity(doc, i, text);
+            run = text.size();
+            continue;
+        }
+        if (c == '\r')
+        {
+            // line end normalization
+            text.push_back('\n');
+            i += (i + 1 < to && doc[i + 1] == '\n') ? 2 : 1;
+            continue;
+        }
+        if (c < 0x20 && c != '\t' && c != '\n')
+        {
+            wellFormed = false;
+            i++;        // not allowed in XML, dropped
+            continue;
+        }
+        if (c == 0xEF && i + 2 < to && (unsigned char) doc[i + 1] == 0xBF &&
+            ((unsigned char) doc[i + 2] == 0xBE || (unsigned char) doc[i + 2] == 0xBF))
+        {
+            wellFormed = false;
+            i += 3;     // U+FFFE, U+FFFF not allowed in XML
+            continue;
+        }
+        if (c == ']' && doc.compare(i, 3, "]]>") == 0)
+        {
+            // libxml2 drops the pending characters and the first ']'
+            wellFormed = false;
+            text.resize(run);
+            i++;
+            continue;
+        }
+        text.push_back(c);
+        i++;
+    }
+}
+
+void XmlTree::recover()
+{
+    wellFormed = false;
+    brokenMarkup = true;
+}
+
+bool isBlank(char c)
+{
+    return c == ' ' || c == '\t' || c == '\n' || c == '\r';
+}
+
+// parse attributes of start tag from `pos` (only checked, values are not needed) and return position
+// after the tag; `empty` if the element has no content, i.e. "/>" or a malformed tag (libxml2 then
+// ends the element and parses the rest as character data)
+size_t XmlTree::attributes(const std::string &doc, size_t pos, bool &empty)
+{
+    size_t n = doc.size(), i = pos;
+    std::vector<std::string> names;
+    std::string ignored;
+    empty = false;
+    while (i < n && isBlank(doc[i])) i++;
+
+    while (i < n)
+    {
+        if (doc[i] == '>') return i + 1;
+        if (doc.compare(i, 2, "/>") == 0)
+        {
+            empty = true;
+            return i + 2;
+        }
+        if (!isNameStart(doc[i])) break;
+
+        size_t j = nameEnd(doc, i);
+        std::string name = doc.substr(i, j - i);
+        for (size_t k = 0; k < names.size(); k++)
+            if (names[k] == name) recover();
+        names.push_back(name);
+
+        size_t k = j;
+        while (k < n && isBlank(doc[k])) k++;
+        if (k < n && doc[k] == '=')
+        {
+            k++;
+            while (k < n && isBlank(doc[k])) k++;
+            if (k >= n || (doc[k] != '"' && doc[k] != '\''))
+            {
+                i = k;
+                break;
+            }
+            char quote = doc[k++];
+            while (k < n && doc[k] != quote)
+            {
+                if (doc[k] == '<') recover();
+                if (doc[k] == '&') k = entity(doc, k, ignored);
+                else k++;
+            }
+            i = (k < n) ? k + 1 : n;
+        }
+        else
+        {
+            recover();              // attribute w/o value
+            i = j;
+        }
+
+        // attributes are separated by whitespace
+        size_t next = i;
+        while (next < n && isBlank(doc[next])) next++;
+        if (next == i && next < n && doc[next] != '>' && doc.compare(next, 2, "/>") != 0) break;
+        i = next;
+    }
+
+    // malformed start tag
+    recover();
+    empty = true;
+    return i;
+}
+
+void XmlTree::parse(const std::string &doc)
+{
+    nodes.clear();
+    stack.clear();
+    wellFormed = true;
+    brokenMarkup = false;
+    bool rootClosed = false;
+    size_t n = doc.size(), i = doc.find('<');
+    if (i == std::string::npos) return;
+
+    while (i < n && !rootClosed)
+    {
+        if (doc[i] != '<')
+        {
+            size_t next = doc.find('<', i);
+            if (next == std::string::npos) next = n;
+            appendText(doc, i, next);
+            i = next;
+            continue;
+        }
+
+        if (doc.compare(i, 4, "<!--") == 0)
+        {
+            closeText();
+            size_t end = doc.find("--", i + 4);
+            if (end != std::string::npos && doc.compare(end, 3, "-->") != 0) wellFormed = false;
+            end = doc.find("-->", i + 4);
+            if (end == std::string::npos) recover();
+            i = (end == std::string::npos) ? n : end + 3;
+        }
+        else if (doc.compare(i, 9, "<![CDATA[") == 0)
+        {
+            size_t end = doc.find("]]>", i + 9);
+            if (end == std::string::npos)
+            {
+                recover();
+                end = n;
+            }
+            if (!stack.empty() && nodes[stack.back()].textOpen)
+                nodes[stack.back()].text.append(doc, i + 9, end - i - 9);
+            i = (end == n) ? n : end + 3;
+        }
+        else if (doc.compare(i, 2, "<?") == 0)
+        {
+            closeText();
+            if (doc.compare(i, 5, "<?xml") == 0 && i + 5 < n && !isNameChar(doc[i + 5])) recover();
+            size_t end = doc.find("?>", i + 2);
+            i = (end == std::string::npos) ? n : end + 2;
+        }
+        else if (doc.compare(i, 2, "<!") == 0)
+        {
+            size_t end = doc.find('>', i + 2);
+            i = (end == std::string::npos) ? n : end + 1;
+        }
+        else if (doc.compare(i, 2, "</") == 0)
+        {
+            // any end tag closes the current element (mismatch is an error)
+            size_t j = nameEnd(doc, i + 2);
+            size_t end = doc.find('>', j);
+            for (size_t k = j; k < end && k < n; k++)
+                if (!isBlank(doc[k])) recover();
+            if (stack.empty()) recover();
+            else
+            {
+                if (doc.compare(i + 2, j - i - 2, nodes[stack.back()].tag) != 0) recover();
+                nodes[stack.back()].end = (int) nodes.size();
+                stack.pop_back();
+                if (stack.empty()) rootClosed = true;
+            }
+            i = (end == std::string::npos) ? n : end + 1;
+        }
+        else if (i + 1 < n && isNameStart(doc[i + 1]))
+        {
+            // start tag
+            size_t j = nameEnd(doc, i + 1);
+            std::string tag = doc.substr(i + 1, j - i - 1);
+            bool empty;
+            i = attributes(doc, j, empty);
+
+            closeText();
+            XmlNode node;
+            node.tag = tag;
+            node.textOpen = true;
+            node.parent = stack.empty() ? -1 : stack.back();
+            node.end = -1;
+            nodes.push_back(node);
+            if (empty)
+            {
+                nodes.back().textOpen = false;
+                nodes.back().end = (int) nodes.size();
+                if (node.parent == -1) rootClosed = true;
+            }
+            else stack.push_back((int) nodes.size() - 1);
+        }
+        else
+        {
+            // invalid element name, libxml2 stops parsing here
+            recover();
+            break;
+        }
+    }
+
+    // unclosed elements end at end of document
+    if (!stack.empty()) recover();
+    for (size_t k = 0; k < nodes.size(); k++)
+        if (nodes[k].end == -1) nodes[k].end = (int) nodes.size();
+}
+
+int XmlTree::first(int node, const std::string &tag) const
+{
+    for (int k = node + 1; k < nodes[node].end; k++)
+        if (nodes[k].tag == tag) return k;
+    return -1;
+}
+
+void XmlTree::all(int node, const std::string &tag, std::vector<int> &out) const
+{
+    out.clear();
+    for (int k = node + 1; k < nodes[node].end; k++)
+        if (nodes[k].tag == tag) out.push_back(k);
+}
+
+void XmlTree::children(int node, const std::string &tag, std::vector<int> &out) const
+{
+    out.clear();
+    for (int k = node + 1; k < nodes[node].end; k++)
+        if (nodes[k].parent == node && nodes[k].tag == tag) out.push_back(k);
+}
+
+
+// -- field extraction (see extractRecord1() in convert_xml1.py) --
+
+// node.find(".//outer//inner"), i.e. first `inner` under the first `outer` holding one
+int findPath(const XmlTree &tree, int node, const std::string &outer, const std::string &inner)
+{
+    std::vector<int> outers;
+    tree.all(node, outer, outers);
+    for (size_t k = 0; k < outers.size(); k++)
+    {
+        int found = tree.first(outers[k], inner);
+        if (found != -1) return found;
+    }
+    return -1;
+}
+
+// node.findall(".//outer//inner")
+void findAllPath(const XmlTree &tree, int node, const std::string &outer, const std::string &inner,
+                 std::vector<int> &out)
+{
+    std::vector<int> outers, inners;
+    tree.all(node, outer, outers);
+    out.clear();
+    for (size_t k = 0; k < outers.size(); k++)
+    {
+        tree.all(outers[k], inner, inners);
+        out.insert(out.end(), inners.begin(), inners.end());
+    }
+}
+
+// element.text, "" if the element is empty (like the Python engines)
+const std::string &textOf(const XmlTree &tree, int node)
+{
+    return tree.nodes[node].text;
+}
+
+// "{first} {last}" with "" for missing elements
+std::string personName(const XmlTree &tree, int first, int last)
+{
+    return (first != -1 ? textOf(tree, first) : "") + " " + (last != -1 ? textOf(tree, last) : "");
+}
+
+void appendJoined(std::string &row, const std::vector<std::string> &values)
+{
+    for (size_t k = 0; k < values.size(); k++)
+    {
+        if (k > 0) row.push_back(';');
+        row += values[k];
+    }
+}
+
+// write the `fields` of patent in `tree` as CSV row, false if it has no bibliographic data or `filter` (may
+// be null) rejects it
+bool extractFields1(const XmlTree &tree, CsvWriter &out, unsigned fields, const PatentFilter *filter)
+{
+    // fields looked at by the filter are extracted, even if not requested
+    unsigned wanted = fields | (filter ? filter->fields() : 0);
+    const int root = 0;
+    int wku = findPath(tree, root, "B110", "PDAT"),
+        title = findPath(tree, root, "B540", "PDAT"),
+        appDate = findPath(tree, root, "B220", "PDAT"),
+        issDate = findPath(tree, root, "B140", "PDAT");
+    if (wku == -1 || title == -1 || appDate == -1 || issDate == -1) return false;
+
+    std::vector<int> found, inner;
+    std::vector<std::string> inventors, assignees, iclClass, refs;
+
+    // only requested fields are searched for
+    if (wanted & ASSIGNEE) findAllPath(tree, root, "B731", "NAM", found);
+    else found.clear();
+    for (size_t k = 0; k < found.size(); k++)
+    {
+        int orgName = findPath(tree, found[k], "ONM", "PDAT");
+        if (orgName != -1)
+            assignees.push_back(textOf(tree, orgName));
+        else
+        {
+            // last name only if PDAT is a direct child of SNM (".//SNM/PDAT")
+            int last = -1;
+            std::vector<int> surnames;
+            tree.all(found[k], "SNM", surnames);
+            for (size_t s = 0; s < surnames.size() && last == -1; s++)
+            {
+                tree.children(surnames[s], "PDAT", inner);
+                if (!inner.empty()) last = inner[0];
+            }
+            assignees.push_back(personName(tree, findPath(tree, found[k], "FNM", "PDAT"), last));
+        }
+    }
+
+    if (wanted & ICL_CLASS) tree.all(root, "B511", found);
+    else found.clear();
+    for (size_t k = 0; k < found.size(); k++)
+    {
+        tree.children(found[k], "PDAT", inner);
+        for (size_t m = 0; m < inner.size(); m++) iclClass.push_back(textOf(tree, inner[m]));
+    }
+
+    // check filter before the remaining fields are searched for
+    if (filter)
+    {
+        std::string iclJoined, assigneeJoined;
+        appendJoined(iclJoined, iclClass);
+        appendJoined(assigneeJoined, assignees);
+        if (!filter->matches(textOf(tree, issDate), iclJoined, assigneeJoined)) return false;
+    }
+
+    if (fields & INVENTOR) findAllPath(tree, root, "B721", "NAM", found);
+    else found.clear();
+    for (size_t k = 0; k < found.size(); k++)
+        inventors.push_back(personName(tree, findPath(tree, found[k], "FNM", "PDAT"),
+                                             findPath(tree, found[k], "SNM", "PDAT")));
+
+    // US references only, i.e. no country given
+    if (fields & REFERENCES) tree.all(root, "PCIT", found);
+    else found.clear();
+    for (size_t k = 0; k < found.size(); k++)
+    {
+        if (tree.first(found[k], "CTRY") != -1) continue;
+        int ref = findPath(tree, found[k], "DNUM", "PDAT");
+        if (ref != -1 && !tree.nodes[ref].text.empty()) refs.push_back(tree.nodes[ref].text);
+    }
+
+    std::string claims;
+    std::vector<int> claimNodes, pdats;
+    if (fields & CLAIMS) findAllPath(tree, root, "CL", "CLM", claimNodes);
+    for (size_t k = 0; k < claimNodes.size(); k++)
+    {
+        tree.all(claimNodes[k], "PDAT", pdats);
+        for (size_t m = 0; m < pdats.size(); m++)
+            claims += tree.nodes[pdats[m]].text;
+    }
+
+    // every column is quoted
+    const int single[] = {wku, title, appDate, issDate};
+    const std::vector<std::string> *multi[] = {&inventors, &assignees, &iclClass, &refs};
+    for (int i = 0; i < N_FIELDS; i++)
+    {
+        if (!(fields & (1u << i))) continue;
+        if (i < 4) out.field(textOf(tree, single[i]));
+        else if (i < 8) out.joinedField(*multi[i - 4]);
+        else out.field(claims);
+    }
+    out.endRow();
+    return true;
+}
+
+// pybind11 export
+int xml1_to_df_cpp(std::string input_file, std::string output_file, bool append, bool header, unsigned fields,
+                   const PatentFilter *filter, int *rowsWritten, const Xml1Fallback &fallback)
+{
+    // setup IO
+    std::ifstream fin(input_file, std::ios::binary);
+    CsvWriter out(output_file, append, header, fields);
+
+    std::string currLine, doc, clean, row;
+    XmlTree tree;
+    bool inPatent = false;
+    int countPat = 0;
+
+    // collect lines from <PATDOC to </PATDOC and convert each patent
+    while (getline(fin, currLine))
+    {
+        if (inPatent && currLine.compare(0, 8, "</PATDOC") == 0)
+        {
+            doc += currLine;
+            sanitizeUtf8(doc, clean);
+            tree.parse(clean);
+            countPat++;
+            if (tree.recovered() && fallback)
+            {
+                if (fallback(doc, row)) out.rawRow(row);
+            }
+            else if (!tree.nodes.empty()) extractFields1(tree, out, fields, filter);
+            inPatent = false;
+        }
+        else if (currLine.compare(0, 7, "<PATDOC") == 0)
+        {
+            if (!inPatent) doc.clear();
+            inPatent = true;
+        }
+        if (inPatent)
+        {
+            doc += currLine;
+            doc.push_back('\n');
+        }
+    }
+
+    // close IO
+    fin.close();
+    out.close();
+    if (rowsWritten) *rowsWritten = out.rows();
+
+    return countPat;
+}
@@ -1,17 +1,170 @@
 #include "convert_funcs.hpp"
+#include <memory>
 #include <pybind11/pybind11.h>
+#include <pybind11/stl.h>
 
 #define STRINGIFY(x) #x
 #define MACRO_STRINGIFY(x) STRINGIFY(x)
 
 namespace py = pybind11;
 
+// decode field as utf-8, replacing invalid bytes (like reading the CSV output w/ errors='replace')
+py::str decodeField(const std::string &field)
+{
+    return py::reinterpret_steal<py::str>(PyUnicode_DecodeUTF8(field.data(), field.size(), "replace"));
+}
+
+// split multi-valued field on ';', empty field gives empty list
+py::list splitField(const std::string &field)
+{
+    py::list values;
+    if (field.empty()) return values;
+    size_t start = 0, end;
+    while ((end = field.find(';', start)) != std::string::npos)
+    {
+        values.append(decodeField(field.substr(start, end - start)));
+        start = end + 1;
+    }
+    values.append(decodeField(field.substr(start)));
+    return values;
+}
+
+// field mask of an iterable of column names (``None`` for all columns)
+unsigned fieldMask(const py::object &fields)
+{
+    if (fields.is_none()) return ALL_FIELDS;
+    unsigned mask = 0;
+    for (py::handle field : fields)
+    {
+        std::string name = py::str(field);
+        int i = 0;
+        while (i < N_FIELDS && name != FIELD_NAMES[i]) i++;
+        if (i == N_FIELDS)
+            throw py::value_error("`fields` parameter must only contain names of utility.FIELDS; current value = " +
+                                  name);
+        mask |= 1u << i;
+    }
+    if (!mask) throw py::value_error("`fields` parameter must not be empty");
+    return mask;
+}
+
+// C++ version of a ``utility.PatentFilter``, or of a dict of its arguments (checked and converted by
+// ``utility.check_filter``, like the Python API does); ``None`` gives an inactive filter, i.e. null is passed on
+struct FilterArg
+{
+    PatentFilter filter;
+    bool active = false;
+    py::object checked = py::none();    // the utility.PatentFilter itself, None if inactive
+
+    explicit FilterArg(const py::object &filterArg)
+    {
+        if (filterArg.is_none()) return;
+        py::object patentFilter = py::module_::import("patentpy.utility").attr("check_filter")(filterArg);
+        if (patentFilter.is_none()) return;
+        active = true;
+        checked = patentFilter;
+        py::object dateFrom = patentFilter.attr("date_from"), dateTo = patentFilter.attr("date_to"),
+                   prefixes = patentFilter.attr("icl_prefixes"), regex = patentFilter.attr("assignee_regex");
+        if (!dateFrom.is_none()) filter.dateFrom = dateFrom.cast<std::string>();
+        if (!dateTo.is_none()) filter.dateTo = dateTo.cast<std::string>();
+        if (!prefixes.is_none())
+            for (py::handle prefix : prefixes) filter.iclPrefixes.push_back(prefix.cast<std::string>());
+        if (!regex.is_none())
+        {
+            // names are matched with the Python regex, taking the GIL back for each call; the function only
+            // holds a shared pointer to it, so copies of the function never touch Python reference counts
+            // (the regex itself is released under the GIL once the last copy is gone)
+            std::shared_ptr<py::object> search(new py::object(regex.attr("search")), [](py::object *search) {
+                py::gil_scoped_acquire acquire;
+                delete search;
+            });
+            filter.assigneeMatch = [search](const std::string &name) {
+                py::gil_scoped_acquire acquire;
+                return !(*search)(decodeField(name)).is_none();
+            };
+        }
+    }
+
+    const PatentFilter *get() const { return active ? &filter : nullptr; }
+};
+
+// record tuple of the `fields` in utility.FIELDS order
+py::tuple toRecord(const TxtPatent &patent, unsigned fields)
+{
+    py::object values[N_FIELDS] = {decodeField(patent.id), decodeField(patent.title), decodeField(patent.appDate),
+                                   decodeField(patent.issDate), splitField(patent.inventor),
+                                   splitField(patent.assignee), splitField(patent.iclClass),
+                                   splitField(patent.refs), decodeField(patent.claims)};
+    py::list record;
+    for (int i = 0; i < N_FIELDS; i++)
+        if (fields & (1u << i)) record.append(values[i]);
+    return py::tuple(record);
+}
+
+// append the UTF-8 text of a record value: a str, ``None`` (empty) or an iterable of str (joined by ';')
+void appendValue(std::string &out, const py::handle &value)
+{
+    Py_ssize_t size;
+    if (PyUnicode_Check(value.ptr()))
+    {
+        const char *text = PyUnicode_AsUTF8AndSize(value.ptr(), &size);
+        if (text == nullptr) throw py::error_already_set();
+        out.append(text, size);
+        return;
+    }
+    if (value.is_none()) return;
+    bool first = true;
+    for (py::handle item : value)
+    {
+        if (!first) out.push_back(';');
+        first = false;
+        appendValue(out, item);
+    }
+}
+
+// return value of the *_to_df functions: patents read, and rows written if `withRows`
+py::object dfResult(int countPat, int countRows, bool withRows)
+{
+    if (withRows) return py::make_tuple(countPat, countRows);
+    return py::int_(countPat);
+}
+
 PYBIND11_MODULE(convert_funcs, m) {
     m.doc() = R"pbdoc(Plugin to convert USPTO bulk patent data (from 1976 - present) to CSV from 
-    TXT (original format).
+    TXT (original format) and XML (2002-2004 format).
     )pbdoc";
 
-    m.def("txt_to_df", &txt_to_df_cpp, R"pbdoc(
+    // buffer version registered first, as a `bytes` input_file would also convert to std::string
+    m.def("txt_to_df", [](py::buffer data, std::string output_file, bool append, bool header, py::object fields,
+                          py::object filter, bool with_rows) {
+        unsigned mask = fieldMask(fields);
+        FilterArg patentFilter(filter);
+        py::buffer_info info = data.request();
+        int countPat, countRows;
+        {
+            py::gil_scoped_release release;
+            countPat = txt_buffer_to_df_cpp((const char *) info.ptr, info.size * info.itemsize, output_file, append,
+                                            header, mask, patentFilter.get(), &countRows);
+        }
+        return dfResult(countPat, countRows, with_rows);
+    }, py::arg("data"), py::arg("output_file"), py::arg("append"), py::arg("header"), py::arg("fields") = py::none(),
+    py::arg("filter") = py::none(), py::arg("with_rows") = false, R"pbdoc(
+    Variant reading USPTO (1976-2001) TXT data from a bytes-like object (e.g. ``bytes`` or ``mmap.mmap``) 
+    instead of a file; other arguments and return value as below.
+    )pbdoc");
+
+    m.def("txt_to_df", [](std::string input_file, std::string output_file, bool append, bool header,
+                          py::object fields, py::object filter, bool with_rows) {
+        unsigned mask = fieldMask(fields);
+        FilterArg patentFilter(filter);
+        int countPat, countRows;
+        {
+            py::gil_scoped_release release;
+            countPat = txt_to_df_cpp(input_file, output_file, append, header, mask, patentFilter.get(), &countRows);
+        }
+        return dfResult(countPat, countRows, with_rows);
+    }, py::arg("input_file"), py::arg("output_file"), py::arg("append"), py::arg("header"),
+    py::arg("fields") = py::none(), py::arg("filter") = py::none(), py::arg("with_rows") = false, R"pbdoc(
     Function that takes USPTO (1976-2001) data from txt file, extracts pertinent fields, 
     and creates (or appends to) CSV output.
 
@@ -20,11 +173,140 @@ PYBIND11_MODULE(convert_funcs, m) {
         output_file: `string`, path of '.csv' file to store data
         append:  `bool`, open and writes to output_file in append mode if ``true``
         header: `bool`, prints header as first line to csv output_file if ``true``
+        fields: iterable of `string`, columns (of ``utility.FIELDS``) to extract and write, all if ``None``
+        filter: ``utility.PatentFilter`` (or `dict` of its arguments) patents have to pass to be written, all are if ``None``
+        with_rows: `bool`, also return the number of rows written if ``true``
+    
+    Returns:
+        `int` -- number of patents read from TXT file (including those filtered out); with `with_rows`, 
+        a `tuple` of it and the number of rows written
+    )pbdoc");
+
+    m.def("txt_to_records", [](py::buffer data, py::object fields, py::object filter) {
+        unsigned mask = fieldMask(fields);
+        FilterArg patentFilter(filter);
+        py::buffer_info info = data.request();
+        std::vector<TxtPatent> patents;
+        {
+            py::gil_scoped_release release;
+            patents = txt_buffer_to_records_cpp((const char *) info.ptr, info.size * info.itemsize, mask,
+                                                patentFilter.get());
+        }
+        py::list records;
+        for (const TxtPatent &patent : patents)
+            records.append(toRecord(patent, mask));
+        return records;
+    }, py::arg("data"), py::arg("fields") = py::none(), py::arg("filter") = py::none(), R"pbdoc(
+    Function that takes USPTO (1976-2001) TXT data from a bytes-like object (e.g. ``bytes`` or 
+    ``mmap.mmap``) and extracts pertinent fields, without touching the filesystem.
+
+    Args: 
+        data:  bytes-like object holding the contents of a '.txt' file
+        fields: iterable of `string`, columns (of ``utility.FIELDS``) to extract, all if ``None``
+        filter: ``utility.PatentFilter`` (or `dict` of its arguments) patents have to pass to be returned, all are if ``None``
     
     Returns:
-        `int` -- number of patents read from TXT file
+        `list` -- one `tuple` per patent with the requested fields in ``utility.FIELDS`` order; Inventor, 
+        Assignee, ICL_Class and References are lists. Same rows as written by ``txt_to_df()``.
     )pbdoc");
 
+    m.def("xml1_to_df", [](std::string input_file, std::string output_file, bool append, bool header,
+                           py::object fields, py::object filter, bool with_rows) {
+        unsigned mask = fieldMask(fields);
+        FilterArg patentFilter(filter);
+        // documents with broken markup are converted by lxml, taking the GIL back for each; the function
+        // only refers to objects of this call, so copies of it never touch Python reference counts
+        py::object rowOf = py::module_::import("patentpy.convert_xml1").attr("_xml1_row");
+        py::list names;
+        for (int i = 0; i < N_FIELDS; i++)
+            if (mask & (1u << i)) names.append(FIELD_NAMES[i]);
+        Xml1Fallback fallback = [&rowOf, &names, &patentFilter](const std::string &doc, std::string &row) {
+            py::gil_scoped_acquire acquire;
+            row = rowOf(py::bytes(doc), names, patentFilter.checked).cast<std::string>();
+            return !row.empty();
+        };
+        int countPat, countRows;
+        {
+            py::gil_scoped_release release;
+            countPat = xml1_to_df_cpp(input_file, output_file, append, header, mask, patentFilter.get(), &countRows,
+                                      fallback);
+        }
+        return dfResult(countPat, countRows, with_rows);
+    }, py::arg("input_file"), py::arg("output_file"), py::arg("append"), py::arg("header"),
+    py::arg("fields") = py::none(), py::arg("filter") = py::none(), py::arg("with_rows") = false, R"pbdoc(
+    Function that takes USPTO (2002-2004) data from XML file, extracts pertinent fields, 
+    and creates (or appends to) CSV output. Output is identical to ``patentpy.convert_xml1.xml1_to_df()``: 
+    documents with broken markup (mismatched, garbled or unclosed tags) are converted with lxml as well.
+
+    Args: 
+        input_file:  `string`, path of '.xml' file to read data from
+        output_file: `string`, path of '.csv' file to store data
+        append:  `bool`, open and writes to output_file in append mode if ``true``
+        header: `bool`, prints header as first line to csv output_file if ``true``
+        fields: iterable of `string`, columns (of ``utility.FIELDS``) to extract and write, all if ``None``
+        filter: ``utility.PatentFilter`` (or `dict` of its arguments) patents have to pass to be written, all are if ``None``
+        with_rows: `bool`, also return the number of rows written if ``true``
+    
+    Returns:
+        `int` -- number of patents read from XML file (including those filtered out); with `with_rows`, 
+        a `tuple` of it and the number of rows written
+    )pbdoc");
+
+    py::class_<CsvWriter>(m, "CsvWriter", R"pbdoc(
+    Buffered CSV writer shared by all converters. Fields are quoted and quotes inside them doubled 
+    (RFC 4180, rows end with ``\n``), so any text is written as is and read back unchanged, e.g. by 
+    ``pandas.read_csv()``; output is written in blocks of 1 MiB. Closes the file when used as a context 
+    manager.
+
+    Args: 
+        output_file: `string`, path of '.csv' file to store data
+        append:  `bool`, open and writes to output_file in append mode if ``true``
+        header: `bool`, prints header of `fields` as first line to csv output_file if ``true``
+        fields: iterable of `string`, columns (of ``utility.FIELDS``) of the header, all if ``None``
+    )pbdoc")
+        .def(py::init([](std::string output_file, bool append, bool header, py::object fields) {
+            unsigned mask = fieldMask(fields);
+            auto writer = new CsvWriter(output_file, append, header, mask);
+            if (!writer->isOpen())
+            {
+                delete writer;
+                PyErr_SetFromErrnoWithFilename(PyExc_OSError, output_file.c_str());
+                throw py::error_already_set();
+            }
+            return writer;
+        }), py::arg("output_file"), py::arg("append"), py::arg("header") = false, py::arg("fields") = py::none())
+        .def("write_rows", [](CsvWriter &writer, py::iterable records) {
+            if (!writer.isOpen()) throw py::value_error("I/O operation on closed file");
+            std::string value;
+            int countRows = 0;
+            for (py::handle record : records)
+            {
+                for (py::handle item : record)
+                {
+                    value.clear();
+                    appendValue(value, item);
+                    writer.field(value);
+                }
+                writer.endRow();
+                countRows++;
+            }
+            return countRows;
+        }, py::arg("records"), R"pbdoc(
+        Writes a batch of records as CSV rows.
+
+        Args: 
+            records: iterable of `tuple`, one per row; values are `string`, ``None`` (empty) or lists of 
+                `string` (joined by ``;``)
+
+        Returns:
+            `int` -- number of rows written
+        )pbdoc")
+        .def("flush", &CsvWriter::flush, "Writes buffered rows to the file.")
+        .def("close", &CsvWriter::close, "Writes buffered rows and closes the file.")
+        .def_property_readonly("rows", &CsvWriter::rows, "Number of rows written so far (not counting the header).")
+        .def("__enter__", [](CsvWriter &writer) -> CsvWriter & { return writer; }, py::return_value_policy::reference)
+        .def("__exit__", [](CsvWriter &writer, py::args) { writer.close(); });
+
 #ifdef VERSION_INFO
     m.attr("__version__") = MACRO_STRINGIFY(VERSION_INFO);
 #else
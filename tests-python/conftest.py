@@ -0,0 +1,142 @@
+import pytest, zipfile
+from patentpy.cache import ArchiveCache
+from patentpy.utility import get_file_name
+
+### SYNTHETIC USPTO DATA ###
+# small hand-written weeks in each format, so converters can be tested without the USPTO site
+
+def make_txt(n_patents, seed = 0):
+    lines = ["HHHHHT APS1"]
+    for i in range(n_patents):
+        lines += ["PATN", "WKU  0{:07d}{}".format(3930000 + 100 * seed + i, i % 10), "SRC  5",
+                  "APD  1974{:02d}{:02d}".format(1 + i % 12, 1 + i % 28), "TTL  Widget \"number\" {}".format(i),
+                  "ISD  19760106", "INVT", "NAM  Smith; John", "CTY  Town", "INVT", "NAM  Doe; Jane",
+                  "ASSG", "NAM  Acme Corp", "CLAS", "OCL  123", "ICL  A01B 1300", "ICL  H04L 1228",
+                  "UREF", "PNO  3858241", "ISD  19741200", "UREF", "PNO  D23,456",
+                  "ABST", "PAL  abstract text",
+                  "CLMS", "STM  What is claimed is:", "NUM  1.", "PAL  1. A widget, comprising",
+                  "     a part.", "NUM  2.", "PA1  2. The widget of claim 1."]
+    return ("\n".join(lines) + "\n").encode("latin-1")
+
+XML1_DOC = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE PATDOC SYSTEM "ST32-US-Grant-025xml.dtd" [
+<!ENTITY US{wku}-20020101-D00000.TIF SYSTEM "US{wku}-20020101-D00000.TIF" NDATA TIF>
+]>
+<PATDOC DTD="2.5" STATUS="Build 20011001">
+<SDOBI>
+<B100>
+<B110><DNUM><PDAT>{wku}</PDAT></DNUM></B110>
+<B140><DATE><PDAT>20020101</PDAT></DATE></B140>
+</B100>
+<B200><B220><DATE><PDAT>200003{day:02d}</PDAT></DATE></B220></B200>
+<B500><B510><B511><PDAT>A01K 8000</PDAT></B511></B510>
+<B540><STEXT><PDAT>Fishing &amp; lure &lsquo;{i}&rsquo;</PDAT></STEXT></B540>
+<B560><B561><PCIT><DOC><DNUM><PDAT>4085532</PDAT></DNUM></DOC></PCIT></B561>
+<B561><PCIT><DOC><DNUM><PDAT>2211111</PDAT></DNUM><CTRY><PDAT>GB</PDAT></CTRY></DOC></PCIT></B561></B560></B500>
+<B700><B720><B721><PARTY-US><NAM><FNM><PDAT>Joe</PDAT></FNM><SNM><STEXT><PDAT>Angler</PDAT></STEXT></SNM></NAM></PARTY-US></B721></B720>
+<B730><B731><PARTY-US><NAM><ONM><STEXT><PDAT>Lure Co.</PDAT></STEXT></ONM></NAM></PARTY-US></B731></B730>
+</B700>
+</SDOBI>
+<SDOCL><H><STEXT><PDAT>What is claimed is:</PDAT></STEXT></H>
+<CL><CLM ID="CLM-00001"><PARA ID="P-00001" LVL="0"><PTEXT><PDAT>1. A "lure" comprising a hook.</PDAT></PTEXT></PARA></CLM>
+<CLM ID="CLM-00002"><PARA ID="P-00002" LVL="0"><PTEXT><PDAT>2. The lure of </PDAT><CLREF ID="CLM-00001"><PDAT>claim 1</PDAT></CLREF></PTEXT></PARA></CLM></CL></SDOCL>
+</PATDOC>
+"""
+
+def make_xml1(n_patents, seed = 0):
+    docs = [XML1_DOC.format(wku = "{:08d}".format(6334220 + 100 * seed + i), day = 1 + i % 28, i = i)
+            for i in range(n_patents)]
+    return "".join(docs).encode("utf-8")
+
+XML2_DOC = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE us-patent-grant SYSTEM "us-patent-grant-v41-2005-08-25.dtd" [ ]>
+<us-patent-grant lang="EN" dtd-version="v4.1 2005-08-25" file="US{wku}-20050104.XML" status="PRODUCTION" id="us-patent-grant" country="US">
+<us-bibliographic-data-grant>
+<publication-reference>
+<document-id>
+<country>US</country>
+<doc-number>{wku}</doc-number>
+<kind>B2</kind>
+<date>20050104</date>
+</document-id>
+</publication-reference>
+<application-reference appl-type="utility">
+<document-id>
+<country>US</country>
+<doc-number>10704422</doc-number>
+<date>200311{day:02d}</date>
+</document-id>
+</application-reference>
+<classification-ipcr><section>H</section><class>04</class><subclass>L</subclass><main-group>12</main-group><subgroup>28</subgroup></classification-ipcr>
+<invention-title id="d0e53">Network &#x201c;thing&#x201d; {i} &amp; co</invention-title>
+<references-cited>
+<citation><patcit num="00001"><document-id><country>US</country><doc-number>4999999</doc-number></document-id></patcit></citation>
+<citation><patcit num="00002"><document-id><country>JP</country><doc-number>2000-1</doc-number></document-id></patcit></citation>
+<citation><nplcit num="00003"><othercit>Some paper</othercit></nplcit></citation>
+</references-cited>
+<parties>
+<applicants>
+<applicant sequence="001" app-type="applicant-inventor"><addressbook><last-name>Smith</last-name><first-name>Ann</first-name></addressbook></applicant>
+<applicant sequence="002" app-type="applicant-inventor"><addressbook><last-name>Jones</last-name><first-name>Bob</first-name></addressbook></applicant>
+</applicants>
+</parties>
+<assignees><assignee><addressbook><orgname>Net Corp</orgname><role>02</role></addressbook></assignee></assignees>
+</us-bibliographic-data-grant>
+<claims id="claims">
+<claim id="CLM-00001" num="00001"><claim-text>1. A "device" comprising:<claim-text>a part; and</claim-text></claim-text></claim>
+<claim id="CLM-00002" num="00002"><claim-text>2. The device of <claim-ref idref="CLM-00001">claim 1</claim-ref>, wherein it works.</claim-text></claim>
+</claims>
+</us-patent-grant>
+"""
+
+def make_xml2(n_patents, seed = 0):
+    docs = [XML2_DOC.format(wku = "{:08d}".format(6981282 + 100 * seed + i) if i % 5 else "D05{:05d}".format(100 * seed + i),
+                            day = 1 + i % 28, i = i)
+            for i in range(n_patents)]
+    return "".join(docs).encode("utf-8")
+
+def make_week(year, week, n_patents = 5):
+    """Returns (file name, contents) of a synthetic week in the format USPTO used that year."""
+    file_name = get_file_name(year, week)
+    make = make_txt if year < 2002 else make_xml1 if year < 2005 else make_xml2
+    return file_name, make(n_patents, seed = week)
+
+def write_mirror(root, dates, n_patents = 5):
+    """Writes zipped synthetic weeks in the USPTO directory layout (`<year>/<file>.zip`) under `root`."""
+    for year, week in dates:
+        file_name, data = make_week(year, week, n_patents)
+        (root / str(year)).mkdir(parents = True, exist_ok = True)
+        with zipfile.ZipFile(str(root / str(year) / (file_name[:-4] + ".zip")), 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr(file_name, data)
+    return root
+
+# one week in each format: TXT, XML1 and XML2
+DATES = [(1976, 1), (2002, 1), (2005, 1)]
+
+@pytest.fixture
+def mirror(tmp_path):
+    """Local mirror of the USPTO site with the weeks of ``DATES``."""
+    return write_mirror(tmp_path / "mirror", DATES)
+
+@pytest.fixture
+def cache(tmp_path, mirror):
+    """``ArchiveCache`` fetching from the ``mirror`` fixture."""
+    return ArchiveCache(str(tmp_path / "cache"), base_url = mirror.as_uri())
+
+@pytest.fixture
+def xml1_file(tmp_path):
+    path = tmp_path / "pg020101.xml"
+    path.write_bytes(make_xml1(5))
+    return path
+
+@pytest.fixture
+def xml2_file(tmp_path):
+    path = tmp_path / "ipg050104.xml"
+    path.write_bytes(make_xml2(5))
+    return path
+
+@pytest.fixture
+def txt_file(tmp_path):
+    path = tmp_path / "pftaps19760106_wk01.txt"
+    path.write_bytes(make_txt(5))
+    return path
@@ -0,0 +1,54 @@
+import pytest, pandas
+from patentpy.acquire import convert_to_df
+from patentpy.cache import ArchiveCache
+from patentpy.utility import get_file_name
+from conftest import DATES
+
+def make_cache(tmp_path, mirror, **kwargs):
+    return ArchiveCache(str(tmp_path / "cache"), base_url = mirror.as_uri(), **kwargs)
+
+### TEST_ARCHIVE_CACHE ###
+# test convert_to_df through cache -- zips kept, same output with stream and parallel workers
+def test_cache_convert_to_df(tmp_path, mirror, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = make_cache(tmp_path, mirror)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    convert_to_df(dates_df, "serial.csv", cache = cache)
+    convert_to_df(dates_df, "stream.csv", cache = cache, stream = True, workers = 2)
+    assert (tmp_path / "serial.csv").read_bytes() == (tmp_path / "stream.csv").read_bytes()
+    assert pandas.read_csv("serial.csv").shape == (15, 9)
+    assert sorted(p.name for p in (tmp_path / "cache").glob("*.zip")) == \
+        sorted(get_file_name(y, w)[:-4] + ".zip" for y, w in DATES)
+
+# test offline cache -- serves cached zips, FileNotFoundError for others
+def test_cache_offline(tmp_path, mirror):
+    make_cache(tmp_path, mirror).fetch(2005, get_file_name(2005, 1))
+    offline = make_cache(tmp_path, mirror, offline = True)
+    assert offline.fetch(2005, get_file_name(2005, 1)).endswith("ipg050104.zip")
+    with pytest.raises(FileNotFoundError, match= r"offline"):
+        offline.fetch(2002, get_file_name(2002, 1))
+
+# test corrupted zip is downloaded again
+def test_cache_checksum(tmp_path, mirror):
+    cache = make_cache(tmp_path, mirror)
+    zip_path = cache.fetch(2005, get_file_name(2005, 1))
+    original = open(zip_path, 'rb').read()
+    with open(zip_path, 'r+b') as f:
+        f.write(b'corrupt')
+    assert open(cache.fetch(2005, get_file_name(2005, 1)), 'rb').read() == original
+
+# test LRU eviction -- least recently used zip is removed once over `max_size`
+def test_cache_eviction(tmp_path, mirror):
+    cache = make_cache(tmp_path, mirror)
+    first = cache.fetch(1976, get_file_name(1976, 1))
+    second = cache.fetch(2002, get_file_name(2002, 1))
+    cache.max_size = cache.size()
+    cache.fetch(1976, get_file_name(1976, 1))           # now more recently used than `second`
+    cache.fetch(2005, get_file_name(2005, 1))
+    assert (tmp_path / "cache" / "pg020101.zip").exists() is False
+    assert (tmp_path / "cache" / "ipg050104.zip").exists()
+
+# test ValueError -- bad `max_size`
+def test_cache_bad_max_size(tmp_path):
+    with pytest.raises(ValueError, match= r"max_size"):
+        ArchiveCache(str(tmp_path), max_size = -1)
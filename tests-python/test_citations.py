@@ -0,0 +1,61 @@
+import pytest, numpy
+from patentpy.store import sync
+from patentpy.citations import CitationGraph, build_citation_graph, encode_wkus, decode_wkus
+from conftest import DATES
+
+TXT_WKUS = ["039301000", "039301011", "039301022", "039301033", "039301044"]
+
+@pytest.fixture
+def store(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for year, week in DATES:
+        sync(str(tmp_path / "store"), (year, week), (year, week), cache = cache, citation_graph = True)
+    return tmp_path / "store"
+
+### TEST_ENCODE ###
+# test encoding -- check digits and leading zeros dropped, prefixes kept, other values -1
+def test_encode_wkus():
+    codes = encode_wkus(["039301000", "3930100", "03930100", "D23456", "D0023456", "RE028467", "2000-1", ""])
+    assert list(codes[:3]) == [3930100] * 3
+    assert codes[3] == codes[4] != codes[0]
+    assert list(codes[6:]) == [-1, -1]
+    assert decode_wkus(codes[[0, 3, 5]]) == ["03930100", "D0023456", "RE028467"]
+
+### TEST_CITATION_GRAPH ###
+# test graph -- citations of all eras in both directions, counts and k-hop neighbourhoods
+def test_citation_graph(store):
+    graph = CitationGraph(str(store))
+    assert len(graph.nodes) == 15 + 4
+    assert list(graph.citation_counts(["3858241", "D23456", "04085532", "4999999", "missing"])) == [5, 5, 5, 5, 0]
+    assert list(graph.citation_counts(TXT_WKUS[:1] + ["06334320"], direction = "backward")) == [2, 1]
+    assert graph.citation_counts().sum() == graph.citation_counts(direction = "backward").sum() == 20
+    for direction in ["forward", "backward"]:
+        assert numpy.all(numpy.diff(graph.indptr[direction]) >= 0) and graph.indptr[direction][-1] == 20
+
+    assert graph.neighborhood(["039301000"], direction = "backward") == ["03858241", "D0023456"]
+    assert graph.neighborhood(["3858241"]) == decode_wkus(encode_wkus(TXT_WKUS))
+    assert graph.neighborhood(["3858241"], k = 2, direction = "forward") == decode_wkus(encode_wkus(TXT_WKUS))
+    assert graph.neighborhood(["3858241"], k = 0) == []
+
+# test week-by-week updates -- a new week citing stored patents extends the graph, unchanged weeks are kept
+def test_citation_graph_update(store):
+    edges = sorted(store.glob("*/*.cites.npy"))
+    mtimes = [p.stat().st_mtime_ns for p in edges]
+    (store / "2010").mkdir()
+    (store / "2010" / "ipg100105.csv").write_text("WKU,References\n07654321,\"06334320;039301000\"\n"
+                                                  "07654322,\"07654321;;JP2000\"\n07654322,07654321\n")
+    assert build_citation_graph(str(store)) == 20 + 3
+    assert [p.stat().st_mtime_ns for p in edges] == mtimes
+
+    graph = CitationGraph(str(store))
+    xml1_wkus = ["0633432{}".format(i) for i in range(5)]
+    assert graph.neighborhood(["4085532"], k = 1) == xml1_wkus
+    assert graph.neighborhood(["4085532"], k = 3) == xml1_wkus + ["07654321", "07654322"]
+    assert graph.neighborhood(["07654322"], k = 2, direction = "backward") == ["03930100", "06334320", "07654321"]
+    assert list(graph.citation_counts(["06334320", "039301000"])) == [1, 1]
+
+# test ValueError -- bad hops and direction
+@pytest.mark.parametrize("kwargs", [{"k": -1}, {"k": 1.5}, {"direction": "both"}])
+def test_citation_graph_bad_args(store, kwargs):
+    with pytest.raises(ValueError, match= r"`k`|`direction`"):
+        CitationGraph(str(store)).neighborhood(["3858241"], **kwargs)
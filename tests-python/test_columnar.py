@@ -0,0 +1,93 @@
+import pytest, pandas
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq
+from datetime import date
+from patentpy.acquire import convert_to_df
+from conftest import DATES
+
+### TEST_COLUMNAR_OUTPUT ###
+# test parquet output -- one row group per week, typed columns, same values as csv output
+def test_parquet_output(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    convert_to_df(dates_df, "out.csv", cache = cache)
+    assert convert_to_df(dates_df, "out.parquet", cache = cache, output_format = "parquet", workers = 2)
+    parquet = pq.ParquetFile("out.parquet")
+    assert parquet.metadata.num_row_groups == 3
+    assert parquet.schema_arrow.field("Issue_Date").type == pa.date32()
+    assert parquet.schema_arrow.field("References").type == pa.list_(pa.string())
+
+    df = pandas.read_csv("out.csv", dtype = str, keep_default_na = False)
+    table = pq.read_table("out.parquet", columns = ["WKU", "Inventor", "Issue_Date"])
+    assert table.column("WKU").to_pylist() == list(df["WKU"])
+    assert [";".join(x) for x in table.column("Inventor").to_pylist()] == list(df["Inventor"])
+    assert table.column("Issue_Date")[0].as_py() == date(1976, 1, 6)
+
+# test arrow output -- same table as parquet file
+def test_arrow_output(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    table = convert_to_df(dates_df, cache = cache, output_format = "arrow", stream = True)
+    convert_to_df(dates_df, "out.parquet", cache = cache, output_format = "parquet")
+    assert table.num_rows == 15
+    assert table.equals(pq.read_table("out.parquet"))
+
+# test projection end to end -- all eras, csv (serial and pool) and arrow hold only the requested columns
+def test_fields_output(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    full = convert_to_df(dates_df, cache = cache)
+    some = convert_to_df(dates_df, cache = cache, fields = ["References", "WKU"], workers = 2)
+    assert some.astype(str).equals(full[["WKU", "References"]].astype(str))
+    table = convert_to_df(dates_df, cache = cache, output_format = "arrow", fields = ["Issue_Date"])
+    assert table.schema.names == ["Issue_Date"]
+    assert table.num_rows == 15
+    with pytest.raises(ValueError, match= r"fields"):
+        convert_to_df(dates_df, cache = cache, fields = ["Abstract"])
+
+# test filter end to end -- csv (serial and pool) and arrow keep the same patents; no match gives no rows
+def test_filter_output(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    full = convert_to_df(dates_df, cache = cache)
+    some = convert_to_df(dates_df, cache = cache, filter = dict(issue_date_range = (date(2002, 1, 1), None)), workers = 2)
+    assert some.astype(str).equals(full.iloc[5:].reset_index(drop = True).astype(str))
+    table = convert_to_df(dates_df, cache = cache, output_format = "arrow", filter = dict(icl_prefix = "H04L"))
+    assert table.num_rows == 10
+    assert sorted({day.year for day in table.column("Issue_Date").to_pylist()}) == [1976, 2005]
+    assert convert_to_df(dates_df, cache = cache, filter = dict(assignee_regex = "nobody")).shape == (0, 9)
+
+# test ValueError -- bad output format / file combinations
+@pytest.mark.parametrize("output_file, output_format", [("out.csv", "parquet"), (None, "parquet"),
+                                                        ("out.parquet", "arrow"), ("out.csv", "json")])
+def test_columnar_bad_args(output_file, output_format):
+    dates_df = pandas.DataFrame(data = [[1991, 1]], columns = ['year', 'week'])
+    with pytest.raises(ValueError, match= r"output_f"):
+        convert_to_df(dates_df, output_file, output_format = output_format)
+
+### TEST_COMPACT_DF ###
+# test in-memory DataFrame -- compact dtypes, same values as csv round trip, no temporary csv, smaller
+def test_compact_df(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    full = convert_to_df(dates_df, cache = cache)
+    compact = convert_to_df(dates_df, cache = cache, dtype_backend = "pyarrow", workers = 2)
+    assert not list(tmp_path.glob("*.csv"))
+    assert str(compact.Issue_Date.dtype) == "datetime64[s]" and compact.Issue_Date[0] == pandas.Timestamp("1976-01-06")
+    assert isinstance(compact.ICL_Class.dtype, pandas.CategoricalDtype)
+    assert isinstance(compact.Assignee.dtype, pandas.CategoricalDtype)
+    assert compact.Title.dtype == pandas.StringDtype("pyarrow")
+
+    for name in ["Title", "Inventor", "Assignee", "ICL_Class", "References", "Claims"]:
+        assert list(compact[name].astype(object).fillna("")) == list(full[name].astype(object).fillna(""))
+    assert list(compact.App_Date.dt.strftime("%Y%m%d")) == [str(day) for day in full.App_Date]
+    # object columns, as read from csv before pandas 3
+    assert full.astype(object).memory_usage(deep = True).sum() >= 3 * compact.memory_usage(deep = True).sum()
+
+# test ValueError -- unknown backend, or one given w/o a DataFrame result
+@pytest.mark.parametrize("output_file, output_format, dtype_backend", [(None, "csv", "numpy"), ("out.csv", "csv", "pyarrow"),
+                                                                       (None, "arrow", "pyarrow")])
+def test_compact_df_bad_args(output_file, output_format, dtype_backend):
+    dates_df = pandas.DataFrame(data = [[1991, 1]], columns = ['year', 'week'])
+    with pytest.raises(ValueError, match= r"dtype_backend"):
+        convert_to_df(dates_df, output_file, output_format = output_format, dtype_backend = dtype_backend)
@@ -0,0 +1,282 @@
+import re, pytest, zipfile, csv, pandas
+from io import BytesIO
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from convert_funcs import txt_to_df, txt_to_records, CsvWriter
+from patentpy.convert_txt import iter_txt_records
+from patentpy.convert_xml1 import xml1_to_df
+from lxml import etree
+from patentpy.convert_xml2 import xml2_to_df, iter_xml2_records, split_documents, extractFields2
+from patentpy.utility import open_zip_member, check_filter, PatentFilter, format_csv_row
+from conftest import make_txt, make_xml1, make_xml2
+
+def zip_bytes(path):
+    data = BytesIO()
+    with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.write(str(path), path.name)
+    data.seek(0)
+    return data
+
+### TEST_STREAMING ###
+# test xml1/xml2 converters read from zip stream give same csv as from extracted file
+@pytest.mark.parametrize("converter, sample", [(xml1_to_df, "xml1_file"), (xml2_to_df, "xml2_file")])
+def test_convert_from_zip_stream(converter, sample, request, tmp_path):
+    input_file = request.getfixturevalue(sample)
+    count_file = converter(str(input_file), str(tmp_path / "file.csv"), False, True)
+    with open_zip_member(input_file.name, zip_bytes(input_file)) as f:
+        count_stream = converter(f, str(tmp_path / "stream.csv"), False, True)
+    assert count_file == count_stream == 5
+    assert (tmp_path / "file.csv").read_bytes() == (tmp_path / "stream.csv").read_bytes()
+
+# test FileNotFoundError -- member missing from zip
+def test_open_zip_member_missing(xml2_file):
+    with pytest.raises(FileNotFoundError, match= r"Unable to find"):
+        open_zip_member("ipg990101.xml", zip_bytes(xml2_file))
+
+### TEST_TXT_BUFFER ###
+# test TXT from bytes / zip stream gives same csv and records as from extracted file, also on several threads
+def test_txt_buffer(txt_file, tmp_path):
+    data = txt_file.read_bytes()
+    assert txt_to_df(str(txt_file), str(tmp_path / "file.csv"), False, True) == 5
+    with ThreadPoolExecutor(2) as executor:
+        counts = executor.map(lambda i: txt_to_df(data, str(tmp_path / "buffer{}.csv".format(i)), False, True), range(2))
+    assert list(counts) == [5, 5]
+    assert (tmp_path / "file.csv").read_bytes() == (tmp_path / "buffer0.csv").read_bytes() == (tmp_path / "buffer1.csv").read_bytes()
+
+    with open(str(tmp_path / "file.csv"), newline = '') as f:
+        rows = list(csv.reader(f))[1:]
+    records = txt_to_records(data)
+    assert [[";".join(v) if isinstance(v, list) else v for v in record] for record in records] == rows
+    assert records[0][4] == ["John Smith", "Jane Doe"]
+    assert txt_to_df(data, str(tmp_path / "rows.csv"), False, True, with_rows = True) == (5, 5)
+    with open_zip_member(txt_file.name, zip_bytes(txt_file)) as f:
+        assert list(iter_txt_records(f)) == list(iter_txt_records(str(txt_file))) == records
+
+# test TXT records parsed in chunks -- same records whatever the chunk size, chunks never split a patent
+@pytest.mark.parametrize("chunk_size", [1, 100, 1000])
+def test_iter_txt_records_chunks(chunk_size):
+    data = make_txt(30)
+    assert list(iter_txt_records(BytesIO(data), chunk_size = chunk_size)) == txt_to_records(data)
+    assert list(iter_txt_records(BytesIO(b""), chunk_size = chunk_size)) == []
+
+### TEST_CSV_WRITER ###
+# test native writer -- batches of tuples written w/ quotes doubled, read back unchanged; append w/o header
+def test_csv_writer(tmp_path):
+    records = [("1", 'say "hi", then\nleave', ["a", "b"], None), ("2", "\u201cq\u201d \r\n", [], '"')]
+    with CsvWriter(str(tmp_path / "out.csv"), False, True, ["WKU", "Title", "Inventor", "Claims"]) as writer:
+        assert writer.write_rows(records[:1]) == 1
+        assert writer.write_rows(iter(records[1:])) == 1
+    writer = CsvWriter(str(tmp_path / "out.csv"), True)
+    assert writer.write_rows([("3", "", ["c"], "x")] * 1000) == 1000
+    writer.close()
+    with pytest.raises(ValueError, match= r"closed"):
+        writer.write_rows(records)
+
+    assert (tmp_path / "out.csv").read_bytes().startswith(b'WKU,Title,Inventor,Claims\n"1","say ""hi"", then\nleave","a;b",""\n')
+    with open(str(tmp_path / "out.csv"), newline = '', encoding = 'utf-8') as f:
+        rows = list(csv.reader(f))
+    assert rows[1:3] == [["1", 'say "hi", then\nleave', "a;b", ""], ["2", "\u201cq\u201d \r\n", "", '"']]
+    df = pandas.read_csv(str(tmp_path / "out.csv"), dtype = str, keep_default_na = False, engine = "c")
+    assert len(df) == 1002 and df.Title[0] == 'say "hi", then\nleave'
+
+# test FileNotFoundError -- missing output directory
+def test_csv_writer_bad_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        CsvWriter(str(tmp_path / "missing" / "out.csv"), False)
+
+# test format_csv_row -- same row as the native writer, None written as an empty field
+def test_format_csv_row(tmp_path):
+    record = ("1", None, 'a "b"', ["x", "y"], [])
+    with CsvWriter(str(tmp_path / "out.csv"), False) as writer:
+        writer.write_rows([record])
+    assert format_csv_row(record) == (tmp_path / "out.csv").read_text() == '"1","","a ""b""","x;y",""\n'
+
+# test quotes, commas and line breaks in titles and claims are kept by every engine and read back by pandas' C parser
+@pytest.mark.parametrize("converter, make, replace", [
+    (txt_to_df, make_txt, (b'TTL  Widget "number" 0', b'TTL  Widget "number" 0, \'one\'')),
+    (partial(xml1_to_df, engine = "native"), make_xml1, (b"a hook.", b'a "hook", and\nmore.')),
+    (partial(xml1_to_df, engine = "python"), make_xml1, (b"a hook.", b'a "hook", and\nmore.')),
+    (xml2_to_df, make_xml2, (b"comprising:", b'comprising "a, b":'))])
+def test_csv_escaping(converter, make, replace, tmp_path):
+    (tmp_path / "in").write_bytes(make(2).replace(*replace, 1))
+    assert converter(str(tmp_path / "in"), str(tmp_path / "out.csv"), False, True) == 2
+    df = pandas.read_csv(str(tmp_path / "out.csv"), dtype = str, engine = "c")
+    text = replace[1].decode().split("  ", 1)[-1]
+    assert len(df) == 2 and text in (df.Title[0] if make is make_txt else df.Claims[0])
+
+### TEST_XML1_ENGINES ###
+# test native engine gives same csv as lxml engine, also for entities after an undefined one, bad bytes, 
+# comments, CDATA and CRLF line ends
+@pytest.mark.parametrize("replace", [(b"", b""), (b"&amp; lure &lsquo;", b"&lsquo; lure &amp; \xff\xe2\x82 &#x201c;"),
+                                     (b"a hook.", b"a\r\nhook<!-- c -->more"), (b"claim 1", b"<![CDATA[c<]]> &undef c")])
+def test_xml1_engines_match(replace, tmp_path):
+    (tmp_path / "in.xml").write_bytes(make_xml1(3).replace(*replace))
+    count_native = xml1_to_df(str(tmp_path / "in.xml"), str(tmp_path / "native.csv"), False, True, engine = "native")
+    count_python = xml1_to_df(str(tmp_path / "in.xml"), str(tmp_path / "python.csv"), False, True, engine = "python")
+    assert count_native == count_python == 3
+    assert (tmp_path / "native.csv").read_bytes() == (tmp_path / "python.csv").read_bytes()
+    # rows written are reported by every engine
+    assert xml1_to_df(str(tmp_path / "in.xml"), str(tmp_path / "native.csv"), False, True, engine = "native",
+                      with_rows = True) == (3, 3)
+    assert xml1_to_df(str(tmp_path / "in.xml"), str(tmp_path / "python.csv"), False, True, engine = "python",
+                      with_rows = True) == (3, 3)
+
+# test native engine gives same csv, counts and rows as lxml engine on broken markup -- garbled and unclosed tags,
+# mismatched end tags, a missing </PATDOC>, a bad element name, an attribute w/o quotes and a citation w/o number
+@pytest.mark.parametrize("replace", [(b"<FNM><PDAT>Joe</PDAT></FNM>", b"<FNM><PDAT>Joe</FNM</PDAT>>"),
+                                     (b"<B540>", b"<X><B540>"), (b"</STEXT></B540>", b"</B540>"),
+                                     (b"</PATDOC>\n<?xml", b"\n<?xml"), (b"<B220>", b"< B220>"),
+                                     (b'<CLM ID="CLM-00001">', b"<CLM ID=CLM-00001>"),
+                                     (b"<DNUM><PDAT>4085532</PDAT></DNUM>", b"")])
+@pytest.mark.parametrize("fields, filter", [(None, None), (["WKU", "Inventor", "Claims"], {"assignee_regex": "Lure"})])
+def test_xml1_engines_match_malformed(replace, fields, filter, tmp_path):
+    (tmp_path / "in.xml").write_bytes(make_xml1(3).replace(*replace, 1))
+    results = [xml1_to_df(str(tmp_path / "in.xml"), str(tmp_path / "{}.csv".format(engine)), False, True,
+                          engine = engine, fields = fields, filter = filter, with_rows = True)
+               for engine in ["native", "python"]]
+    assert results[0] == results[1]
+    assert (tmp_path / "native.csv").read_bytes() == (tmp_path / "python.csv").read_bytes()
+
+# test empty elements -- written as "" (not "None") by every engine
+def test_empty_elements(tmp_path):
+    data = re.sub(rb"(<B540><STEXT><PDAT>)[^<]*", rb"\1", make_xml1(2))
+    (tmp_path / "in.xml").write_bytes(data.replace(b"<PDAT>Joe</PDAT>", b"<PDAT></PDAT>")
+                                      .replace(b"<PDAT>A01K 8000</PDAT>", b"<PDAT/>"))
+    for engine in ["native", "python"]:
+        xml1_to_df(str(tmp_path / "in.xml"), str(tmp_path / "{}.csv".format(engine)), False, True, engine = engine)
+    assert (tmp_path / "native.csv").read_bytes() == (tmp_path / "python.csv").read_bytes()
+    df = pandas.read_csv(str(tmp_path / "native.csv"), dtype = str, keep_default_na = False)
+    assert list(df.Title) == ["", ""] and list(df.Inventor) == [" Angler"] * 2 and list(df.ICL_Class) == ["", ""]
+
+    data = re.sub(rb"(<invention-title[^>]*>)[^<]*", rb"\1", make_xml2(2))
+    (tmp_path / "in2.xml").write_bytes(data.replace(b"<first-name>Ann</first-name>", b"<first-name></first-name>"))
+    xml2_to_df(str(tmp_path / "in2.xml"), str(tmp_path / "xml2.csv"), False, True)
+    df = pandas.read_csv(str(tmp_path / "xml2.csv"), dtype = str, keep_default_na = False)
+    assert list(df.Title) == ["", ""] and list(df.Inventor) == [" Smith;Bob Jones"] * 2
+    assert [record[1] for record in iter_xml2_records(str(tmp_path / "in2.xml"))] == ["", ""]
+
+# test ValueError -- unknown engine
+def test_xml1_bad_engine(xml1_file, tmp_path):
+    with pytest.raises(ValueError, match= r"engine"):
+        xml1_to_df(str(xml1_file), str(tmp_path / "out.csv"), False, True, engine = "sax")
+
+### TEST_XML2_ENGINES ###
+# test split engine gives same csv as line-by-line feed engine
+def test_xml2_engines_match(xml2_file, tmp_path):
+    count_feed = xml2_to_df(str(xml2_file), str(tmp_path / "feed.csv"), False, True, engine = "feed")
+    count_split = xml2_to_df(str(xml2_file), str(tmp_path / "split.csv"), False, True, engine = "split")
+    assert count_feed == count_split == 5
+    assert (tmp_path / "feed.csv").read_bytes() == (tmp_path / "split.csv").read_bytes()
+
+# test documents are split correctly when markers straddle read blocks
+def test_split_documents_small_chunks():
+    data = make_xml2(3)
+    documents = list(split_documents(BytesIO(data), chunk_size = 7))
+    assert len(documents) == 3
+    assert b"".join(documents) == data
+    assert all(d.startswith(b'<?xml version="1.0"') for d in documents)
+
+# test ValueError -- unknown engine
+def test_xml2_bad_engine(xml2_file, tmp_path):
+    with pytest.raises(ValueError, match= r"engine"):
+        xml2_to_df(str(xml2_file), str(tmp_path / "out.csv"), False, True, engine = "sax")
+
+### TEST_EXTRACT_FIELDS2 ###
+# test all nine fields of a v2 patent, including claim-ref text and non-US citations
+def test_extract_fields2():
+    parsed = etree.fromstring(make_xml2(2).split(b'<?xml version="1.0"')[2].split(b"]>\n", 1)[1])
+    assert extractFields2(parsed) == ('"06981283","Network \u201cthing\u201d 1 & co","20031102","20050104",'
+                                      '"Ann Smith;Bob Jones","Net Corp","H04L 1228","4999999",'
+                                      '"1. A ""device"" comprising:a part; and2. The device of claim 1, wherein it works."\n')
+
+# test patent without bibliographic data is skipped
+def test_extract_fields2_skip():
+    assert extractFields2(etree.fromstring(b"<sequence-cwu><p>acgt</p></sequence-cwu>")) == ""
+
+### TEST_FIELDS ###
+# test projection -- every engine writes the requested columns in FIELDS order, same values as the full output
+@pytest.mark.parametrize("converter, sample", [(txt_to_df, "txt_file"), (partial(xml1_to_df, engine = "native"), "xml1_file"),
+                                               (partial(xml1_to_df, engine = "python"), "xml1_file"),
+                                               (xml2_to_df, "xml2_file")])
+def test_fields(converter, sample, request, tmp_path):
+    input_file = str(request.getfixturevalue(sample))
+    assert converter(input_file, str(tmp_path / "all.csv"), False, True) == 5
+    assert converter(input_file, str(tmp_path / "some.csv"), False, True, fields = ["Claims", "WKU", "Inventor"]) == 5
+    full, some = pandas.read_csv(str(tmp_path / "all.csv"), dtype = str), pandas.read_csv(str(tmp_path / "some.csv"), dtype = str)
+    assert list(some.columns) == ["WKU", "Inventor", "Claims"]
+    assert some.equals(full[["WKU", "Inventor", "Claims"]])
+
+# test projected records -- TXT and XML2 generators
+def test_fields_records(txt_file, xml2_file):
+    assert [record[:1] + record[4:5] for record in iter_txt_records(str(txt_file))] == list(iter_txt_records(str(txt_file), ["WKU", "Inventor"]))
+    assert [record[3:4] for record in iter_xml2_records(str(xml2_file))] == list(iter_xml2_records(str(xml2_file), fields = ["Issue_Date"]))
+
+# test ValueError -- unknown or no fields
+@pytest.mark.parametrize("fields", [["WKU", "Abstract"], []])
+def test_bad_fields(fields, txt_file, xml2_file, tmp_path):
+    with pytest.raises(ValueError, match= r"fields"):
+        txt_to_df(str(txt_file), str(tmp_path / "out.csv"), False, True, fields)
+    with pytest.raises(ValueError, match= r"fields"):
+        xml2_to_df(str(xml2_file), str(tmp_path / "out.csv"), False, True, fields = fields)
+
+### TEST_FILTER ###
+# first patent of each sample gets another assignee, ICL class and a later issue date
+FILTER_SAMPLES = {
+    "txt": (make_txt, [(b"NAM  Acme Corp", b"NAM  Beta Inc"), (b"ICL  A01B 1300", b"ICL  G06F 1700"),
+                       (b"ISD  19760106", b"ISD  19760113")], "19760113"),
+    "xml1": (make_xml1, [(b"Lure Co.", b"Beta Inc"), (b"A01K 8000", b"G06F 1700"),
+                         (b"<PDAT>20020101</PDAT></DATE></B140>", b"<PDAT>20020108</PDAT></DATE></B140>")], "20020108"),
+    "xml2": (make_xml2, [(b"Net Corp", b"Beta Inc"), (b"<section>H</section><class>04</class><subclass>L",
+                                                      b"<section>G</section><class>06</class><subclass>F"),
+                         (b"<date>20050104</date>", b"<date>20050111</date>")], "20050111"),
+}
+
+# test filter pushdown -- every engine writes the same rows as filtering the full output, filtered fields need not be written
+@pytest.mark.parametrize("converter, sample", [(txt_to_df, "txt"), (partial(xml1_to_df, engine = "native"), "xml1"),
+                                               (partial(xml1_to_df, engine = "python"), "xml1"), (xml2_to_df, "xml2")])
+def test_filter(converter, sample, tmp_path):
+    make, replacements, later = FILTER_SAMPLES[sample]
+    data = make(5)
+    for old, new in replacements:
+        data = data.replace(old, new, 1)
+    (tmp_path / "in").write_bytes(data)
+    converter(str(tmp_path / "in"), str(tmp_path / "all.csv"), False, True)
+    full = pandas.read_csv(str(tmp_path / "all.csv"), dtype = str)
+
+    for patent_filter, kept in [(dict(icl_prefix = ["X99", "G 06F"]), [0]), (dict(assignee_regex = "(?i)beta"), [0]),
+                                (PatentFilter(issue_date_range = (later, None)), [0]),
+                                (dict(issue_date_range = (None, str(int(later) - 1))), [1, 2, 3, 4]),
+                                (dict(icl_prefix = "G06F", assignee_regex = "^(Acme|Lure|Net)"), [])]:
+        assert converter(str(tmp_path / "in"), str(tmp_path / "some.csv"), False, True, filter = patent_filter) == 5
+        some = pandas.read_csv(str(tmp_path / "some.csv"), dtype = str)
+        assert some.equals(full.iloc[kept].reset_index(drop = True))
+
+    converter(str(tmp_path / "in"), str(tmp_path / "wku.csv"), False, True, fields = ["WKU"],
+              filter = check_filter(dict(assignee_regex = "Beta")))
+    assert list(pandas.read_csv(str(tmp_path / "wku.csv"), dtype = str).WKU) == [full.WKU[0]]
+
+# test assignee regex filter in concurrent native converters -- the regex is shared safely, same rows as a serial run
+@pytest.mark.parametrize("converter, make", [(txt_to_df, make_txt), (partial(xml1_to_df, engine = "native"), make_xml1)])
+def test_filter_threads(converter, make, tmp_path):
+    (tmp_path / "in").write_bytes(make(200))
+    patent_filter = dict(assignee_regex = "(?i)acme|lure")
+    converter(str(tmp_path / "in"), str(tmp_path / "serial.csv"), False, True, filter = patent_filter)
+    with ThreadPoolExecutor(4) as executor:
+        counts = list(executor.map(lambda i: converter(str(tmp_path / "in"), str(tmp_path / "run{}.csv".format(i)),
+                                                       False, True, filter = patent_filter), range(8)))
+    assert counts == [200] * 8
+    for i in range(8):
+        assert (tmp_path / "run{}.csv".format(i)).read_bytes() == (tmp_path / "serial.csv").read_bytes()
+    assert len(pandas.read_csv(str(tmp_path / "serial.csv"))) == 200
+
+# test ValueError -- unknown keys or bad conditions
+@pytest.mark.parametrize("patent_filter", [dict(cpc_prefix = "H04L"), dict(icl_prefix = ""), dict(assignee_regex = "("),
+                                           dict(issue_date_range = ("2005-01-04", None)), "H04L"])
+def test_bad_filter(patent_filter, xml2_file, txt_file, tmp_path):
+    with pytest.raises(ValueError, match= r"filter"):
+        xml2_to_df(str(xml2_file), str(tmp_path / "out.csv"), False, True, filter = patent_filter)
+    # native functions check filters alike
+    with pytest.raises(ValueError, match= r"filter"):
+        txt_to_df(str(txt_file), str(tmp_path / "out.csv"), False, True, filter = patent_filter)
+    with pytest.raises(ValueError, match= r"filter"):
+        txt_to_records(txt_file.read_bytes(), filter = patent_filter)
@@ -0,0 +1,58 @@
+import pytest, pandas, sqlite3
+from patentpy.acquire import convert_to_df
+from patentpy.database import SQLiteOutput, _positions
+from conftest import DATES
+
+def read_tables(db):
+    with sqlite3.connect(db) as connection:
+        return {name: pandas.read_sql("SELECT * FROM {} ORDER BY rowid".format(name) if name == "patents" else
+                                      "SELECT * FROM {} ORDER BY WKU, Position".format(name), connection)
+                for name in ["patents", "inventors", "assignees", "classifications", "citations"]}
+
+### TEST_SQLITE ###
+# test sqlite output -- same rows as the normalized tables, WAL mode and indexes; loading a week again changes nothing
+def test_sqlite(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    tables = convert_to_df(dates_df, cache = cache, output_format = "tables")
+    assert convert_to_df(dates_df, "out.db", cache = cache, output_format = "sqlite", workers = 2)
+    loaded = read_tables("out.db")
+    assert loaded["patents"].equals(tables["patents"])
+    for name in ["inventors", "citations"]:
+        expected = tables[name].sort_values("WKU", kind = "stable").reset_index(drop = True)
+        assert loaded[name].drop(columns = "Position").equals(expected)
+    assert list(loaded["inventors"].Position[:2]) == [0, 1]
+
+    with sqlite3.connect("out.db") as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"patents_issue_date", "classifications_icl_class", "citations_citation"} <= indexes
+        connection.execute("UPDATE patents SET Title = 'changed'")
+        connection.execute("INSERT INTO citations VALUES (?, 99, 'stale')", (tables["patents"].WKU[0],))
+
+    # upsert -- re-loaded week replaces its rows, other weeks are kept
+    assert convert_to_df(dates_df[:1], "out.db", cache = cache, output_format = "sqlite")
+    reloaded = read_tables("out.db")
+    assert list(reloaded["patents"].Title[:5]) == list(tables["patents"].Title[:5])
+    assert list(reloaded["patents"].Title[5:]) == ["changed"] * 10
+    assert reloaded["citations"].equals(loaded["citations"])
+
+# test positions -- values numbered per patent, also if a patent's rows are not consecutive
+def test_positions():
+    rows = [("1", "a"), ("1", "b"), ("2", "c"), ("1", "d")]
+    assert list(_positions(rows)) == [("1", 0, "a"), ("1", 1, "b"), ("2", 0, "c"), ("1", 2, "d")]
+
+# test ValueError -- existing database of another `fields` selection; same selection can be added to
+@pytest.mark.parametrize("fields", [["WKU", "Title"], ["WKU", "Title", "Inventor", "Assignee"], None])
+def test_sqlite_other_fields(tmp_path, fields):
+    SQLiteOutput(str(tmp_path / "out.db"), ["WKU", "Title", "Inventor"]).close()
+    SQLiteOutput(str(tmp_path / "out.db"), ["Title", "Inventor"]).close()
+    with pytest.raises(ValueError, match= r"fields"):
+        SQLiteOutput(str(tmp_path / "out.db"), fields)
+
+# test ValueError -- sqlite output needs a database file
+@pytest.mark.parametrize("output_file", [None, "out.csv"])
+def test_sqlite_bad_output(output_file):
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    with pytest.raises(ValueError, match= r"SQLite"):
+        convert_to_df(dates_df, output_file, output_format = "sqlite")
@@ -0,0 +1,153 @@
+import time, threading, pytest, pandas
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from functools import partial
+from urllib.error import HTTPError
+from patentpy.acquire import convert_to_df
+from patentpy.cache import ArchiveCache
+from patentpy.downloader import Downloader
+from patentpy.utility import get_file_name, get_url
+from conftest import DATES
+
+
+class MirrorHandler(SimpleHTTPRequestHandler):
+    """Serves the mirror with keep-alive and single `Range` requests; `server.faults` holds
+    responses to give instead of the next requests ("cut" sends half the body, "shifted" answers a
+    `Range` request with the file from its start, or a status code)."""
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("Range")))
+        fault = self.server.faults.pop(0) if self.server.faults else None
+        if isinstance(fault, int):
+            self.send_error(fault)
+            return
+        try:
+            data = open(self.translate_path(self.path), 'rb').read()
+        except OSError:
+            self.send_error(404)
+            return
+        ranged = bool(self.headers.get("Range"))
+        start = int(self.headers["Range"][6:-1]) if ranged and fault != "shifted" else 0
+        self.send_response(206 if ranged else 200)
+        if ranged:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(data) - 1, len(data)))
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        if fault == "cut":
+            self.wfile.write(data[start:start + (len(data) - start) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server(mirror):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(MirrorHandler, directory = str(mirror)))
+    httpd.connections, httpd.requests, httpd.faults = 0, [], []
+    httpd.mirror = mirror
+    httpd.url = "http://127.0.0.1:{}/".format(httpd.server_address[1])
+    thread = threading.Thread(target = httpd.serve_forever, daemon = True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def zip_url(server, year, week):
+    return server.url + "{}/{}.zip".format(year, get_file_name(year, week)[:-4])
+
+def zip_bytes(server, year, week):
+    return (server.mirror / str(year) / (get_file_name(year, week)[:-4] + ".zip")).read_bytes()
+
+### TEST_DOWNLOADER ###
+# test keep-alive -- several files over one connection, to disk and into memory
+def test_downloader_keep_alive(tmp_path, server):
+    with Downloader(max_connections = 1) as downloader:
+        for year, week in DATES:
+            dest_file = str(tmp_path / "{}.zip".format(year))
+            assert downloader.download(zip_url(server, year, week), dest_file) == dest_file
+            assert open(dest_file, 'rb').read() == zip_bytes(server, year, week)
+        assert downloader.fetch(zip_url(server, 2005, 1)).read() == zip_bytes(server, 2005, 1)
+    assert server.connections == 1
+    assert len(server.requests) == 4
+
+# test retry -- truncated transfer resumed with a Range request, 5xx retried
+def test_downloader_resume(server):
+    size = len(zip_bytes(server, 2005, 1))
+    server.faults = ["cut", 503]
+    data = Downloader(backoff = 0).fetch(zip_url(server, 2005, 1))
+    assert data.read() == zip_bytes(server, 2005, 1)
+    assert [r for _, r in server.requests] == [None, "bytes={}-".format(size // 2), "bytes={}-".format(size // 2)]
+
+# test misaligned resume -- a partial response starting at another byte than requested restarts the download
+def test_downloader_shifted_range(server):
+    size = len(zip_bytes(server, 2005, 1))
+    server.faults = ["cut", "shifted"]
+    data = Downloader(backoff = 0).fetch(zip_url(server, 2005, 1))
+    assert data.read() == zip_bytes(server, 2005, 1)
+    assert [r for _, r in server.requests] == [None, "bytes={}-".format(size // 2), None]
+
+# test closing while a thread drops its connection -- connections are only removed once
+def test_downloader_close_race(server):
+    downloader = Downloader()
+    downloader.fetch(zip_url(server, 2005, 1))
+    downloader.close()
+    downloader._drop_connection(zip_url(server, 2005, 1))
+    assert downloader._connections == []
+
+# test HTTPError -- 4xx is not retried, 5xx only `retries` times; no partial file left behind
+def test_downloader_errors(tmp_path, server):
+    downloader = Downloader(retries = 2, backoff = 0)
+    with pytest.raises(HTTPError, match= r"404"):
+        downloader.download(server.url + "1976/missing.zip", str(tmp_path / "missing.zip"))
+    assert len(server.requests) == 1
+    server.faults = [500] * 3
+    with pytest.raises(HTTPError, match= r"500"):
+        downloader.download(zip_url(server, 2005, 1), str(tmp_path / "failed.zip"))
+    assert len(server.requests) == 4
+    assert list(tmp_path.glob("*.part")) == []
+    downloader.close()
+
+# test bandwidth limit -- transfer takes at least size / `max_rate` seconds
+def test_downloader_max_rate(server):
+    size = len(zip_bytes(server, 2005, 1))
+    with Downloader(max_rate = size * 4) as downloader:
+        start = time.monotonic()
+        downloader.fetch(zip_url(server, 2005, 1))
+        downloader.fetch(zip_url(server, 2005, 1))
+        assert time.monotonic() - start >= 0.4
+
+# test convert_to_df prefetching through a cache and a test server -- same output as a plain run
+def test_downloader_prefetch(tmp_path, server, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    convert_to_df(dates_df, "plain.csv", cache = ArchiveCache(str(tmp_path / "plain"), base_url = server.mirror.as_uri()))
+    cache = ArchiveCache(str(tmp_path / "cache"), base_url = server.url)
+    with Downloader(max_connections = 2) as downloader:
+        convert_to_df(dates_df, "prefetch.csv", cache = cache, prefetch = 2, downloader = downloader)
+    assert (tmp_path / "plain.csv").read_bytes() == (tmp_path / "prefetch.csv").read_bytes()
+    assert len(server.requests) == 3
+    convert_to_df(dates_df, "stream.csv", cache = cache, stream = True, prefetch = 1)
+    assert (tmp_path / "plain.csv").read_bytes() == (tmp_path / "stream.csv").read_bytes()
+    # without cache, each week is prefetched into its own temporary zip file
+    monkeypatch.setattr("patentpy.acquire.get_url", partial(get_url, base_url = server.url))
+    convert_to_df(dates_df, "temp.csv", prefetch = 2)
+    assert (tmp_path / "plain.csv").read_bytes() == (tmp_path / "temp.csv").read_bytes()
+    assert [p.name for p in tmp_path.glob("temp-*")] == []
+
+# test ValueError -- bad `prefetch`, prefetching with several workers, bad downloader settings
+def test_downloader_bad_args():
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    with pytest.raises(ValueError, match= r"prefetch"):
+        convert_to_df(dates_df, prefetch = -1)
+    with pytest.raises(ValueError, match= r"workers"):
+        convert_to_df(dates_df, workers = 2, prefetch = 1)
+    with pytest.raises(ValueError, match= r"max_connections"):
+        Downloader(max_connections = 0)
+    with pytest.raises(ValueError, match= r"max_rate"):
+        Downloader(max_rate = 0)
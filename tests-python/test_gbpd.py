@@ -1,8 +1,9 @@
 import pytest, pandas
 from os import remove
 from datetime import date
-from patentpy.utility import get_date_tues
-from patentpy.acquire import get_bulk_patent_data, convert_to_df
+from patentpy.utility import get_date_tues, get_file_name, get_url, plan_weeks
+from patentpy.acquire import get_bulk_patent_data, convert_to_df, iter_bulk_patent_data
+from conftest import DATES
 
 ### TEST_GET_BULK_PATENT_DATA ###
 # test generic; should return true and create/append to csv file.
@@ -14,6 +15,21 @@ def test_get_bulk_patent_data():
     remove("test.csv")
     assert (df_from_csv.equals(df), df.iloc[9521, 0], df.iloc[0, 0]) == (True, '06839901', 'D04357132')
 
+# test parallel run -- should match serial run byte for byte
+def test_gbpd_workers():
+    get_bulk_patent_data([2001, 2003, 2005], [1, 1, 1], "test_serial.csv")
+    get_bulk_patent_data([2001, 2003, 2005], [1, 1, 1], "test_workers.csv", workers = 3)
+    with open("test_serial.csv", "rb") as f1, open("test_workers.csv", "rb") as f2:
+        serial, parallel = f1.read(), f2.read()
+    remove("test_serial.csv")
+    remove("test_workers.csv")
+    assert serial == parallel
+
+# test ValueError -- `workers` not a positive integer
+def test_gbpd_bad_workers():
+    with pytest.raises(ValueError, match= r"workers"):
+        get_bulk_patent_data(1991, 1, "test.csv", workers = 0)
+
 # test Exception -- no uspto bulk data able to be converted
 def test_gbpd_no_data_returned():
     with pytest.raises(Exception, match= r"NO PATENTS FOUND"):
@@ -64,6 +80,39 @@ def test_gdt_no_53rd_wk():
         get_date_tues(2020, 53)
 
 
+### TEST_PLAN_WEEKS ###
+# test plan -- same dates, file names and urls as get_date_tues, get_file_name and get_url; unpublished weeks missing
+def test_plan_weeks():
+    plan = plan_weeks([1976, 1991, 2005, 2002, 2020, 2050], [1, 6, 1, 53, 53, 1])
+    for row in plan[:4].itertuples():
+        assert row.issue_date.date() == get_date_tues(row.year, row.week)
+        assert row.file_name == get_file_name(row.year, row.week)
+        assert row.url == get_url(row.year, row.file_name)
+    assert plan.file_name[1] == "pftaps19910205_wk06.txt" and plan.file_name[3] == "pg021231.xml"
+    assert plan.file_name[4:].isna().all() and plan.url[4:].isna().all() and plan.issue_date[4:].isna().all()
+
+# test issue date range -- every published Tuesday in the range, from 1976 on; plans are memoized and copied
+def test_plan_weeks_dates():
+    plan = plan_weeks(start_date = "2004-12-22", end_date = date(2005, 1, 18))
+    assert list(zip(plan.year, plan.week)) == [(2004, 52), (2005, 1), (2005, 2), (2005, 3)]
+    assert plan_weeks(start_date = "19700101", end_date = "19760113").file_name.tolist() == \
+        ["pftaps19760106_wk01.txt", "pftaps19760113_wk02.txt"]
+    assert len(plan_weeks(start_date = date(1976, 1, 1), end_date = date(2000, 12, 31))) == \
+        (date(2000, 12, 26) - date(1976, 1, 6)).days // 7 + 1
+    plan.loc[0, "file_name"] = "changed"
+    assert plan_weeks(start_date = "2004-12-22", end_date = date(2005, 1, 18)).file_name[0] == "pg041228.xml"
+
+# test ValueError -- unequal lengths, bad or mixed dates, start after end
+def test_plan_weeks_bad_args():
+    with pytest.raises(ValueError, match= r"equal lengths"):
+        plan_weeks([2005, 2006], [1])
+    with pytest.raises(ValueError, match= r"start_date"):
+        plan_weeks(start_date = "2005-13-01")
+    with pytest.raises(ValueError, match= r"combined"):
+        plan_weeks(2005, 1, start_date = "20050101")
+    with pytest.raises(ValueError, match= r"after"):
+        get_bulk_patent_data(start_date = "20050201", end_date = "20050101")
+
 ### TEST_CONVERT_TO_DF ###
 # TO DO: test download zip, getting url, etc separately
 def test_ctd():
@@ -86,3 +135,31 @@ def test_ctd_not_CSV():
     test_df = pandas.DataFrame(data=[[1991,1]], columns=['year', 'week'])
     with pytest.raises(ValueError, match= r".*.csv.*"):
         convert_to_df(test_df, "test.txt")
+
+### TEST_ITER_BULK_PATENT_DATA ###
+# test batches -- same rows as convert_to_df, at most `batch_size` rows each, not spanning weeks
+def test_iter_bulk_patent_data(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    convert_to_df(pandas.DataFrame(data = DATES, columns = ['year', 'week']), "out.csv", cache = cache)
+    batches = list(iter_bulk_patent_data([y for y, w in DATES], [w for y, w in DATES], batch_size = 2, cache = cache))
+    assert [len(batch) for batch in batches] == [2, 2, 1] * 3
+    expected = pandas.read_csv("out.csv", dtype = str, keep_default_na = False)
+    assert pandas.concat(batches, ignore_index = True).equals(expected)
+
+# test records -- one tuple per patent with list fields
+def test_iter_bulk_patent_data_records(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    records = list(iter_bulk_patent_data(2005, 1, batch_size = None, cache = cache))
+    assert len(records) == 5
+    assert records[1][4] == ["Ann Smith", "Bob Jones"]
+
+# test issue date range -- weeks planned from start_date to end_date; week not in the mirror skipped
+def test_iter_bulk_patent_data_dates(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    records = list(iter_bulk_patent_data(start_date = "2004-12-28", end_date = "20050110", batch_size = None, cache = cache))
+    assert [record[3] for record in records] == ["20050104"] * 5
+
+# test ValueError -- bad `batch_size`
+def test_iter_bulk_patent_data_bad_batch_size():
+    with pytest.raises(ValueError, match= r"batch_size"):
+        iter_bulk_patent_data(2005, 1, batch_size = 0)
@@ -0,0 +1,68 @@
+import os, pytest, pandas
+from patentpy.store import sync
+from patentpy.search import TextIndex, search, build_text_index, tokenize
+from conftest import DATES
+
+@pytest.fixture
+def store(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for year, week in DATES:
+        sync(str(tmp_path / "store"), (year, week), (year, week), cache = cache, text_index = True)
+    return tmp_path / "store"
+
+def read_weeks(store):
+    return pandas.concat([pandas.read_csv(week_file, dtype = str) for week_file in sorted(store.glob("*/*.csv"))],
+                         ignore_index = True)
+
+def contains(text, phrase):
+    # whether `phrase` occurs as consecutive terms of `text`
+    return " {} ".format(" ".join(tokenize(phrase))) in " {} ".format(" ".join(tokenize(text)))
+
+### TEST_SEARCH ###
+# test search -- same patents as matching the text of every row, in store order
+@pytest.mark.parametrize("query, phrases", [
+    ("widget", [["widget"]]),
+    ("LURE AND 3", [["lure", "3"]]),
+    ('"lure 2" OR network 4', [["lure 2"], ["network", "4"]]),
+    ('"2 lure"', [["2 lure"]]),
+    ("thing missing OR comprising-a-hook", [["thing", "missing"], ["comprising a hook"]]),
+])
+def test_search(store, query, phrases):
+    weeks = read_weeks(store)
+    text = weeks.Title + " " + weeks.Claims
+    expected = [wku for wku, row in zip(weeks.WKU, text) if any(all(contains(row, p) for p in group) for group in phrases)]
+    assert search(str(store), query) == expected
+
+# test year range and incremental updates -- only weeks of the range searched; only changed weeks re-indexed
+def test_search_years(store):
+    assert search(str(store), '"lure 2"') == ["06334322"]
+    assert search(str(store), '"lure 2" OR "widget number 1"', year_range = (2002, 2005)) == ["06334322"]
+    assert len(search(str(store), "widget", year_range = (1976, 1976))) == 5
+
+    assert build_text_index(str(store)) == 0
+    week_file = store / "2002" / "pg020101.csv"
+    week_file.write_text(week_file.read_text().replace("lure 2", "reel 2"))
+    os.utime(week_file, (os.path.getmtime(week_file) + 10,) * 2)
+    assert build_text_index(str(store)) == 1
+    assert search(str(store), '"lure 2"') == []
+    assert search(str(store), '"reel 2"') == ["06334322"]
+
+# test store-wide index -- queries answered from the merged lexicon alone, rebuilt when week files are removed
+def test_text_index(store):
+    index = TextIndex(str(store))
+    expected = [search(str(store), query) for query in ["widget", '"lure 2"', "thing OR network"]]
+    for segment in store.glob("*/*.terms.npy"):
+        segment.unlink()
+    assert [index.search(query) for query in ["widget", '"lure 2"', "thing OR network"]] == expected
+    assert index.search("widget", year_range = (2002, 2002)) == search(str(store), "widget", year_range = (2002, 2004))
+
+    (store / "1976" / "pftaps19760106_wk01.csv").unlink()
+    assert build_text_index(str(store)) == 2
+    assert TextIndex(str(store)).search("widget", year_range = (1970, 1999)) == []
+    assert len(index.search("widget", year_range = (1970, 1999))) == 5
+
+# test ValueError -- empty query, bad year range
+@pytest.mark.parametrize("query, year_range", [("", None), ("OR ,", None), ("widget", (2005, 2002)), ("widget", 2005)])
+def test_search_bad_args(store, query, year_range):
+    with pytest.raises(ValueError, match= r"query|year_range"):
+        search(str(store), query, year_range)
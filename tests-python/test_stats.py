@@ -0,0 +1,68 @@
+import json, pytest, pandas
+from patentpy.acquire import convert_to_df
+from patentpy.stats import ConvertStats, STAGES, count_csv_rows
+from conftest import DATES
+
+### TEST_STATS ###
+# test stats -- one entry per week with stage timings, sizes and patent counts; missing week skipped
+@pytest.mark.parametrize("workers", [1, 2])
+def test_stats(tmp_path, cache, monkeypatch, workers):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES + [(2005, 2)], columns = ['year', 'week'])
+    result, stats = convert_to_df(dates_df, "out.csv", cache = cache, workers = workers, stats = True)
+    assert result is True and stats.elapsed > 0
+
+    weeks = {(w.year, w.week): w for w in stats.weeks}
+    assert [weeks[date].status for date in DATES] == ["ok"] * 3
+    assert weeks[(2005, 2)].status == "skipped" and weeks[(2005, 2)].patents is None
+    for (year, week) in DATES:
+        week_stats = weeks[(year, week)]
+        assert (week_stats.patents, week_stats.skipped) == (5, 0)
+        assert week_stats.bytes_in == (tmp_path / "cache" / (week_stats.file[:-4] + ".zip")).stat().st_size
+        assert set(week_stats.timings) == set(STAGES) and week_stats.timings["parse"] > 0
+        assert week_stats.peak_memory > 0
+    header = len(open("out.csv").readline())
+    assert stats.totals()["bytes_out"] == (tmp_path / "out.csv").stat().st_size - header
+    assert stats.totals()["patents"] == 15 and stats.totals()["skipped"] == 0
+    assert stats.totals()["weeks_skipped"] == 1
+
+# test row counting -- quoted line breaks are not row ends, also when quotes straddle chunks
+def test_count_csv_rows(tmp_path):
+    (tmp_path / "out.csv").write_bytes(b'WKU,Title\n"1","a\nb"\n"2","c ""d""\n\ne"\n"3",""\n')
+    assert [count_csv_rows(str(tmp_path / "out.csv"), 0, chunk_size) for chunk_size in [1, 3, 7, 1 << 20]] == [4] * 4
+    assert count_csv_rows(str(tmp_path / "out.csv"), len(b'WKU,Title\n')) == 3
+
+# test skipped patents -- filtered out patents counted, unknown for TXT weeks converted to records
+@pytest.mark.parametrize("output_format, skipped", [("csv", [0, 5, 0]), ("arrow", [None, 5, 0]), ("tables", [None, 5, 0])])
+def test_stats_skipped(tmp_path, cache, monkeypatch, output_format, skipped):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    _, stats = convert_to_df(dates_df, cache = cache, output_format = output_format, filter = dict(icl_prefix = "H04L"),
+                             stats = True)
+    assert [w.skipped for w in stats.weeks] == skipped
+    assert [w.patents for w in stats.weeks] == [5, 0, 5]
+
+# test metrics output and hooks -- one JSON line per week as it is done, totals last; written bytes measured
+@pytest.mark.parametrize("output_format, output_file", [("parquet", "out.parquet"), ("sqlite", "out.db"), ("tables", "out")])
+def test_stats_metrics(tmp_path, cache, monkeypatch, output_format, output_file):
+    pytest.importorskip("pyarrow")
+    monkeypatch.chdir(tmp_path)
+    seen = []
+    stats = ConvertStats(metrics_file = "metrics.jsonl", hooks = [seen.append])
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    assert convert_to_df(dates_df, output_file, cache = cache, output_format = output_format, workers = 2,
+                         stats = stats) == (True, stats)
+    assert seen == stats.weeks and len(seen) == 3
+
+    lines = [json.loads(line) for line in open("metrics.jsonl")]
+    assert [line["event"] for line in lines] == ["week"] * 3 + ["run"]
+    assert [(line["year"], line["patents"]) for line in lines[:3]] == [(year, 5) for year, _ in DATES]
+    assert lines[3]["weeks_ok"] == 3 and lines[3]["elapsed_seconds"] == round(stats.elapsed, 6)
+    assert all(w.bytes_out > 0 and w.timings["write"] > 0 for w in stats.weeks)
+    assert stats.to_df().shape == (3, 14)
+
+# test ValueError -- stats of the wrong type
+def test_bad_stats():
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    with pytest.raises(ValueError, match= r"stats"):
+        convert_to_df(dates_df, stats = "yes")
@@ -0,0 +1,72 @@
+import datetime, pytest, pandas
+from patentpy.acquire import convert_to_df
+from patentpy.cache import ArchiveCache
+from patentpy.store import sync, get_patents, build_index
+from patentpy.utility import get_file_name
+from conftest import write_mirror
+
+DATES = [(2005, 1), (2005, 2), (2005, 3)]
+
+@pytest.fixture
+def mirror(tmp_path):
+    return write_mirror(tmp_path / "mirror", DATES[:1] + DATES[2:])
+
+def make_cache(tmp_path, mirror):
+    return ArchiveCache(str(tmp_path / "cache"), base_url = mirror.as_uri())
+
+### TEST_SYNC ###
+# test sync -- one file per week, same rows as convert_to_df; missing week failed, retried on next sync
+def test_sync(tmp_path, mirror, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = tmp_path / "store"
+    manifest = sync(str(store), datetime.date(2005, 1, 1), (2005, 3), cache = make_cache(tmp_path, mirror))
+    assert list(zip(manifest.year, manifest.week)) == DATES
+    assert list(manifest.status) == ["ok", "failed", "ok"]
+    assert list(manifest.patents) == [5, pandas.NA, 5]
+    assert manifest.checksum[0] == ArchiveCache._checksum(str(tmp_path / "cache" / "ipg050104.zip"))
+    convert_to_df(pandas.DataFrame(data = DATES[:1], columns = ['year', 'week']), "week.csv", cache = make_cache(tmp_path, mirror))
+    assert (store / "2005" / "ipg050104.csv").read_bytes() == (tmp_path / "week.csv").read_bytes()
+
+    # only the failed week is converted again
+    write_mirror(mirror, DATES[1:2])
+    (store / "2005" / "ipg050104.csv").write_text("unchanged")
+    manifest = sync(str(store), (2005, 1), datetime.date(2005, 1, 18), cache = make_cache(tmp_path, mirror))
+    assert list(manifest.status) == ["ok"] * 3
+    assert manifest.source_file[1] == get_file_name(2005, 2)
+    assert (store / "2005" / "ipg050104.csv").read_text() == "unchanged"
+    assert sorted(p.name for p in (store / "2005").glob("*.csv")) == ["ipg050104.csv", "ipg050111.csv", "ipg050118.csv"]
+
+# test errors -- `start` type and order
+def test_sync_bad_range(tmp_path):
+    with pytest.raises(TypeError, match= r"start"):
+        sync(str(tmp_path), "2005-01-04")
+    with pytest.raises(ValueError, match= r"after"):
+        sync(str(tmp_path), (2005, 3), (2005, 1))
+
+### TEST_GET_PATENTS ###
+# test lookups -- rows of all eras equal to the week files, in requested order, missing WKUs left out
+def test_get_patents(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dates = [(1976, 1), (2002, 1), (2005, 1)]
+    mirror = write_mirror(tmp_path / "mirror", dates)
+    store = str(tmp_path / "store")
+    for year, week in dates:
+        sync(store, (year, week), (year, week), cache = make_cache(tmp_path, mirror))
+    weeks = pandas.concat([pandas.read_csv(str(tmp_path / "store" / str(year) / (get_file_name(year, week)[:-4] + ".csv")),
+                                           dtype = {"WKU": str}) for year, week in dates], ignore_index = True)
+    assert weeks.shape == (15, 9)
+
+    wkus = list(weeks.WKU[[12, 0, 7]])
+    found = get_patents(store, wkus + ["missing"])
+    assert found.astype(str).equals(weeks.iloc[[12, 0, 7]].reset_index(drop = True).astype(str))
+    assert list(get_patents(store, wkus[0]).WKU) == wkus[:1]
+    assert get_patents(store, ["missing"]).shape == (0, 9)
+
+# test index is rebuilt for week files without one
+def test_build_index(tmp_path, mirror, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = tmp_path / "store"
+    sync(str(store), (2005, 1), (2005, 1), cache = make_cache(tmp_path, mirror))
+    (store / "2005" / "ipg050104.idx.npy").unlink()
+    assert build_index(str(store)) == 5
+    assert (store / "2005" / "ipg050104.idx.npy").exists()
@@ -0,0 +1,42 @@
+import pytest, pandas
+from patentpy.acquire import convert_to_df
+from patentpy.tables import table_columns, records_to_rows
+from conftest import DATES
+
+def split(df, column):
+    # (WKU, value) pairs of a `;`-joined column of the flat output
+    return [(wku, value) for wku, values in zip(df.WKU, df[column]) if isinstance(values, str) for value in values.split(";")]
+
+### TEST_TABLES ###
+# test normalized tables -- same patents and values as the flat csv output, in order; files appended per run
+def test_tables(tmp_path, cache, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    convert_to_df(dates_df, "flat.csv", cache = cache)
+    flat = pandas.read_csv(tmp_path / "flat.csv", dtype = str)
+    tables = convert_to_df(dates_df, cache = cache, output_format = "tables", workers = 2)
+    assert list(tables) == ["patents", "inventors", "assignees", "classifications", "citations"]
+    assert tables["patents"].equals(flat[["WKU", "Title", "App_Date", "Issue_Date", "Claims"]])
+    assert list(tables["citations"].columns) == ["WKU", "Citation"]
+    for name, column in [("inventors", "Inventor"), ("assignees", "Assignee"), ("classifications", "ICL_Class"),
+                         ("citations", "References")]:
+        assert list(tables[name].itertuples(index = False, name = None)) == split(flat, column)
+
+    assert convert_to_df(dates_df, "out", cache = cache, output_format = "tables", stream = True)
+    assert convert_to_df(dates_df[:1], "out", cache = cache, output_format = "tables")
+    for name, df in tables.items():
+        written = pandas.read_csv(tmp_path / "out" / (name + ".csv"), dtype = str, keep_default_na = False)
+        assert written.equals(pandas.concat([df, df[df.WKU.isin(flat.WKU[:5])]], ignore_index = True).fillna(""))
+
+# test projection -- only tables of requested fields, always keyed by WKU
+def test_tables_fields():
+    assert table_columns(["Claims", "References"]) == {"patents": ["WKU", "Claims"], "citations": ["WKU", "Citation"]}
+    rows = records_to_rows([("1", ["2", "3"], "c"), ("4", [], "d")], ["Claims", "References"])
+    assert rows == {"patents": [("1", "c"), ("4", "d")], "citations": [("1", "2"), ("1", "3")]}
+
+# test ValueError -- output_file is an existing file
+def test_tables_bad_output(tmp_path):
+    (tmp_path / "out").write_text("")
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    with pytest.raises(ValueError, match= r"directory"):
+        convert_to_df(dates_df, str(tmp_path / "out"), output_format = "tables")
@@ -0,0 +1,90 @@
+import os, pytest, pandas
+from concurrent.futures import ThreadPoolExecutor
+from patentpy.acquire import convert_to_df, iter_bulk_patent_data
+from patentpy.stats import ConvertStats
+from patentpy.workspace import Workspace
+from conftest import DATES
+
+### TEST_WORKSPACE ###
+# test workspace -- unique directory per run under root, removed on close
+def test_workspace(tmp_path):
+    with Workspace(str(tmp_path / "root")) as first, Workspace(str(tmp_path / "root")) as second:
+        assert first.dir != second.dir
+        assert os.path.dirname(first.path("week.zip")) == first.dir
+        open(first.path("week.zip"), 'w').close()
+    assert list((tmp_path / "root").iterdir()) == []
+
+# test staged output -- renamed when done, appended to an existing file, left untouched on errors
+def test_workspace_staged(tmp_path):
+    output = tmp_path / "out.csv"
+    with Workspace() as workspace:
+        with workspace.staged(str(output)) as temp_file:
+            open(temp_file, 'w').write("a\n")
+            assert not output.exists()
+        with workspace.staged(str(output), append = True) as temp_file:
+            open(temp_file, 'w').write("b\n")
+        with pytest.raises(RuntimeError):
+            with workspace.staged(str(output), append = True) as temp_file:
+                open(temp_file, 'w').write("c\n")
+                raise RuntimeError
+    assert output.read_text() == "a\nb\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.csv"]
+
+# test concurrent runs in one directory -- same output as a serial run, no temporary files left behind
+@pytest.mark.parametrize("stream", [False, True])
+def test_concurrent_runs(tmp_path, cache, monkeypatch, stream):
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    convert_to_df(dates_df, "serial.csv", cache = cache)
+    with ThreadPoolExecutor(4) as executor:
+        runs = [executor.submit(convert_to_df, dates_df, "run{}.csv".format(i), cache = cache, stream = stream,
+                                temp_dir = str(tmp_path / "work")) for i in range(4)]
+        frames = [executor.submit(convert_to_df, dates_df, cache = cache, temp_dir = str(tmp_path / "work"))
+                  for _ in range(2)]
+        assert all(run.result() for run in runs)
+        assert all(frame.result().shape == (15, 9) for frame in frames)
+    for i in range(4):
+        assert (tmp_path / "run{}.csv".format(i)).read_bytes() == (tmp_path / "serial.csv").read_bytes()
+    assert list((tmp_path / "work").iterdir()) == []
+    assert sorted(p.name for p in tmp_path.glob("*.*")) == ["run{}.csv".format(i) for i in range(4)] + ["serial.csv"]
+
+# test failed run -- no partial output published, workspace removed
+@pytest.mark.parametrize("output_file, output_format", [("out.csv", "csv"), ("out.parquet", "parquet")])
+def test_failed_run(tmp_path, cache, monkeypatch, output_file, output_format):
+    pytest.importorskip("pyarrow")
+    monkeypatch.chdir(tmp_path)
+    dates_df = pandas.DataFrame(data = DATES, columns = ['year', 'week'])
+    def fail(week_stats):
+        if week_stats.year == 2005:
+            raise RuntimeError("stop")
+    with pytest.raises(RuntimeError, match= r"stop"):
+        convert_to_df(dates_df, output_file, cache = cache, output_format = output_format,
+                      stats = ConvertStats(hooks = [fail]), temp_dir = str(tmp_path / "work"))
+    assert list(tmp_path.glob("out*")) == [] and list(tmp_path.glob(".out*")) == []
+    assert list((tmp_path / "work").iterdir()) == []
+
+# test generator -- workspace removed once the generator is closed
+def test_iter_workspace(tmp_path, cache):
+    batches = iter_bulk_patent_data(2002, 1, batch_size = 2, cache = cache, temp_dir = str(tmp_path / "work"))
+    assert len(next(batches)) == 2
+    assert len(list((tmp_path / "work").iterdir())) == 1
+    batches.close()
+    assert list((tmp_path / "work").iterdir()) == []
+
+# test ValueError -- temp_dir not a path
+def test_workspace_bad_args():
+    dates_df = pandas.DataFrame(data = [[1991, 1]], columns = ['year', 'week'])
+    with pytest.raises(ValueError, match= r"temp_dir"):
+        convert_to_df(dates_df, temp_dir = 1)
+
+# test the same week in several rows -- each row is extracted into its own directory, also by concurrent workers
+@pytest.mark.parametrize("output_format", ["csv", "tables"])
+def test_duplicate_weeks(tmp_path, cache, monkeypatch, output_format):
+    monkeypatch.chdir(tmp_path)
+    once = convert_to_df(pandas.DataFrame(data = [(2002, 1)], columns = ['year', 'week']), cache = cache,
+                         output_format = output_format)
+    dates_df = pandas.DataFrame(data = [(2002, 1)] * 4, columns = ['year', 'week'])
+    repeated = convert_to_df(dates_df, cache = cache, output_format = output_format, workers = 2)
+    if output_format == "tables":
+        once, repeated = once["patents"], repeated["patents"]
+    assert repeated.equals(pandas.concat([once] * 4, ignore_index = True))